@@ -1,20 +1,204 @@
+from django.conf import settings
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections, router
+from django.db.models import DecimalField, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.functional import cached_property
+from .currency import LINE_TOTALS
 from .models import (
     Supplier, ProductCategory, Product, 
     Purchase, PurchaseItem, PurchasePayment,
     Customer, Sale, SaleItem, SalePayment,
-    StockMovement, Invoice
+    StockMovement, Invoice, ExchangeRate, Tenant, Membership
 )
 
+AMOUNT = DecimalField(max_digits=14, decimal_places=2)
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Pagination des grandes tables : sans filtre, le nombre de lignes est lu dans
+    les statistiques de PostgreSQL (pg_class.reltuples) au lieu d'un COUNT(*) qui
+    parcourt toute la table. Les petites tables et les listes filtrées, dont
+    celles limitées à une boutique, sont comptées exactement.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        query = getattr(queryset, 'query', None)
+        if query is not None and not query.where and not query.distinct:
+            estimate = self._estimate(queryset.model)
+            if estimate is not None and estimate >= settings.ADMIN_COUNT_ESTIMATE_THRESHOLD:
+                return estimate
+        return super().count
+
+    def _estimate(self, model):
+        connection = connections[router.db_for_read(model)]
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                           [connection.ops.quote_name(model._meta.db_table)])
+            row = cursor.fetchone()
+        # -1 : table jamais analysée
+        return row[0] if row and row[0] >= 0 else None
+
+
+class TenantAdminMixin:
+    """
+    Les listes, formulaires et recherches sont limités à la boutique de
+    l'utilisateur par le gestionnaire des modèles (TenantMiddleware). Un
+    superutilisateur sans boutique voit toutes les boutiques, avec leur colonne
+    et leur filtre.
+    """
+
+    def get_list_display(self, request):
+        list_display = super().get_list_display(request)
+        if getattr(request, 'tenant_id', None) is None:
+            return (*list_display, 'tenant')
+        return list_display
+
+    def get_list_filter(self, request):
+        list_filter = super().get_list_filter(request)
+        if getattr(request, 'tenant_id', None) is None:
+            return ('tenant', *list_filter)
+        return list_filter
+
+    def get_list_select_related(self, request):
+        list_select_related = super().get_list_select_related(request)
+        if getattr(request, 'tenant_id', None) is None and isinstance(list_select_related, (list, tuple)):
+            return (*list_select_related, 'tenant')
+        return list_select_related
+
+
+class LargeTableAdmin(TenantAdminMixin, admin.ModelAdmin):
+    """Listes des tables volumineuses : nombre de lignes estimé, pas de second comptage du total"""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+def with_amounts(queryset, item_model, payment_model, document_field):
+    """
+    Annote les ventes ou achats de leur total, du montant payé et du solde, par
+    sous-requêtes (une jointure sur lignes et paiements multiplierait les sommes)
+    """
+    items = item_model.objects.filter(**{document_field: OuterRef('pk')}).order_by().values(document_field)\
+        .annotate(total=Sum(LINE_TOTALS[queryset.model.__name__])).values('total')
+    payments = payment_model.objects.filter(**{document_field: OuterRef('pk')}).order_by().values(document_field)\
+        .annotate(total=Sum('amount')).values('total')
+    zero = Value(0, output_field=AMOUNT)
+    return queryset.annotate(
+        annotated_total=Coalesce(Subquery(items, output_field=AMOUNT), zero),
+        annotated_paid=Coalesce(Subquery(payments, output_field=AMOUNT), zero),
+    ).annotate(annotated_balance=F('annotated_total') - F('annotated_paid'))
+
+
+class LowStockFilter(admin.SimpleListFilter):
+    title = "stock bas"
+    parameter_name = 'low_stock'
+
+    def lookups(self, request, model_admin):
+        return (('yes', "Oui"), ('no', "Non"))
+
+    def queryset(self, request, queryset):
+        if self.value() == 'yes':
+            return queryset.filter(stock_quantity__lte=F('min_stock_level'))
+        if self.value() == 'no':
+            return queryset.filter(stock_quantity__gt=F('min_stock_level'))
+        return queryset
+
+
+class OverdueFilter(admin.SimpleListFilter):
+    """Même règle que la propriété is_overdue du modèle, évaluée en SQL"""
+    title = "en retard"
+    parameter_name = 'overdue'
+    date_field = None
+    settled = None
+
+    def lookups(self, request, model_admin):
+        return (('yes', "Oui"), ('no', "Non"))
+
+    def overdue(self):
+        return Q(**{f'{self.date_field}__lt': timezone.now().date()}) & ~Q(**self.settled)
+
+    def queryset(self, request, queryset):
+        if self.value() == 'yes':
+            return queryset.filter(self.overdue())
+        if self.value() == 'no':
+            return queryset.exclude(self.overdue())
+        return queryset
+
+
+class InvoiceOverdueFilter(OverdueFilter):
+    date_field = 'due_date'
+    settled = {'status__in': ['paid', 'cancelled']}
+
+
+class PurchaseOverdueFilter(OverdueFilter):
+    date_field = 'payment_due_date'
+    settled = {'payment_status': 'paid'}
+
+
+class BalanceFilter(admin.SimpleListFilter):
+    """Tranches du solde restant dû, sur l'annotation de with_amounts()"""
+    title = "solde restant dû"
+    parameter_name = 'balance'
+    RANGES = {
+        'settled': ("Soldé", None, 0),
+        '0-100': ("Jusqu'à 100", 0, 100),
+        '100-1000': ("100 à 1 000", 100, 1000),
+        '1000-10000': ("1 000 à 10 000", 1000, 10000),
+        '10000+': ("Plus de 10 000", 10000, None),
+    }
+
+    def lookups(self, request, model_admin):
+        return [(key, label) for key, (label, low, high) in self.RANGES.items()]
+
+    def queryset(self, request, queryset):
+        if self.value() not in self.RANGES:
+            return queryset
+        _, low, high = self.RANGES[self.value()]
+        if low is not None:
+            queryset = queryset.filter(annotated_balance__gt=low)
+        if high is not None:
+            queryset = queryset.filter(annotated_balance__lte=high)
+        return queryset
+
+
+class LineTotalMixin:
+    """Prix total des lignes en ligne ; vide pour le formulaire de ligne vierge"""
+
+    @admin.display(description="Prix total")
+    def total_price(self, obj):
+        if obj.pk is None:
+            return None
+        return obj.total_price
+
+
+class DocumentAmountsMixin:
+    """Montants des listes de ventes et d'achats, lus dans les annotations (aucune requête par ligne)"""
+
+    @admin.display(description="Montant total", ordering='annotated_total')
+    def list_total_amount(self, obj):
+        return obj.annotated_total
+
+    @admin.display(description="Solde restant dû", ordering='annotated_balance')
+    def list_balance_due(self, obj):
+        return obj.annotated_balance
+
+
 @admin.register(Supplier)
-class SupplierAdmin(admin.ModelAdmin):
+class SupplierAdmin(TenantAdminMixin, admin.ModelAdmin):
     list_display = ('name', 'country', 'contact_name', 'contact_phone')
     search_fields = ('name', 'contact_name')
     list_filter = ('country',)
 
 
 @admin.register(ProductCategory)
-class ProductCategoryAdmin(admin.ModelAdmin):
+class ProductCategoryAdmin(TenantAdminMixin, admin.ModelAdmin):
     list_display = ('name', 'description')
     search_fields = ('name',)
 
@@ -27,10 +211,12 @@ class ProductInline(admin.TabularInline):
 
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(LargeTableAdmin):
     list_display = ('name', 'reference', 'category', 'supplier', 'buying_price', 'selling_price', 'stock_quantity', 'is_low_stock')
-    list_filter = ('category', 'supplier', 'is_low_stock')
+    list_filter = ('category', 'supplier', LowStockFilter)
+    list_select_related = ('category', 'supplier')
     search_fields = ('name', 'reference')
+    autocomplete_fields = ('category', 'supplier')
     readonly_fields = ('is_low_stock', 'margin')
     fieldsets = (
         (None, {
@@ -51,26 +237,33 @@ class ProductAdmin(admin.ModelAdmin):
     )
 
 
-class PurchaseItemInline(admin.TabularInline):
+class PurchaseItemInline(LineTotalMixin, admin.TabularInline):
     model = PurchaseItem
     extra = 0
     fields = ('product', 'quantity', 'unit_price', 'received_quantity', 'total_price')
     readonly_fields = ('total_price',)
+    autocomplete_fields = ('product',)
 
 
 class PurchasePaymentInline(admin.TabularInline):
     model = PurchasePayment
     extra = 0
-    fields = ('payment_date', 'amount', 'payment_method', 'reference')
+    fields = ('payment_date', 'amount', 'amount_base', 'payment_method', 'reference')
+    readonly_fields = ('amount_base',)
 
 
 @admin.register(Purchase)
-class PurchaseAdmin(admin.ModelAdmin):
-    list_display = ('id', 'supplier', 'order_date', 'status', 'payment_status', 'total_amount', 'balance_due')
-    list_filter = ('status', 'payment_status', 'order_date')
+class PurchaseAdmin(DocumentAmountsMixin, LargeTableAdmin):
+    list_display = ('id', 'supplier', 'order_date', 'status', 'payment_status', 'list_total_amount', 'list_balance_due')
+    list_filter = ('status', 'payment_status', PurchaseOverdueFilter, BalanceFilter, 'currency', 'order_date')
+    list_select_related = ('supplier',)
     search_fields = ('supplier__name', 'reference')
-    readonly_fields = ('total_amount', 'total_paid', 'balance_due', 'is_overdue')
+    autocomplete_fields = ('supplier',)
+    readonly_fields = ('total_amount', 'total_paid', 'balance_due', 'is_overdue', 'exchange_rate', 'total_amount_base')
     inlines = [PurchaseItemInline, PurchasePaymentInline]
+
+    def get_queryset(self, request):
+        return with_amounts(super().get_queryset(request), PurchaseItem, PurchasePayment, 'purchase')
     fieldsets = (
         (None, {
             'fields': ('supplier', 'reference', 'notes')
@@ -82,37 +275,45 @@ class PurchaseAdmin(admin.ModelAdmin):
             'fields': ('status', 'payment_status', 'payment_due_date')
         }),
         ('Montants', {
-            'fields': ('total_amount', 'total_paid', 'balance_due', 'is_overdue')
+            'fields': ('currency', 'exchange_rate', 'total_amount', 'total_amount_base', 'total_paid', 'balance_due',
+                       'is_overdue')
         }),
     )
 
 
 @admin.register(Customer)
-class CustomerAdmin(admin.ModelAdmin):
+class CustomerAdmin(TenantAdminMixin, admin.ModelAdmin):
     list_display = ('name', 'phone', 'email')
     search_fields = ('name', 'phone', 'email')
 
 
-class SaleItemInline(admin.TabularInline):
+class SaleItemInline(LineTotalMixin, admin.TabularInline):
     model = SaleItem
     extra = 0
     fields = ('product', 'quantity', 'unit_price', 'discount', 'total_price')
     readonly_fields = ('total_price',)
+    autocomplete_fields = ('product',)
 
 
 class SalePaymentInline(admin.TabularInline):
     model = SalePayment
     extra = 0
-    fields = ('payment_date', 'amount', 'payment_method', 'reference')
+    fields = ('payment_date', 'amount', 'amount_base', 'payment_method', 'reference')
+    readonly_fields = ('amount_base',)
 
 
 @admin.register(Sale)
-class SaleAdmin(admin.ModelAdmin):
-    list_display = ('id', 'customer', 'sale_date', 'status', 'payment_status', 'total_amount', 'balance_due')
-    list_filter = ('status', 'payment_status', 'sale_date')
+class SaleAdmin(DocumentAmountsMixin, LargeTableAdmin):
+    list_display = ('id', 'customer', 'sale_date', 'status', 'payment_status', 'list_total_amount', 'list_balance_due')
+    list_filter = ('status', 'payment_status', BalanceFilter, 'currency', 'sale_date')
+    list_select_related = ('customer',)
     search_fields = ('customer__name', 'reference')
-    readonly_fields = ('total_amount', 'total_paid', 'balance_due', 'payment_days')
+    autocomplete_fields = ('customer',)
+    readonly_fields = ('total_amount', 'total_paid', 'balance_due', 'payment_days', 'exchange_rate', 'total_amount_base')
     inlines = [SaleItemInline, SalePaymentInline]
+
+    def get_queryset(self, request):
+        return with_amounts(super().get_queryset(request), SaleItem, SalePayment, 'sale')
     fieldsets = (
         (None, {
             'fields': ('customer', 'reference', 'notes')
@@ -124,23 +325,28 @@ class SaleAdmin(admin.ModelAdmin):
             'fields': ('status', 'payment_status')
         }),
         ('Montants', {
-            'fields': ('total_amount', 'total_paid', 'balance_due', 'payment_days')
+            'fields': ('currency', 'exchange_rate', 'total_amount', 'total_amount_base', 'total_paid', 'balance_due',
+                       'payment_days')
         }),
     )
 
 
 @admin.register(StockMovement)
-class StockMovementAdmin(admin.ModelAdmin):
+class StockMovementAdmin(LargeTableAdmin):
     list_display = ('product', 'quantity', 'movement_type', 'date', 'reference')
     list_filter = ('movement_type', 'date')
+    list_select_related = ('product',)
     search_fields = ('product__name', 'reference', 'notes')
+    autocomplete_fields = ('product',)
 
 
 @admin.register(Invoice)
-class InvoiceAdmin(admin.ModelAdmin):
+class InvoiceAdmin(LargeTableAdmin):
     list_display = ('invoice_number', 'sale', 'issue_date', 'due_date', 'status', 'is_overdue')
-    list_filter = ('status', 'issue_date', 'is_overdue')
+    list_filter = ('status', InvoiceOverdueFilter, 'issue_date')
+    list_select_related = ('sale__customer',)
     search_fields = ('invoice_number', 'sale__customer__name')
+    autocomplete_fields = ('sale',)
     readonly_fields = ('is_overdue',)
     fieldsets = (
         (None, {
@@ -152,4 +358,28 @@ class InvoiceAdmin(admin.ModelAdmin):
         ('Statut', {
             'fields': ('status', 'is_overdue')
         }),
-    )
\ No newline at end of file
+    )
+
+
+@admin.register(ExchangeRate)
+class ExchangeRateAdmin(TenantAdminMixin, admin.ModelAdmin):
+    list_display = ('currency', 'date', 'rate')
+    list_filter = ('currency',)
+    date_hierarchy = 'date'
+
+
+class MembershipInline(admin.TabularInline):
+    model = Membership
+    extra = 0
+    fields = ('user', 'created_at')
+    readonly_fields = ('created_at',)
+    autocomplete_fields = ('user',)
+
+
+@admin.register(Tenant)
+class TenantAdmin(admin.ModelAdmin):
+    list_display = ('name', 'slug', 'is_active', 'created_at')
+    list_filter = ('is_active',)
+    search_fields = ('name', 'slug')
+    prepopulated_fields = {'slug': ('name',)}
+    inlines = [MembershipInline]
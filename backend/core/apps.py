@@ -4,4 +4,23 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
-    verbose_name = "Gestion des Finances"
\ No newline at end of file
+    verbose_name = "Gestion des Finances"
+
+    def ready(self):
+        from .audit import connect_signals
+        from .authentication import connect_signals as connect_authentication_signals
+        from .currency import connect_signals as connect_currency_signals
+        from .jobs import autodiscover
+        from .periods import connect_signals as connect_period_signals
+        from .reservations import connect_signals as connect_reservation_signals
+        from .sync import connect_signals as connect_sync_signals
+        from .tenancy import connect_signals as connect_tenancy_signals
+        connect_signals()
+        connect_authentication_signals()
+        connect_currency_signals()
+        connect_period_signals()
+        connect_sync_signals()
+        # Après la garde des périodes clôturées : une vente figée ne consomme pas de stock
+        connect_reservation_signals()
+        connect_tenancy_signals()
+        autodiscover()
@@ -0,0 +1,171 @@
+"""
+Archivage de l'historique clos.
+
+Les ventes livrées et payées, les achats reçus et payés (avec leurs lignes,
+leurs paiements et leur facture) et les mouvements de stock plus anciens que
+ARCHIVE_AFTER_DAYS jours sont déplacés vers des tables d'archive de même
+structure (voir archive_model dans core.models), par lots de
+ARCHIVE_BATCH_SIZE documents, chaque lot dans sa propre transaction : listes,
+filtres et agrégats ne parcourent plus que les données vivantes. Les
+identifiants sont conservés ; l'API ajoute les archives à ses lectures avec
+?include_archived=1 et les relevés de compte les incluent toujours.
+
+La durée de conservation doit couvrir les historiques relus par les calculs :
+indicateurs fournisseurs (SUPPLIER_SCORE_DAYS) et saisonnalité des prévisions
+(treize mois).
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, models, transaction
+from django.db.models import Q, Value
+from django.utils import timezone
+
+from .models import (
+    ArchivedInvoice, ArchivedPurchase, ArchivedPurchaseItem, ArchivedPurchasePayment, ArchivedSale,
+    ArchivedSaleItem, ArchivedSalePayment, ArchivedStockMovement, Invoice, Purchase, PurchaseItem,
+    PurchasePayment, Sale, SaleItem, SalePayment, StockMovement,
+)
+
+
+class ArchiveFamily:
+    """Document archivable, sa table d'archive et les tables qui le suivent (lignes, paiements, facture)"""
+
+    def __init__(self, model, archive, date_field, closed=Q(), children=()):
+        self.model = model
+        self.archive = archive
+        self.date_field = date_field
+        self.closed = closed
+        self.children = children
+
+    def candidates(self, cutoff, tenant_id=None):
+        """Documents clos antérieurs à cutoff, toutes boutiques confondues sauf tenant_id"""
+        field = self.model._meta.get_field(self.date_field)
+        limit = cutoff if isinstance(field, models.DateTimeField) else cutoff.date()
+        queryset = self.model.all_tenants.filter(self.closed, **{f'{self.date_field}__lt': limit})
+        if tenant_id is not None:
+            queryset = queryset.filter(tenant_id=tenant_id)
+        return queryset
+
+    def tables(self):
+        """(modèle, archive, colonne des identifiants du document), document en premier"""
+        yield self.model, self.archive, self.model._meta.pk.column
+        for model, archive in self.children:
+            yield model, archive, model._meta.get_field(self.model._meta.model_name).column
+
+
+FAMILIES = [
+    ArchiveFamily(Sale, ArchivedSale, 'sale_date', Q(status='delivered', payment_status='paid'), [
+        (SaleItem, ArchivedSaleItem), (SalePayment, ArchivedSalePayment), (Invoice, ArchivedInvoice),
+    ]),
+    ArchiveFamily(Purchase, ArchivedPurchase, 'order_date', Q(status='received', payment_status='paid'), [
+        (PurchaseItem, ArchivedPurchaseItem), (PurchasePayment, ArchivedPurchasePayment),
+    ]),
+    ArchiveFamily(StockMovement, ArchivedStockMovement, 'date'),
+]
+
+# Table d'archive de chaque modèle archivé
+ARCHIVES = {model: archive for family in FAMILIES for model, archive, _ in family.tables()}
+
+
+def _cutoff(days):
+    return timezone.now() - timedelta(days=settings.ARCHIVE_AFTER_DAYS if days is None else days)
+
+
+def _move(cursor, model, archive, column, ids):
+    """Déplace les lignes de model dont column est dans ids vers archive ; renvoie leur nombre"""
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(field.column) for field in model._meta.concrete_fields)
+    source, target = quote(model._meta.db_table), quote(archive._meta.db_table)
+    where = f"{quote(column)} IN ({', '.join(['%s'] * len(ids))})"
+    if connection.vendor == 'postgresql':
+        # Une seule instruction : les lignes supprimées sont insérées telles quelles dans l'archive
+        cursor.execute(f"WITH moved AS (DELETE FROM {source} WHERE {where} RETURNING {columns}) "
+                       f"INSERT INTO {target} ({columns}) SELECT {columns} FROM moved", ids)
+        return cursor.rowcount
+    cursor.execute(f"INSERT INTO {target} ({columns}) SELECT {columns} FROM {source} WHERE {where}", ids)
+    cursor.execute(f"DELETE FROM {source} WHERE {where}", ids)
+    return cursor.rowcount
+
+
+def pending_counts(days=None, tenant_id=None):
+    """Nombre de documents à archiver par modèle"""
+    cutoff = _cutoff(days)
+    return {family.model._meta.label: family.candidates(cutoff, tenant_id).count() for family in FAMILIES}
+
+
+def archive_history(days=None, batch_size=None, tenant_id=None, progress=None):
+    """
+    Archive l'historique clos plus ancien que days jours (ARCHIVE_AFTER_DAYS par
+    défaut) ; renvoie le nombre de lignes déplacées par modèle. Chaque lot est
+    verrouillé le temps de son déplacement : un document en cours de
+    modification est laissé pour le passage suivant. Le SQL brut ne déclenche
+    ni signaux ni journal d'audit : les lignes changent de table, pas de contenu.
+    """
+    cutoff = _cutoff(days)
+    batch_size = batch_size or settings.ARCHIVE_BATCH_SIZE
+    moved = {model._meta.label: 0 for model in ARCHIVES}
+    for family in FAMILIES:
+        while True:
+            with transaction.atomic():
+                ids = list(family.candidates(cutoff, tenant_id).order_by('pk')
+                           .select_for_update(skip_locked=True).values_list('pk', flat=True)[:batch_size])
+                if not ids:
+                    break
+                with connection.cursor() as cursor:
+                    # Document d'abord : les clés étrangères sont vérifiées en fin de transaction
+                    for model, archive, column in family.tables():
+                        moved[model._meta.label] += _move(cursor, model, archive, column, ids)
+            if progress is not None:
+                progress(moved)
+    return moved
+
+
+def include_archived(request):
+    """?include_archived=1 sur une lecture : les archives s'ajoutent aux données vivantes"""
+    return request.method in ('GET', 'HEAD', 'OPTIONS') and \
+        request.query_params.get('include_archived', '').lower() in ('1', 'true', 'yes', 'on')
+
+
+class WithArchive:
+    """
+    Liste des lignes vivantes et archivées, triées ensemble. Seuls les
+    identifiants et les clés de tri passent par l'UNION ALL (compte et page) ;
+    les lignes de la page sont ensuite lues dans chaque table avec les
+    querysets de la vue, relations préchargées comprises.
+    """
+
+    def __init__(self, live, archived):
+        self.live = live
+        self.archived = archived
+        pk = live.model._meta.pk.attname
+        ordering = [term for term in (live.query.order_by or live.model._meta.ordering)
+                    if isinstance(term, str) and term.lstrip('-') not in ('pk', pk)] + [pk]
+        # Table d'origine et identifiant en tête, puis les clés de tri
+        columns = ['archived', pk, *dict.fromkeys(term.lstrip('-') for term in ordering[:-1])]
+
+        def keys(queryset, archived):
+            return queryset.order_by().prefetch_related(None).annotate(archived=Value(archived))\
+                .values_list(*columns)
+
+        self.keys = keys(live, False).union(keys(archived, True), all=True).order_by(*ordering)
+
+    def count(self):
+        return self.keys.count()
+
+    def __len__(self):
+        return self.count()
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        wanted = [(bool(row[0]), row[1]) for row in self.keys[index]]
+        objects = {}
+        for archived, queryset in ((False, self.live), (True, self.archived)):
+            ids = [pk for flag, pk in wanted if flag is archived]
+            if ids:
+                objects.update(((archived, obj.pk), obj) for obj in queryset.filter(pk__in=ids))
+        return [objects[key] for key in wanted if key in objects]
@@ -0,0 +1,201 @@
+"""
+Journal d'audit des produits, ventes, achats, paiements, mouvements de stock et factures.
+
+Les valeurs lues en base sont mémorisées au chargement de l'objet (post_init) :
+la différence est calculée à l'enregistrement sans requête supplémentaire.
+Chaque entrée est placée, à la validation de la transaction, dans une file en
+mémoire qu'un thread écrit par paquets avec bulk_create ; save() ne paie donc
+pas l'écriture du journal. Une transaction annulée ne laisse aucune entrée.
+Chaque entrée est rangée dans la boutique de l'objet journalisé.
+"""
+import atexit
+import logging
+import threading
+import time
+from contextvars import ContextVar
+from functools import partial
+
+from django.apps import apps
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, transaction
+from django.db.models.fields.files import FieldFile
+from django.db.models.signals import post_delete, post_init, post_save
+from django.utils import timezone
+
+from .tenancy import current_tenant_id
+
+logger = logging.getLogger(__name__)
+
+AUDITED_MODELS = ('Product', 'Sale', 'Purchase', 'SalePayment', 'PurchasePayment', 'StockMovement', 'Invoice')
+# Horodatages techniques et boutique (portée par l'entrée elle-même) : inutiles dans le détail des modifications
+IGNORED_FIELDS = {'created_at', 'updated_at', 'tenant'}
+
+_current_request = ContextVar('audit_request', default=None)
+_tracked_fields = {}
+
+
+def current_user_id():
+    """Utilisateur de la requête en cours (DRF y reporte l'utilisateur authentifié par JWT)"""
+    request = _current_request.get()
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user.pk
+    return None
+
+
+class AuditMiddleware:
+    """Rend la requête en cours accessible au journal d'audit"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _current_request.set(request)
+        try:
+            return self.get_response(request)
+        finally:
+            _current_request.reset(token)
+
+
+class AuditBuffer:
+    """File d'entrées en mémoire, écrite en base par paquets par un thread dédié"""
+
+    def __init__(self):
+        self.entries = []
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def add(self, entry):
+        if not settings.AUDIT_FLUSH_INTERVAL:
+            self.entries.append(entry)
+            self.flush()
+            return
+        with self.lock:
+            self.entries.append(entry)
+            size = len(self.entries)
+            if self.thread is None or not self.thread.is_alive():
+                # Démarré à la première entrée : après le fork des workers du serveur d'application
+                self.thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+                self.thread.start()
+        if size >= settings.AUDIT_BATCH_SIZE:
+            self.wakeup.set()
+
+    def flush(self):
+        """Écrit toutes les entrées en attente ; renvoie leur nombre"""
+        AuditLog = apps.get_model('core', 'AuditLog')
+        with self.lock:
+            entries, self.entries = self.entries, []
+        if not entries:
+            return 0
+        try:
+            AuditLog.all_tenants.bulk_create([AuditLog(**entry) for entry in entries],
+                                         batch_size=settings.AUDIT_BATCH_SIZE)
+        except DatabaseError:
+            logger.exception("Écriture du journal d'audit impossible, nouvel essai au prochain passage")
+            with self.lock:
+                # Base indisponible : on garde les entrées, dans la limite de AUDIT_MAX_BUFFER
+                self.entries[:0] = entries
+                overflow = len(self.entries) - settings.AUDIT_MAX_BUFFER
+                if overflow > 0:
+                    del self.entries[:overflow]
+                    logger.error("%s entrées du journal d'audit perdues (file pleine)", overflow)
+            return 0
+        return len(entries)
+
+    def _run(self):
+        while True:
+            self.wakeup.wait(settings.AUDIT_FLUSH_INTERVAL)
+            self.wakeup.clear()
+            started = time.monotonic()
+            try:
+                written = self.flush()
+            finally:
+                close_old_connections()
+            if written:
+                logger.debug("%s entrées d'audit écrites en %.1f ms", written, (time.monotonic() - started) * 1000)
+
+
+buffer = AuditBuffer()
+atexit.register(buffer.flush)
+
+
+def record(model_name, object_id, action, changes, user_id=None, tenant_id=None):
+    """Ajoute une entrée au journal à la validation de la transaction en cours"""
+    if not settings.AUDIT_ENABLED:
+        return
+    entry = {
+        'tenant_id': tenant_id if tenant_id is not None else current_tenant_id(),
+        'model': model_name,
+        'object_id': object_id,
+        'action': action,
+        'changes': changes,
+        'user_id': user_id if user_id is not None else current_user_id(),
+        'timestamp': timezone.now(),
+    }
+    transaction.on_commit(partial(buffer.add, entry))
+
+
+def _value(value):
+    if isinstance(value, FieldFile):
+        return value.name or None
+    return value
+
+
+def _snapshot(sender, instance, **kwargs):
+    # Copie brute (rapide) des valeurs chargées ; la comparaison n'a lieu qu'à l'enregistrement
+    state = instance.__dict__.copy()
+    state.pop('_audit_state', None)
+    instance._audit_state = state
+
+
+def _diff(instance):
+    previous = getattr(instance, '_audit_state', {})
+    current = instance.__dict__
+    changes = {}
+    # Les champs différés (only(), defer()) ne sont pas chargés : ils ne sont pas comparés
+    for attname in _tracked_fields[type(instance)]:
+        if attname in previous and attname in current:
+            before, after = _value(previous[attname]), _value(current[attname])
+            if before != after:
+                changes[attname] = [before, after]
+    _snapshot(type(instance), instance)
+    return changes
+
+
+def record_updates(instances):
+    """Journalise les modifications d'objets enregistrés sans save() (bulk_update)"""
+    for instance in instances:
+        changes = _diff(instance)
+        if changes:
+            record(instance._meta.model_name, instance.pk, 'u', changes, tenant_id=instance.tenant_id)
+
+
+def _saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        values = {attname: _value(instance.__dict__.get(attname)) for attname in _tracked_fields[sender]}
+        changes = {attname: value for attname, value in values.items() if value is not None}
+        _snapshot(sender, instance)
+        record(sender._meta.model_name, instance.pk, 'c', changes, tenant_id=instance.tenant_id)
+        return
+    changes = _diff(instance)
+    if changes:
+        record(sender._meta.model_name, instance.pk, 'u', changes, tenant_id=instance.tenant_id)
+
+
+def _deleted(sender, instance, **kwargs):
+    values = getattr(instance, '_audit_state', {})
+    changes = {attname: _value(values[attname]) for attname in _tracked_fields[sender] if attname in values}
+    record(sender._meta.model_name, instance.pk, 'd', changes, tenant_id=instance.tenant_id)
+
+
+def connect_signals():
+    for name in AUDITED_MODELS:
+        model = apps.get_model('core', name)
+        _tracked_fields[model] = [field.attname for field in model._meta.concrete_fields
+                                  if field.name not in IGNORED_FIELDS and not field.primary_key]
+        post_init.connect(_snapshot, sender=model, dispatch_uid=f'audit_init_{name}')
+        post_save.connect(_saved, sender=model, dispatch_uid=f'audit_save_{name}')
+        post_delete.connect(_deleted, sender=model, dispatch_uid=f'audit_delete_{name}')
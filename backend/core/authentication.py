@@ -0,0 +1,82 @@
+"""
+Authentification JWT avec cache de l'utilisateur.
+
+JWTAuthentication relit la ligne User à chaque requête alors que le jeton est
+déjà vérifié ; un tableau de bord qui lance ses appels en parallèle répète donc
+la même lecture. CachedJWTAuthentication garde l'utilisateur résolu dans le
+cache JWT_USER_CACHE pendant JWT_USER_CACHE_TTL secondes. L'entrée est
+supprimée dès que l'utilisateur est modifié ou supprimé (mot de passe, statut
+actif ou administrateur), et les contrôles de simplejwt (compte actif, jeton
+révoqué par un changement de mot de passe) sont refaits sur l'utilisateur en
+cache.
+
+Avec plusieurs serveurs, JWT_USER_CACHE doit désigner un cache partagé : avec
+un cache local, une modification faite sur un serveur n'est vue des autres
+qu'à l'expiration de l'entrée.
+"""
+from functools import partial
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+KEY_PREFIX = 'jwt-user'
+
+
+def _cache():
+    return caches[settings.JWT_USER_CACHE]
+
+
+def cache_key(user_id):
+    return f"{KEY_PREFIX}:{user_id}"
+
+
+def invalidate_user(user_id):
+    _cache().delete(cache_key(user_id))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication dont l'utilisateur est lu en cache plutôt qu'en base"""
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        if not settings.JWT_USER_CACHE_TTL:
+            return super().get_user(validated_token)
+        key = cache_key(user_id)
+        user = _cache().get(key)
+        if user is None:
+            # Lecture et contrôles de simplejwt ; seul un utilisateur valide est mis en cache
+            user = super().get_user(validated_token)
+            _cache().set(key, user, settings.JWT_USER_CACHE_TTL)
+            return user
+
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if api_settings.CHECK_REVOKE_TOKEN and \
+                validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+            raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+        return user
+
+
+def _user_changed(sender, instance, **kwargs):
+    user_id = getattr(instance, api_settings.USER_ID_FIELD)
+    invalidate_user(user_id)
+    # Une requête concurrente a pu remettre l'ancienne ligne en cache avant la validation
+    transaction.on_commit(partial(invalidate_user, user_id))
+
+
+def connect_signals():
+    User = get_user_model()
+    post_save.connect(_user_changed, sender=User, dispatch_uid='jwt_user_cache_save')
+    post_delete.connect(_user_changed, sender=User, dispatch_uid='jwt_user_cache_delete')
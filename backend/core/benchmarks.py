@@ -0,0 +1,188 @@
+"""
+Mesure de la latence des points d'entrée critiques de l'API.
+
+Chaque scénario est rejoué via le client de test de Django sur un jeu de données
+généré par core.seeding. Les scénarios qui modifient des données s'exécutent
+dans une transaction annulée : toutes les répétitions voient le même état.
+"""
+import statistics
+import time
+import tracemalloc
+from contextlib import ExitStack
+
+from django.contrib.auth.models import User
+from django.db import connections, reset_queries, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .models import Membership, Purchase, Sale, Customer, Product
+from .seeding import Seeder
+
+
+class Scenario:
+    """Une requête HTTP à mesurer"""
+
+    def __init__(self, name, method, path, payload=None, writes=False):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.payload = payload
+        self.writes = writes
+
+    def call(self, client, targets):
+        path = self.path.format(**targets)
+        payload = self.payload(targets) if self.payload else None
+        response = getattr(client, self.method)(path, payload, format='json')
+        if response.status_code >= 400:
+            raise RuntimeError(f"{self.name} : {self.method.upper()} {path} a renvoyé {response.status_code}")
+        if hasattr(response, 'render') and not response.is_rendered:
+            response.render()
+        return response
+
+
+SCENARIOS = [
+    Scenario('sales.list', 'get', '/api/sales/'),
+    Scenario('sales.detail', 'get', '/api/sales/{sale}/'),
+    Scenario('purchases.list', 'get', '/api/purchases/'),
+    Scenario('purchases.detail', 'get', '/api/purchases/{purchase}/'),
+    Scenario('dashboard.supplier_payments', 'get', '/api/dashboard/supplier_payments/'),
+    Scenario('dashboard.customer_payments', 'get', '/api/dashboard/customer_payments/'),
+    Scenario('dashboard.low_stock_products', 'get', '/api/dashboard/low_stock_products/'),
+    Scenario('dashboard.sales_summary', 'get', '/api/dashboard/sales_summary/'),
+    Scenario('dashboard.purchases_summary', 'get', '/api/dashboard/purchases_summary/'),
+    Scenario('purchases.mark_received', 'post', '/api/purchases/{ordered_purchase}/mark_received/',
+             payload=lambda targets: {'received_quantity': targets['received_quantity']}, writes=True),
+    Scenario('sales.mark_delivered', 'post', '/api/sales/{shipped_sale}/mark_delivered/', writes=True),
+    Scenario('sales.add_payment', 'post', '/api/sales/{unpaid_sale}/add_payment/',
+             payload=lambda targets: {'amount': '10.00', 'payment_method': 'cash',
+                                      'payment_date': targets['today']}, writes=True),
+    Scenario('sales.create', 'post', '/api/sales/', payload=lambda targets: {
+        'customer': targets['customer'],
+        'sale_date': targets['today'],
+        'status': 'confirmed',
+        'items': [{'product': product, 'quantity': 1, 'unit_price': '25.00'} for product in targets['products']],
+    }, writes=True),
+]
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def find_targets():
+    """Choisit dans les données générées les objets visés par chaque scénario"""
+    # Aux petites échelles, il peut ne rester aucun document dans l'état voulu : on en prépare un
+    purchase = Purchase.objects.exclude(status='received').order_by('-id').first()
+    if purchase is None:
+        purchase = Purchase.objects.order_by('-id').first()
+        Purchase.objects.filter(pk=purchase.pk).update(status='ordered', actual_delivery_date=None)
+    sale = Sale.objects.exclude(status__in=['delivered', 'cancelled']).order_by('-id').first()
+    if sale is None:
+        sale = Sale.objects.order_by('-id').first()
+        Sale.objects.filter(pk=sale.pk).update(status='shipped', actual_delivery_date=None)
+    unpaid = Sale.objects.filter(payment_status='unpaid').values_list('id', flat=True).first()
+
+    return {
+        'sale': Sale.objects.order_by('-id').values_list('id', flat=True).first(),
+        'purchase': Purchase.objects.order_by('-id').values_list('id', flat=True).first(),
+        'ordered_purchase': purchase.id,
+        'received_quantity': {str(item.id): item.quantity for item in purchase.items.all()},
+        'shipped_sale': sale.id,
+        'unpaid_sale': unpaid or sale.id,
+        'customer': Customer.objects.values_list('id', flat=True).first(),
+        'products': list(Product.objects.order_by('id').values_list('id', flat=True)[:3]),
+        'today': timezone.localdate().isoformat(),
+    }
+
+
+def measure(scenario, client, targets, repeat):
+    """Latences (ms), nombre de requêtes SQL et pic d'allocation mémoire d'un scénario"""
+
+    def once():
+        if not scenario.writes:
+            return scenario.call(client, targets)
+        with transaction.atomic():
+            response = scenario.call(client, targets)
+            transaction.set_rollback(True)
+        return response
+
+    # Échauffement : caches de requêtes compilées, imports paresseux
+    once()
+
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        once()
+        timings.append((time.perf_counter() - started) * 1000)
+
+    # Le signal request_started vide le journal des requêtes : on part d'un journal vide
+    reset_queries()
+    # Toutes les bases : les lectures de rapport passent par le réplica quand il est configuré
+    with ExitStack() as stack:
+        captures = [stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in connections]
+        once()
+    query_count = sum(len(queries) for queries in captures)
+
+    # tracemalloc ralentit fortement l'exécution : mesure séparée des latences
+    tracemalloc.start()
+    try:
+        once()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'p50_ms': round(statistics.median(timings), 3),
+        'p95_ms': round(_percentile(timings, 0.95), 3),
+        'queries': query_count,
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+def run_benchmarks(scales, repeat=20, seed=42, log=None, only=None):
+    """Génère les données de chaque échelle puis mesure tous les scénarios"""
+    log = log or (lambda message: None)
+    results = {}
+    for scale in scales:
+        seeder = Seeder(scale=scale, seed=seed)
+        seeder.clear()
+        rows, elapsed = seeder.run()
+        log(f"Échelle {scale} : {sum(rows.values())} lignes générées en {elapsed:.1f} s")
+
+        user, _ = User.objects.get_or_create(username='benchmark')
+        Membership.objects.get_or_create(tenant_id=seeder.tenant_id, user=user)
+        client = APIClient()
+        client.force_authenticate(user)
+        targets = find_targets()
+
+        results[str(scale)] = {}
+        for scenario in SCENARIOS:
+            if only and scenario.name not in only:
+                continue
+            results[str(scale)][scenario.name] = metrics = measure(scenario, client, targets, repeat)
+            log(f"  {scenario.name:<32} p50 {metrics['p50_ms']:>9.2f} ms  p95 {metrics['p95_ms']:>9.2f} ms  "
+                f"{metrics['queries']:>6} requêtes  {metrics['peak_kb']:>10.1f} Ko")
+    return results
+
+
+def compare(results, baseline, tolerance, min_delta_ms=2.0):
+    """Liste les régressions par rapport à une référence"""
+    regressions = []
+    for scale, scenarios in results.items():
+        for name, metrics in scenarios.items():
+            reference = baseline.get(scale, {}).get(name)
+            if not reference:
+                continue
+            # Le nombre de requêtes est déterministe : toute hausse est une régression
+            if metrics['queries'] > reference['queries']:
+                regressions.append(f"{scale}/{name} : {reference['queries']} -> {metrics['queries']} requêtes")
+            for key in ('p50_ms', 'p95_ms'):
+                limit = max(reference[key] * (1 + tolerance), reference[key] + min_delta_ms)
+                if metrics[key] > limit:
+                    regressions.append(f"{scale}/{name} : {key} {reference[key]} -> {metrics[key]}")
+            if metrics['peak_kb'] > reference['peak_kb'] * (1 + tolerance):
+                regressions.append(f"{scale}/{name} : mémoire {reference['peak_kb']} -> {metrics['peak_kb']} Ko")
+    return regressions
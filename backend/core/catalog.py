@@ -0,0 +1,115 @@
+"""Opérations groupées sur le catalogue produits"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.db.models.functions import Round
+from django.utils import timezone
+
+from .audit import record, record_updates
+from .models import Product
+from .serializers import ProductBulkUpdateSerializer
+
+PRICE_FIELDS = {
+    'selling': ('selling_price',),
+    'buying': ('buying_price',),
+    'both': ('buying_price', 'selling_price'),
+}
+
+
+def fetch_products(queryset, ids=(), references=()):
+    """Produits demandés par id ou par référence, et identifiants introuvables"""
+    products = list(queryset.filter(Q(id__in=ids) | Q(reference__in=references)))
+    found_ids = {product.id for product in products}
+    found_references = {product.reference for product in products}
+    missing = [value for value in ids if value not in found_ids]
+    missing += [value for value in references if value not in found_references]
+    return products, missing
+
+
+def bulk_update_products(rows):
+    """
+    Met à jour prix et seuils de stock d'un lot de produits en une transaction.
+
+    Renvoie (produits mis à jour, erreurs par ligne). Si une seule ligne est en
+    erreur, rien n'est enregistré.
+    """
+    errors = []
+    valid = []
+    for index, row in enumerate(rows):
+        serializer = ProductBulkUpdateSerializer(data=row)
+        if serializer.is_valid():
+            valid.append((index, serializer.validated_data))
+        else:
+            errors.append({'row': index, 'errors': serializer.errors})
+
+    with transaction.atomic():
+        ids = [data['id'] for _, data in valid if 'id' in data]
+        references = [data['reference'] for _, data in valid if 'reference' in data]
+        # Verrouille les lignes pour ne pas écraser une mise à jour concurrente
+        candidates = Product.objects.select_for_update(of=('self',)).select_related('category', 'supplier')\
+            .filter(Q(id__in=ids) | Q(reference__in=references))
+        by_id = {}
+        by_reference = {}
+        for product in candidates:
+            by_id[product.id] = product
+            by_reference.setdefault(product.reference, []).append(product)
+
+        touched = {}
+        fields = set()
+        for index, data in valid:
+            if 'id' in data:
+                product = by_id.get(data['id'])
+            else:
+                matches = by_reference.get(data['reference'], [])
+                if len(matches) > 1:
+                    errors.append({'row': index, 'errors': {'reference': ["Plusieurs produits portent cette référence."]}})
+                    continue
+                product = matches[0] if matches else None
+            if product is None:
+                errors.append({'row': index, 'errors': {'non_field_errors': ["Produit introuvable."]}})
+                continue
+            if product.id in touched:
+                errors.append({'row': index, 'errors': {'non_field_errors': ["Produit présent plusieurs fois dans le lot."]}})
+                continue
+            for field in ProductBulkUpdateSerializer.UPDATABLE_FIELDS:
+                if field in data:
+                    setattr(product, field, data[field])
+                    fields.add(field)
+            touched[product.id] = product
+
+        if errors:
+            return [], sorted(errors, key=lambda error: error['row'])
+
+        # bulk_update ne renseigne pas les champs auto_now
+        now = timezone.now()
+        for product in touched.values():
+            product.updated_at = now
+        Product.objects.bulk_update(touched.values(), sorted(fields) + ['updated_at'], batch_size=500)
+        record_updates(touched.values())
+    return list(touched.values()), []
+
+
+def reprice_products(percentage, category=None, supplier=None, price='selling'):
+    """Applique une hausse (ou baisse) en pourcentage par une seule requête UPDATE"""
+    factor = 1 + Decimal(percentage) / 100
+    products = Product.objects.all()
+    if category is not None:
+        products = products.filter(category=category)
+    if supplier is not None:
+        products = products.filter(supplier=supplier)
+    fields = PRICE_FIELDS[price]
+    updates = {field: Round(F(field) * factor, 2) for field in fields}
+    if not settings.AUDIT_ENABLED:
+        return products.update(updated_at=timezone.now(), **updates)
+
+    with transaction.atomic():
+        # Prix avant et après, relus en bloc pour le journal d'audit
+        before = {row[0]: row[1:] for row in products.select_for_update().values_list('id', *fields)}
+        count = products.update(updated_at=timezone.now(), **updates)
+        for product_id, *after in Product.objects.filter(id__in=before).values_list('id', *fields):
+            changes = {field: [old, new] for field, old, new in zip(fields, before[product_id], after) if old != new}
+            if changes:
+                record('product', product_id, 'u', changes)
+    return count
@@ -0,0 +1,198 @@
+"""
+Devises des ventes, achats et paiements, et conversion en devise de base.
+
+Les taux datés sont propres à chaque boutique ; ils sont lus dans la table
+ExchangeRate et gardés en mémoire par processus (FX_RATE_CACHE_TTL secondes),
+sous l'espace de noms de la boutique : convertir un document ne coûte pas de
+requête. Le taux applicable est le dernier connu à la date du document ou du
+paiement ; il est enregistré avec le montant converti au moment de l'écriture,
+de sorte que tableaux de bord et relevés additionnent directement les colonnes
+en devise de base.
+"""
+import bisect
+import threading
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Round
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+
+from .tenancy import active_tenant_id, namespace
+
+ONE = Decimal('1')
+CENT = Decimal('0.01')
+BATCH_SIZE = 2000
+
+# Montant d'une ligne, en devise du document
+LINE_TOTALS = {
+    'Sale': F('quantity') * F('unit_price') - F('discount'),
+    'Purchase': F('quantity') * F('unit_price'),
+}
+# Champ de date qui fixe le taux de chaque modèle
+RATE_DATE_FIELDS = {'Sale': 'sale_date', 'Purchase': 'order_date',
+                    'SalePayment': 'payment_date', 'PurchasePayment': 'payment_date'}
+
+
+class ExchangeRateMissing(Exception):
+    """Aucun taux connu pour la devise à la date demandée"""
+
+    def __init__(self, currency, day):
+        self.currency = currency
+        self.day = day
+        super().__init__(f"Aucun taux de change {currency} connu au {day}.")
+
+
+def default_currency():
+    return settings.BASE_CURRENCY
+
+
+def _as_date(value):
+    # Les champs DateField ont timezone.now pour défaut : un datetime avant l'enregistrement
+    return value.date() if isinstance(value, datetime) else value
+
+
+class RateCache:
+    """Taux datés par boutique et devise, rechargés au plus tard après FX_RATE_CACHE_TTL secondes"""
+
+    def __init__(self):
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def rate(self, currency, day, tenant_id=None):
+        """Valeur d'une unité de la devise en devise de base, au dernier taux connu à cette date"""
+        if currency == settings.BASE_CURRENCY:
+            return ONE
+        if tenant_id is None:
+            tenant_id = active_tenant_id()
+        entry = self.entries.get(self.key(tenant_id, currency))
+        if entry is None or entry[0] < time.monotonic():
+            entry = self._load(tenant_id, currency)
+        _, dates, rates = entry
+        index = bisect.bisect_right(dates, _as_date(day))
+        if not index:
+            raise ExchangeRateMissing(currency, _as_date(day))
+        return rates[index - 1]
+
+    @staticmethod
+    def key(tenant_id, currency):
+        return f"{namespace(tenant_id)}:{currency}"
+
+    def _load(self, tenant_id, currency):
+        ExchangeRate = apps.get_model('core', 'ExchangeRate')
+        rows = list(ExchangeRate.all_tenants.filter(tenant_id=tenant_id, currency=currency).order_by('date')
+                    .values_list('date', 'rate'))
+        entry = (time.monotonic() + settings.FX_RATE_CACHE_TTL, [row[0] for row in rows], [row[1] for row in rows])
+        with self.lock:
+            self.entries[self.key(tenant_id, currency)] = entry
+        return entry
+
+    def invalidate(self, tenant_id=None, currency=None):
+        """
+        Oublie les taux d'une devise de la boutique (toutes ses devises si None,
+        toutes les boutiques si tenant_id vaut None) ; les autres processus
+        attendent l'expiration.
+        """
+        with self.lock:
+            if tenant_id is None:
+                self.entries.clear()
+            elif currency is None:
+                prefix = f"{namespace(tenant_id)}:"
+                for key in [key for key in self.entries if key.startswith(prefix)]:
+                    del self.entries[key]
+            else:
+                self.entries.pop(self.key(tenant_id, currency), None)
+
+
+rates = RateCache()
+
+
+def get_rate(currency, day, tenant_id=None):
+    return rates.rate(currency, day, tenant_id)
+
+
+def to_base(amount, rate):
+    return (Decimal(amount or 0) * rate).quantize(CENT)
+
+
+def refresh_base_totals(model, ids):
+    """
+    Recalcule, en une requête, le total en devise de base des ventes ou achats
+    donnés ; leur date de mise à jour suit, pour le flux de synchronisation.
+    """
+    item_model = model.items.rel.related_model
+    document_field = model._meta.model_name
+    items = item_model.all_tenants.filter(**{document_field: OuterRef('pk')}).order_by().values(document_field)\
+        .annotate(total=Sum(LINE_TOTALS[model.__name__])).values('total')
+    amount = DecimalField(max_digits=14, decimal_places=2)
+    return model.all_tenants.filter(pk__in=ids).update(updated_at=timezone.now(), total_amount_base=Round(
+        Coalesce(Subquery(items, output_field=amount), Value(Decimal('0')), output_field=amount)
+        * F('exchange_rate'), 2, output_field=amount,
+    ))
+
+
+def reapply_rates(currencies, since=None, tenant_id=None):
+    """
+    Réapplique les taux actuels aux documents et paiements des devises données,
+    datés à partir de since (tous si None), après un import de taux rétroactif
+    dans la boutique (la boutique courante si None), hors périodes clôturées.
+    Renvoie le nombre de lignes recalculées.
+    """
+    from .periods import locked_through
+
+    if tenant_id is None:
+        tenant_id = active_tenant_id()
+    # Les documents des périodes clôturées gardent le taux de leur clôture
+    locked = locked_through(tenant_id)
+    if locked is not None and (since is None or _as_date(since) <= locked):
+        since = locked + timedelta(days=1)
+    updated = 0
+    for name, date_field in RATE_DATE_FIELDS.items():
+        model = apps.get_model('core', name)
+        rows = model.all_tenants.filter(tenant_id=tenant_id, currency__in=currencies)
+        if since is not None:
+            rows = rows.filter(**{f'{date_field}__gte': since})
+        by_rate = {}
+        for pk, currency, day in rows.values_list('pk', 'currency', date_field).iterator(chunk_size=BATCH_SIZE):
+            try:
+                by_rate.setdefault(get_rate(currency, day, tenant_id), []).append(pk)
+            except ExchangeRateMissing:
+                continue
+        with transaction.atomic():
+            for rate, ids in by_rate.items():
+                for start in range(0, len(ids), BATCH_SIZE):
+                    chunk = ids[start:start + BATCH_SIZE]
+                    if name in LINE_TOTALS:
+                        model.all_tenants.filter(pk__in=chunk).update(exchange_rate=rate, updated_at=timezone.now())
+                        refresh_base_totals(model, chunk)
+                    else:
+                        model.all_tenants.filter(pk__in=chunk).update(
+                            exchange_rate=rate, amount_base=Round(F('amount') * rate, 2), updated_at=timezone.now())
+                    updated += len(chunk)
+    return updated
+
+
+def _item_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    document = sender._meta.get_field('sale' if sender.__name__ == 'SaleItem' else 'purchase')
+    refresh_base_totals(document.related_model, [getattr(instance, document.attname)])
+
+
+def _rate_changed(sender, instance, **kwargs):
+    rates.invalidate(instance.tenant_id, instance.currency)
+
+
+def connect_signals():
+    for name in ('SaleItem', 'PurchaseItem'):
+        model = apps.get_model('core', name)
+        post_save.connect(_item_changed, sender=model, dispatch_uid=f'currency_save_{name}')
+        post_delete.connect(_item_changed, sender=model, dispatch_uid=f'currency_delete_{name}')
+    ExchangeRate = apps.get_model('core', 'ExchangeRate')
+    post_save.connect(_rate_changed, sender=ExchangeRate, dispatch_uid='currency_rate_save')
+    post_delete.connect(_rate_changed, sender=ExchangeRate, dispatch_uid='currency_rate_delete')
@@ -0,0 +1,149 @@
+"""
+Requêtes d'écriture rejouables sans effet en double (en-tête Idempotency-Key).
+
+Un client qui renvoie une requête POST, PUT, PATCH ou DELETE avec la même clé
+reçoit la réponse mémorisée lors de la première exécution, sans que l'action
+soit exécutée une seconde fois. La clé est réservée en base avant l'exécution :
+un doublon concurrent reçoit 409 tant que la requête d'origine n'est pas
+terminée. Une clé réutilisée pour une autre requête (chemin ou corps différent)
+est refusée avec 422. Les clés expirent après IDEMPOTENCY_KEY_TTL et sont
+supprimées par la tâche périodique idempotency.purge.
+"""
+import hashlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, ParseError
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+REPLAY_HEADER = 'Idempotent-Replayed'
+
+
+class IdempotencyConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "Une requête avec cette clé d'idempotence est en cours de traitement."
+    default_code = 'idempotency_conflict'
+    # Retry-After ajouté par le gestionnaire d'exceptions de DRF
+    wait = 1
+
+
+class IdempotencyKeyReused(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = "Cette clé d'idempotence a déjà servi pour une autre requête."
+    default_code = 'idempotency_key_reused'
+
+
+class IdempotentReplay(Exception):
+    """Interrompt le traitement pour renvoyer la réponse mémorisée"""
+
+    def __init__(self, response):
+        self.response = response
+
+
+def request_fingerprint(request):
+    """Empreinte de la méthode, du chemin et du corps de la requête"""
+    digest = hashlib.sha256(f"{request.method} {request.get_full_path()}\n".encode())
+    if request.content_type.startswith('multipart/'):
+        # Le corps brut d'un envoi de fichier peut dépasser DATA_UPLOAD_MAX_MEMORY_SIZE
+        for name, values in sorted(request.POST.lists()):
+            digest.update(f"{name}={values!r}\n".encode())
+        for name, files in sorted(request.FILES.lists()):
+            for uploaded in files:
+                digest.update(f"{name}:{uploaded.name}:{uploaded.size}\n".encode())
+                for chunk in uploaded.chunks():
+                    digest.update(chunk)
+                uploaded.seek(0)
+    else:
+        digest.update(request.body)
+    return digest.hexdigest()
+
+
+def reserve(request, key):
+    """
+    Réserve la clé pour cette requête ; renvoie l'enregistrement à compléter.
+
+    Lève IdempotentReplay si la requête a déjà été traitée, IdempotencyConflict
+    si elle est en cours, IdempotencyKeyReused si la clé a servi à autre chose.
+    """
+    user = request.user if request.user.is_authenticated else None
+    fingerprint = request_fingerprint(request)
+    now = timezone.now()
+    try:
+        # Insertion validée immédiatement : visible des doublons concurrents
+        with transaction.atomic():
+            return IdempotencyKey.objects.create(
+                key=key, user=user, method=request.method, path=request.path[:500], fingerprint=fingerprint,
+                expires_at=now + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL),
+            )
+    except IntegrityError:
+        pass
+
+    existing = IdempotencyKey.objects.filter(key=key, user=user).first()
+    if existing is None:
+        # La requête d'origine vient d'échouer et de libérer la clé : le client peut réessayer
+        raise IdempotencyConflict()
+    if existing.expires_at <= now:
+        # Clé expirée pas encore purgée : on la reprend
+        IdempotencyKey.objects.filter(pk=existing.pk, expires_at__lte=now).delete()
+        return reserve(request, key)
+    if existing.fingerprint != fingerprint:
+        raise IdempotencyKeyReused()
+    if existing.status_code is None:
+        raise IdempotencyConflict()
+    response = Response(existing.response_body, status=existing.status_code)
+    response[REPLAY_HEADER] = 'true'
+    raise IdempotentReplay(response)
+
+
+def complete(record, response):
+    """Mémorise la réponse ; libère la clé si la requête n'a pas abouti côté serveur"""
+    if isinstance(response, Response) and response.status_code < 500:
+        IdempotencyKey.objects.filter(pk=record.pk).update(status_code=response.status_code,
+                                                          response_body=response.data)
+    else:
+        # Erreur serveur ou réponse non rejouable (fichier) : le client pourra réessayer
+        IdempotencyKey.objects.filter(pk=record.pk).delete()
+
+
+class IdempotencyMixin:
+    """Prend en charge l'en-tête Idempotency-Key sur les actions d'écriture d'un ViewSet"""
+
+    def initial(self, request, *args, **kwargs):
+        self.idempotency_record = None
+        # Authentification, permissions et limites de débit d'abord : une requête refusée ne réserve rien
+        super().initial(request, *args, **kwargs)
+        key = request.headers.get(HEADER)
+        if key is None or request.method in SAFE_METHODS:
+            return
+        key = key.strip()
+        if not key or len(key) > 255:
+            raise ParseError("L'en-tête Idempotency-Key doit comporter de 1 à 255 caractères.")
+        self.idempotency_record = reserve(request, key)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, IdempotentReplay):
+            return exc.response
+        try:
+            return super().handle_exception(exc)
+        except Exception:
+            # Exception non gérée (erreur 500) : la clé est libérée pour un nouvel essai
+            record = getattr(self, 'idempotency_record', None)
+            if record is not None:
+                self.idempotency_record = None
+                IdempotencyKey.objects.filter(pk=record.pk).delete()
+            raise
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        record = getattr(self, 'idempotency_record', None)
+        if record is not None:
+            self.idempotency_record = None
+            complete(record, response)
+        return response
@@ -0,0 +1,441 @@
+"""
+Import en flux du catalogue produits et du stock d'ouverture (CSV ou XLSX).
+
+Le fichier est lu ligne à ligne, validé puis écrit par paquets : catégories et
+fournisseurs sont rapprochés par nom, les produits par référence et insérés ou
+mis à jour en une requête par paquet. Le stock d'ouverture est enregistré sous
+forme de mouvements d'ajustement. En mode simulation, tout est exécuté puis
+annulé, ce qui donne le même rapport d'erreurs sans rien enregistrer.
+
+Les taux de change datés (RateImporter) suivent le même chemin : lecture en
+flux, validation ligne à ligne, upsert par paquets sur (devise, date).
+
+Un import écrit dans la boutique courante au moment où il est créé : les
+rapprochements et upserts portent sur les index (boutique, nom), (boutique,
+référence) et (boutique, devise, date).
+"""
+import csv
+import io
+import itertools
+import time
+from datetime import date, datetime
+from functools import partial
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .currency import rates, reapply_rates
+from .models import ExchangeRate, Product, ProductCategory, Supplier, StockMovement
+from .tenancy import active_tenant_id
+
+COLUMN_ALIASES = {
+    'reference': ('reference', 'référence', 'ref', 'sku'),
+    'name': ('name', 'nom', 'designation', 'désignation'),
+    'category': ('category', 'catégorie', 'categorie'),
+    'supplier': ('supplier', 'fournisseur'),
+    'buying_price': ('buying_price', 'prix_achat', "prix_d'achat"),
+    'selling_price': ('selling_price', 'prix_vente', 'prix_de_vente'),
+    'min_stock_level': ('min_stock_level', 'stock_minimum', 'niveau_minimum_de_stock'),
+    'description': ('description',),
+    'opening_stock': ('opening_stock', 'stock_initial', 'stock_ouverture', 'stock'),
+}
+REQUIRED_COLUMNS = ('reference', 'name', 'buying_price', 'selling_price')
+
+TEXT_LIMITS = {'reference': 50, 'name': 100, 'category': 100, 'supplier': 100}
+MAX_PRICE = Decimal('99999999.99')
+CENT = Decimal('0.01')
+
+STOCK_MOVEMENT_REFERENCE = "Import catalogue"
+
+RATE_COLUMN_ALIASES = {
+    'currency': ('currency', 'devise', 'code'),
+    'date': ('date', 'jour'),
+    'rate': ('rate', 'taux', 'cours'),
+}
+RATE_REQUIRED_COLUMNS = ('currency', 'date', 'rate')
+RATE_PRECISION = Decimal('0.00000001')
+MAX_RATE = Decimal('9999999999')
+
+
+class ImportFormatError(ValueError):
+    """Fichier illisible ou en-tête incomplet"""
+
+
+def _normalize_header(value):
+    return str(value or '').strip().lower().replace(' ', '_').replace('-', '_')
+
+
+def _map_columns(header, column_aliases, required_columns):
+    lookup = {alias: field for field, aliases in column_aliases.items() for alias in aliases}
+    columns = {}
+    for index, name in enumerate(header):
+        field = lookup.get(_normalize_header(name))
+        if field and field not in columns:
+            columns[field] = index
+    missing = [field for field in required_columns if field not in columns]
+    if missing:
+        raise ImportFormatError(f"Colonnes obligatoires absentes : {', '.join(missing)}")
+    return columns
+
+
+def read_rows(stream, filename, column_aliases=COLUMN_ALIASES, required_columns=REQUIRED_COLUMNS):
+    """
+    Lit un fichier CSV ou XLSX sans le charger en mémoire.
+
+    Renvoie (colonnes, lignes) : colonnes associe chaque champ connu à son index,
+    lignes itère sur (numéro de ligne dans le fichier, valeurs).
+    """
+    if filename.lower().endswith('.xlsx'):
+        from openpyxl import load_workbook
+
+        try:
+            workbook = load_workbook(stream, read_only=True, data_only=True)
+        except Exception as error:
+            raise ImportFormatError(f"Classeur XLSX illisible : {error}")
+        rows = workbook.active.iter_rows(values_only=True)
+    elif filename.lower().endswith(('.csv', '.txt')):
+        text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+        try:
+            first_line = text.readline()
+        except UnicodeDecodeError:
+            raise ImportFormatError("Le fichier CSV doit être encodé en UTF-8.")
+        # Les tableurs français exportent souvent avec des points-virgules
+        delimiter = ';' if first_line.count(';') > first_line.count(',') else ','
+        rows = csv.reader(itertools.chain([first_line], text), delimiter=delimiter)
+    else:
+        raise ImportFormatError("Format non pris en charge : fichier .csv ou .xlsx attendu.")
+
+    header = next(rows, None)
+    if header is None:
+        raise ImportFormatError("Le fichier est vide.")
+    return _map_columns(header, column_aliases, required_columns), enumerate(rows, start=2)
+
+
+def _text(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _decimal(value):
+    if isinstance(value, float):
+        value = repr(value)
+    value = Decimal(str(value).strip().replace(' ', '').replace(',', '.'))
+    if not value.is_finite():
+        raise InvalidOperation
+    return value.quantize(CENT)
+
+
+def _integer(value):
+    number = _decimal(value)
+    if number != number.to_integral_value():
+        raise InvalidOperation
+    return int(number)
+
+
+def clean_row(values, columns):
+    """Convertit et valide une ligne ; renvoie (données, erreurs par champ)"""
+    data = {}
+    errors = {}
+    for field, index in columns.items():
+        raw = values[index] if index < len(values) else None
+        value = _text(raw)
+        if value is None:
+            if field in REQUIRED_COLUMNS:
+                errors[field] = ["Ce champ est obligatoire."]
+            data[field] = None
+            continue
+        if field in ('buying_price', 'selling_price'):
+            try:
+                value = _decimal(raw)
+            except (InvalidOperation, ValueError):
+                errors[field] = ["Montant invalide."]
+                continue
+            if value < 0 or value > MAX_PRICE:
+                errors[field] = ["Montant hors limites."]
+                continue
+        elif field in ('min_stock_level', 'opening_stock'):
+            try:
+                value = _integer(raw)
+            except (InvalidOperation, ValueError):
+                errors[field] = ["Nombre entier attendu."]
+                continue
+            if value < 0:
+                errors[field] = ["La valeur doit être positive."]
+                continue
+        elif field in TEXT_LIMITS and len(value) > TEXT_LIMITS[field]:
+            errors[field] = [f"{TEXT_LIMITS[field]} caractères au maximum."]
+            continue
+        data[field] = value
+    return data, errors
+
+
+class CatalogImporter:
+    """Importe un fichier de catalogue par paquets et construit le rapport d'import"""
+
+    def __init__(self, dry_run=False, chunk_size=None, max_errors=None):
+        self.tenant_id = active_tenant_id()
+        self.dry_run = dry_run
+        self.chunk_size = chunk_size or settings.IMPORT_CHUNK_SIZE
+        self.max_errors = settings.IMPORT_MAX_ERRORS if max_errors is None else max_errors
+        self.categories = {}
+        self.suppliers = {}
+        self.seen_references = {}
+        self.report = {
+            'dry_run': dry_run,
+            'rows': 0,
+            'created': 0,
+            'updated': 0,
+            'skipped': 0,
+            'categories_created': 0,
+            'suppliers_created': 0,
+            'stock_movements': 0,
+            'error_count': 0,
+            'errors': [],
+        }
+
+    def run(self, stream, filename):
+        started = time.perf_counter()
+        columns, rows = read_rows(stream, filename)
+        self.columns = columns
+        # Colonnes absentes du fichier : valeurs existantes conservées
+        self.update_fields = [field for field in ('name', 'category', 'supplier', 'buying_price', 'selling_price',
+                                                  'min_stock_level', 'description') if field in columns]
+        if 'opening_stock' in columns:
+            self.update_fields.append('stock_quantity')
+        self.update_fields.append('updated_at')
+
+        if self.dry_run:
+            with transaction.atomic():
+                self._consume(rows)
+                transaction.set_rollback(True)
+        else:
+            self._consume(rows)
+        self.report['elapsed'] = round(time.perf_counter() - started, 2)
+        return self.report
+
+    def _error(self, line, reference, errors):
+        self.report['skipped'] += 1
+        self.report['error_count'] += 1
+        if len(self.report['errors']) < self.max_errors:
+            self.report['errors'].append({'line': line, 'reference': reference, 'errors': errors})
+
+    def _consume(self, rows):
+        chunk = []
+        for line, values in rows:
+            if not any(value not in (None, '') for value in values):
+                continue
+            self.report['rows'] += 1
+            data, errors = clean_row(values, self.columns)
+            reference = data.get('reference')
+            if reference and reference in self.seen_references:
+                errors['reference'] = [f"Référence déjà présente à la ligne {self.seen_references[reference]}."]
+            if errors:
+                self._error(line, reference, errors)
+                continue
+            self.seen_references[reference] = line
+            chunk.append(data)
+            if len(chunk) >= self.chunk_size:
+                self._write(chunk)
+                chunk = []
+        if chunk:
+            self._write(chunk)
+
+    def _resolve(self, model, cache, names, counter):
+        """Identifiants des catégories ou fournisseurs d'un paquet, créés au besoin"""
+        missing = {name for name in names if name and name not in cache}
+        if not missing:
+            return
+        rows = model.all_tenants.filter(tenant_id=self.tenant_id)
+        cache.update(rows.filter(name__in=missing).values_list('name', 'id'))
+        new = missing - cache.keys()
+        if new:
+            model.all_tenants.bulk_create([model(tenant_id=self.tenant_id, name=name) for name in sorted(new)],
+                                          ignore_conflicts=True)
+            cache.update(rows.filter(name__in=new).values_list('name', 'id'))
+            self.report[counter] += len(new)
+
+    def _write(self, chunk):
+        with transaction.atomic():
+            self._resolve(ProductCategory, self.categories, {row.get('category') for row in chunk},
+                          'categories_created')
+            self._resolve(Supplier, self.suppliers, {row.get('supplier') for row in chunk}, 'suppliers_created')
+
+            references = [row['reference'] for row in chunk]
+            existing = {
+                reference: (product_id, stock)
+                for reference, product_id, stock in Product.all_tenants
+                .filter(tenant_id=self.tenant_id, reference__in=references)
+                .values_list('reference', 'id', 'stock_quantity')
+            }
+
+            products = []
+            for row in chunk:
+                current = existing.get(row['reference'])
+                opening = row.get('opening_stock')
+                product = Product(
+                    tenant_id=self.tenant_id,
+                    reference=row['reference'],
+                    name=row['name'],
+                    category_id=self.categories.get(row.get('category')),
+                    supplier_id=self.suppliers.get(row.get('supplier')),
+                    buying_price=row['buying_price'],
+                    selling_price=row['selling_price'],
+                    description=row.get('description'),
+                    stock_quantity=opening if opening is not None else (current[1] if current else 0),
+                )
+                if row.get('min_stock_level') is not None:
+                    product.min_stock_level = row['min_stock_level']
+                products.append(product)
+            Product.all_tenants.bulk_create(products, batch_size=1000, update_conflicts=True,
+                                            unique_fields=['tenant', 'reference'], update_fields=self.update_fields)
+            self.report['updated'] += len(existing)
+            self.report['created'] += len(chunk) - len(existing)
+
+            if 'opening_stock' in self.columns:
+                self._opening_stock(chunk, existing)
+
+    def _opening_stock(self, chunk, existing):
+        """Ajustements de stock entre le stock connu et le stock d'ouverture du fichier"""
+        with_stock = [row for row in chunk if row.get('opening_stock') is not None]
+        new_references = [row['reference'] for row in with_stock if row['reference'] not in existing]
+        # Les identifiants des produits créés ne sont pas renvoyés par un upsert
+        created = dict(Product.all_tenants.filter(tenant_id=self.tenant_id, reference__in=new_references)
+                       .values_list('reference', 'id'))
+
+        now = timezone.now()
+        movements = []
+        for row in with_stock:
+            product_id, stock = existing.get(row['reference']) or (created[row['reference']], 0)
+            delta = row['opening_stock'] - stock
+            if delta:
+                movements.append(StockMovement(tenant_id=self.tenant_id, product_id=product_id, quantity=delta,
+                                               movement_type='adjustment', reference=STOCK_MOVEMENT_REFERENCE,
+                                               date=now, notes="Stock d'ouverture"))
+        # bulk_create n'appelle pas StockMovement.save() : le stock a déjà été fixé par l'upsert
+        StockMovement.all_tenants.bulk_create(movements, batch_size=1000)
+        self.report['stock_movements'] += len(movements)
+
+
+def _day(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    value = str(value).strip()
+    for parse in (date.fromisoformat, lambda text: datetime.strptime(text, '%d/%m/%Y').date()):
+        try:
+            return parse(value)
+        except ValueError:
+            continue
+    raise ValueError(value)
+
+
+def clean_rate_row(values, columns):
+    """Convertit et valide une ligne de taux ; renvoie (données, erreurs par champ)"""
+    raw = {field: values[index] if index < len(values) else None for field, index in columns.items()}
+    data, errors = {}, {}
+    for field in RATE_REQUIRED_COLUMNS:
+        if _text(raw[field]) is None:
+            errors[field] = ["Ce champ est obligatoire."]
+    if errors:
+        return data, errors
+    currency = _text(raw['currency']).upper()
+    if len(currency) != 3 or not currency.isalpha():
+        errors['currency'] = ["Code devise ISO 4217 attendu (par exemple EUR, USD)."]
+    data['currency'] = currency
+    try:
+        data['date'] = _day(raw['date'])
+    except ValueError:
+        errors['date'] = ["Date invalide (AAAA-MM-JJ ou JJ/MM/AAAA)."]
+    try:
+        value = raw['rate']
+        value = Decimal(repr(value) if isinstance(value, float) else str(value).strip().replace(',', '.'))
+        if not value.is_finite():
+            raise InvalidOperation
+        data['rate'] = value.quantize(RATE_PRECISION)
+        if not 0 < data['rate'] < MAX_RATE:
+            errors['rate'] = ["Le taux doit être strictement positif."]
+    except (InvalidOperation, ValueError):
+        errors['rate'] = ["Taux invalide."]
+    return data, errors
+
+
+class RateImporter:
+    """
+    Importe des taux de change datés par paquets ; un taux déjà connu pour la
+    même devise et la même date est remplacé. Avec reapply, les documents et
+    paiements datés à partir du premier taux importé sont reconvertis.
+    """
+
+    def __init__(self, dry_run=False, chunk_size=None, max_errors=None, reapply=False):
+        self.tenant_id = active_tenant_id()
+        self.dry_run = dry_run
+        self.chunk_size = chunk_size or settings.IMPORT_CHUNK_SIZE
+        self.max_errors = settings.IMPORT_MAX_ERRORS if max_errors is None else max_errors
+        self.reapply = reapply
+        self.first_dates = {}
+        self.report = {
+            'dry_run': dry_run,
+            'rows': 0,
+            'imported': 0,
+            'skipped': 0,
+            'reapplied': 0,
+            'currencies': [],
+            'error_count': 0,
+            'errors': [],
+        }
+
+    def run(self, stream, filename):
+        started = time.perf_counter()
+        columns, rows = read_rows(stream, filename, RATE_COLUMN_ALIASES, RATE_REQUIRED_COLUMNS)
+        with transaction.atomic():
+            self._consume(columns, rows)
+            if self.dry_run:
+                transaction.set_rollback(True)
+            else:
+                # Les autres processus rechargent leurs taux à l'expiration de FX_RATE_CACHE_TTL
+                for currency in self.first_dates:
+                    rates.invalidate(self.tenant_id, currency)
+                    transaction.on_commit(partial(rates.invalidate, self.tenant_id, currency))
+                if self.reapply and self.first_dates:
+                    self.report['reapplied'] = reapply_rates(list(self.first_dates), min(self.first_dates.values()),
+                                                             self.tenant_id)
+        self.report['currencies'] = sorted(self.first_dates)
+        self.report['elapsed'] = round(time.perf_counter() - started, 2)
+        return self.report
+
+    def _consume(self, columns, rows):
+        chunk = {}
+        for line, values in rows:
+            if not any(value not in (None, '') for value in values):
+                continue
+            self.report['rows'] += 1
+            data, errors = clean_rate_row(values, columns)
+            if errors:
+                self.report['skipped'] += 1
+                self.report['error_count'] += 1
+                if len(self.report['errors']) < self.max_errors:
+                    self.report['errors'].append({'line': line, 'errors': errors})
+                continue
+            # Une même devise et une même date en double dans le fichier : la dernière ligne l'emporte
+            chunk[data['currency'], data['date']] = data['rate']
+            if len(chunk) >= self.chunk_size:
+                self._write(chunk)
+                chunk = {}
+        if chunk:
+            self._write(chunk)
+
+    def _write(self, chunk):
+        ExchangeRate.all_tenants.bulk_create(
+            [ExchangeRate(tenant_id=self.tenant_id, currency=currency, date=day, rate=rate)
+             for (currency, day), rate in chunk.items()],
+            batch_size=1000, update_conflicts=True, unique_fields=['tenant', 'currency', 'date'],
+            update_fields=['rate'],
+        )
+        for currency, day in chunk:
+            self.first_dates[currency] = min(day, self.first_dates.get(currency, day))
+        self.report['imported'] += len(chunk)
@@ -0,0 +1,278 @@
+"""Génération des factures au format PDF, individuellement ou par lots"""
+import hashlib
+import json
+import os
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import F, Max
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.pdfgen import canvas
+
+from .models import ArchivedInvoice, Invoice, InvoiceSequence
+from .tenancy import namespace
+
+# À incrémenter à chaque modification de la mise en page pour invalider le cache
+TEMPLATE_VERSION = 1
+
+PDF_DIRECTORY = 'invoices/pdf'
+INVOICE_NUMBER_FORMAT = 'INV-{:05d}'
+
+
+def next_invoice_number(tenant_id):
+    """
+    Numéro de la prochaine facture de la boutique. La ligne de numérotation
+    reste verrouillée jusqu'à la fin de la transaction de l'appelant : deux
+    factures simultanées ne reçoivent jamais le même numéro, et les boutiques
+    ne s'attendent pas entre elles.
+    """
+    with transaction.atomic():
+        if not InvoiceSequence.objects.filter(pk=tenant_id).update(last_number=F('last_number') + 1):
+            # Première facture depuis la mise en place des numérotations : reprise après les numéros
+            # existants, qui suivaient les identifiants
+            last = max(model.all_tenants.filter(tenant_id=tenant_id).aggregate(last=Max('id'))['last'] or 0
+                       for model in (Invoice, ArchivedInvoice))
+            try:
+                with transaction.atomic():
+                    InvoiceSequence.objects.create(tenant_id=tenant_id, last_number=last + 1)
+            except IntegrityError:
+                InvoiceSequence.objects.filter(pk=tenant_id).update(last_number=F('last_number') + 1)
+        number = InvoiceSequence.objects.filter(pk=tenant_id).values_list('last_number', flat=True).get()
+    return INVOICE_NUMBER_FORMAT.format(number)
+
+
+def with_pdf_relations(queryset):
+    """Précharge tout ce dont le rendu a besoin pour éviter les requêtes par facture"""
+    return queryset.select_related('sale__customer').prefetch_related(
+        'sale__items__product', 'sale__payments'
+    )
+
+
+def build_invoice_payload(invoice):
+    """Extrait de la facture un dictionnaire simple, stable et sérialisable"""
+    sale = invoice.sale
+    customer = sale.customer
+    items = []
+    total = Decimal('0')
+    for item in sale.items.all():
+        items.append({
+            'product': item.product.name,
+            'reference': item.product.reference or '',
+            'quantity': item.quantity,
+            'unit_price': str(item.unit_price),
+            'discount': str(item.discount),
+            'total_price': str(item.total_price),
+        })
+        total += item.total_price
+    paid = sum((payment.amount for payment in sale.payments.all()), Decimal('0'))
+
+    return {
+        'template_version': TEMPLATE_VERSION,
+        'company': settings.INVOICE_COMPANY_NAME,
+        'invoice_number': invoice.invoice_number,
+        'issue_date': invoice.issue_date.isoformat() if invoice.issue_date else '',
+        'due_date': invoice.due_date.isoformat() if invoice.due_date else '',
+        'status': invoice.get_status_display(),
+        'notes': invoice.notes or '',
+        'sale_id': sale.id,
+        'sale_reference': sale.reference or '',
+        'sale_date': sale.sale_date.isoformat() if sale.sale_date else '',
+        'customer': {
+            'name': customer.name,
+            'address': customer.address or '',
+            'phone': customer.phone or '',
+            'email': customer.email or '',
+        },
+        'items': items,
+        'currency': sale.currency,
+        'total_amount': str(total),
+        'total_paid': str(paid),
+        'balance_due': str(total - paid),
+    }
+
+
+def payload_hash(payload):
+    """Empreinte du contenu : une facture inchangée garde la même empreinte"""
+    encoded = json.dumps(payload, sort_keys=True, separators=(',', ':')).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def invoice_pdf_path(tenant_id, invoice_id, digest):
+    """Chemin du document en cache pour une facture et une empreinte données, dans le dossier de sa boutique"""
+    return f"{PDF_DIRECTORY}/{namespace(tenant_id)}/{invoice_id}/{digest[:24]}.pdf"
+
+
+def render_invoice_pdf(payload):
+    """Dessine la facture et renvoie le contenu du PDF"""
+    buffer = BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4, pageCompression=1)
+    pdf.setTitle(f"Facture {payload['invoice_number']}")
+    width, height = A4
+    left = 20 * mm
+    right = width - 20 * mm
+
+    def header():
+        pdf.setFont('Helvetica-Bold', 16)
+        pdf.drawString(left, height - 25 * mm, payload['company'])
+        pdf.setFont('Helvetica-Bold', 12)
+        pdf.drawRightString(right, height - 25 * mm, f"Facture {payload['invoice_number']}")
+        pdf.setFont('Helvetica', 9)
+        pdf.drawRightString(right, height - 31 * mm, f"Date d'émission : {payload['issue_date']}")
+        if payload['due_date']:
+            pdf.drawRightString(right, height - 36 * mm, f"Date d'échéance : {payload['due_date']}")
+        pdf.drawRightString(right, height - 41 * mm, f"Statut : {payload['status']}")
+
+    def table_header(y):
+        pdf.setFont('Helvetica-Bold', 9)
+        pdf.drawString(left, y, "Produit")
+        pdf.drawString(left + 80 * mm, y, "Référence")
+        pdf.drawRightString(left + 125 * mm, y, "Qté")
+        pdf.drawRightString(left + 145 * mm, y, "Prix unitaire")
+        pdf.drawRightString(right, y, "Total")
+        pdf.line(left, y - 2 * mm, right, y - 2 * mm)
+        pdf.setFont('Helvetica', 9)
+        return y - 7 * mm
+
+    header()
+    customer = payload['customer']
+    y = height - 55 * mm
+    pdf.setFont('Helvetica-Bold', 10)
+    pdf.drawString(left, y, "Facturé à")
+    pdf.setFont('Helvetica', 9)
+    for line in [customer['name'], *customer['address'].splitlines(), customer['phone'], customer['email']]:
+        if line:
+            y -= 5 * mm
+            pdf.drawString(left, y, line[:90])
+
+    y -= 8 * mm
+    sale_label = f"Vente #{payload['sale_id']} du {payload['sale_date']}"
+    if payload['sale_reference']:
+        sale_label += f" (réf. {payload['sale_reference']})"
+    pdf.drawString(left, y, sale_label)
+
+    y = table_header(y - 10 * mm)
+    for item in payload['items']:
+        if y < 40 * mm:
+            pdf.showPage()
+            header()
+            y = table_header(height - 55 * mm)
+        pdf.drawString(left, y, item['product'][:45])
+        pdf.drawString(left + 80 * mm, y, item['reference'][:20])
+        pdf.drawRightString(left + 125 * mm, y, str(item['quantity']))
+        pdf.drawRightString(left + 145 * mm, y, item['unit_price'])
+        pdf.drawRightString(right, y, item['total_price'])
+        y -= 6 * mm
+
+    pdf.line(left, y + 2 * mm, right, y + 2 * mm)
+    y -= 4 * mm
+    for label, value in ((f"Total ({payload['currency']})", payload['total_amount']),
+                         ("Déjà payé", payload['total_paid']),
+                         ("Reste à payer", payload['balance_due'])):
+        pdf.drawRightString(left + 145 * mm, y, label)
+        pdf.drawRightString(right, y, value)
+        y -= 6 * mm
+
+    if payload['notes']:
+        y -= 6 * mm
+        for line in payload['notes'].splitlines()[:10]:
+            pdf.drawString(left, y, line[:110])
+            y -= 5 * mm
+
+    pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
+
+
+def _render_to_path(job):
+    """Tâche exécutée dans le pool de processus"""
+    path, payload = job
+    return path, render_invoice_pdf(payload)
+
+
+def _store(path, content):
+    """
+    Enregistre un document et supprime les anciennes versions de la même facture.
+
+    Un rendu concurrent de la même facture a pu enregistrer ce document ou une
+    version plus récente entre-temps : le document existant est conservé, et
+    seules les versions antérieures à celle-ci sont supprimées.
+    """
+    if default_storage.exists(path):
+        return
+    saved = default_storage.save(path, ContentFile(content))
+    if saved != path:
+        # Enregistré sous un autre nom : le même document vient d'être écrit par un autre rendu
+        default_storage.delete(saved)
+    directory = os.path.dirname(path)
+    try:
+        saved_at = default_storage.get_modified_time(path)
+    except FileNotFoundError:
+        return
+    for name in default_storage.listdir(directory)[1]:
+        stale = f"{directory}/{name}"
+        if stale == path:
+            continue
+        try:
+            if default_storage.get_modified_time(stale) <= saved_at:
+                default_storage.delete(stale)
+        except FileNotFoundError:
+            # Déjà supprimé par un autre rendu
+            pass
+
+
+def render_invoices(invoices, workers=None):
+    """
+    Génère les PDF d'un lot de factures et renvoie la liste (facture, chemin).
+
+    Seules les factures dont le contenu a changé depuis le dernier rendu sont
+    redessinées ; les autres sont servies depuis le cache. Avec plusieurs
+    processus (workers, INVOICE_PDF_WORKERS par défaut), le rendu se fait dans un
+    pool de processus dès qu'il y a plus d'un document à produire : réservé aux
+    tâches et commandes, une requête rend ses documents dans son processus
+    (workers=1).
+    """
+    workers = workers or settings.INVOICE_PDF_WORKERS or os.cpu_count() or 1
+    entries = []
+    missing = []
+    for invoice in invoices:
+        payload = build_invoice_payload(invoice)
+        path = invoice_pdf_path(invoice.tenant_id, invoice.id, payload_hash(payload))
+        entries.append((invoice, path))
+        if not default_storage.exists(path):
+            missing.append((path, payload))
+
+    if len(missing) > 1 and workers > 1:
+        chunksize = max(1, len(missing) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=min(workers, len(missing))) as pool:
+            for path, content in pool.map(_render_to_path, missing, chunksize=chunksize):
+                _store(path, content)
+    else:
+        for job in missing:
+            _store(*_render_to_path(job))
+
+    return entries
+
+
+def get_invoice_pdf(invoice):
+    """Renvoie le chemin du PDF d'une facture, en le générant si nécessaire"""
+    return render_invoices([invoice], workers=1)[0][1]
+
+
+def build_invoices_zip(entries):
+    """Assemble les PDF d'un lot dans une archive zip temporaire"""
+    archive = tempfile.SpooledTemporaryFile(max_size=32 * 1024 * 1024)
+    # Les PDF sont déjà compressés, inutile de les recompresser
+    with zipfile.ZipFile(archive, 'w', compression=zipfile.ZIP_STORED) as bundle:
+        for invoice, path in entries:
+            with default_storage.open(path, 'rb') as document:
+                bundle.writestr(f"{invoice.invoice_number}.pdf", document.read())
+    archive.seek(0)
+    return archive
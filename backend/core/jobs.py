@@ -0,0 +1,242 @@
+"""
+File de tâches en arrière-plan stockée en base de données, sans broker externe.
+
+Les tâches sont des fonctions déclarées avec @task dans les modules tasks.py des
+applications ; elles reçoivent la tâche (Job) puis ses paramètres. enqueue()
+ajoute une exécution, la commande run_workers les traite.
+
+Sur PostgreSQL, chaque worker prend une tâche avec SELECT ... FOR UPDATE SKIP
+LOCKED : plusieurs workers, dans un ou plusieurs processus, ne prennent jamais la
+même tâche et ne s'attendent pas. Sur SQLite, qui sérialise les écritures, une
+mise à jour conditionnelle du statut joue le même rôle.
+
+La file est commune à toutes les boutiques ; une tâche ajoutée pendant une
+requête garde la boutique de celle-ci et s'exécute dans cette boutique. Les
+tâches périodiques, sans boutique, portent sur toutes les boutiques.
+"""
+import logging
+import os
+import random
+import socket
+import threading
+import traceback
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules
+
+from .models import Job
+from .tenancy import current_tenant_id, tenant_context
+
+logger = logging.getLogger('core.jobs')
+
+FINISHED_STATUSES = ('succeeded', 'failed', 'cancelled')
+
+_registry = {}
+
+
+class Task:
+    """Tâche enregistrée : fonction, nombre de tentatives, périodicité éventuelle"""
+
+    def __init__(self, func, name, max_attempts, every):
+        self.func = func
+        self.name = name
+        self.max_attempts = max_attempts
+        self.every = every
+
+
+def task(name=None, max_attempts=None, every=None):
+    """
+    Déclare une fonction comme tâche : func(job, **payload).
+
+    every (timedelta) rend la tâche périodique : une exécution par créneau,
+    quel que soit le nombre de workers.
+    """
+    def decorator(func):
+        task_name = name or f"{func.__module__}.{func.__name__}"
+        _registry[task_name] = Task(func, task_name, max_attempts or settings.JOB_MAX_ATTEMPTS, every)
+        func.task_name = task_name
+        return func
+    return decorator
+
+
+def autodiscover():
+    """Importe les modules tasks.py des applications installées"""
+    autodiscover_modules('tasks')
+
+
+def get_task(name):
+    return _registry.get(name)
+
+
+def enqueue(name, payload=None, run_at=None, delay=None, priority=0, max_attempts=None, user=None,
+            dedupe_key=None):
+    """Ajoute une exécution de la tâche ; run_at ou delay (timedelta) la planifient plus tard"""
+    registered = get_task(name)
+    if registered is None:
+        raise ValueError(f"Tâche inconnue : {name}")
+    if run_at is None:
+        run_at = timezone.now() + delay if delay else timezone.now()
+    return Job.all_tenants.create(
+        tenant_id=current_tenant_id(),
+        name=name,
+        payload=payload or {},
+        run_at=run_at,
+        priority=priority,
+        max_attempts=max_attempts or registered.max_attempts,
+        created_by=user if user is not None and user.is_authenticated else None,
+        dedupe_key=dedupe_key,
+    )
+
+
+def claim_job(worker):
+    """Prend la prochaine tâche à exécuter et la marque en cours ; None si la file est vide"""
+    now = timezone.now()
+    queue = Job.all_tenants.filter(status='pending', run_at__lte=now).order_by('-priority', 'run_at', 'id')
+    claimed = {'status': 'running', 'locked_by': worker, 'locked_at': now, 'started_at': now,
+               'attempts': F('attempts') + 1}
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            job_id = queue.select_for_update(skip_locked=True).values_list('id', flat=True).first()
+            if job_id is None:
+                return None
+            Job.all_tenants.filter(pk=job_id).update(**claimed)
+        return Job.all_tenants.get(pk=job_id)
+
+    # SQLite : pas de verrou de ligne, mais une seule écriture à la fois ; la mise à jour
+    # conditionnelle ne réussit que pour un seul worker
+    for job_id in queue.values_list('id', flat=True)[:10]:
+        if Job.all_tenants.filter(pk=job_id, status='pending').update(**claimed):
+            return Job.all_tenants.get(pk=job_id)
+    return None
+
+
+def retry_delay(attempts):
+    """Attente exponentielle avant une nouvelle tentative, avec une part d'aléa"""
+    delay = min(settings.JOB_RETRY_MAX_DELAY, settings.JOB_RETRY_BASE_DELAY * 2 ** max(0, attempts - 1))
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def execute_job(job, worker):
+    """Exécute une tâche prise par ce worker et enregistre son issue"""
+    mine = Job.all_tenants.filter(pk=job.pk, locked_by=worker, status='running')
+    registered = get_task(job.name)
+    if registered is None:
+        mine.update(status='failed', last_error=f"Tâche inconnue : {job.name}", finished_at=timezone.now())
+        return
+
+    try:
+        with tenant_context(job.tenant_id):
+            result = registered.func(job, **job.payload)
+    except Exception:
+        error = traceback.format_exc()[-5000:]
+        now = timezone.now()
+        if job.attempts < job.max_attempts:
+            mine.update(status='pending', run_at=now + retry_delay(job.attempts), last_error=error,
+                        locked_by='', locked_at=None)
+            logger.warning("Tâche %s en échec (tentative %s/%s), nouvel essai planifié",
+                           job, job.attempts, job.max_attempts)
+        else:
+            mine.update(status='failed', last_error=error, finished_at=now)
+            logger.error("Tâche %s définitivement en échec :\n%s", job, error)
+    else:
+        mine.update(status='succeeded', result=result, finished_at=timezone.now())
+
+
+def schedule_periodic(now=None):
+    """Crée l'exécution du créneau en cours de chaque tâche périodique (sans doublon)"""
+    now = now or timezone.now()
+    jobs = []
+    for registered in _registry.values():
+        if registered.every is None:
+            continue
+        interval = registered.every.total_seconds()
+        slot = int(now.timestamp() // interval * interval)
+        jobs.append(Job(
+            name=registered.name,
+            run_at=datetime.fromtimestamp(slot, tz=dt_timezone.utc),
+            max_attempts=registered.max_attempts,
+            dedupe_key=f"periodic:{registered.name}:{slot}",
+        ))
+    if jobs:
+        Job.all_tenants.bulk_create(jobs, ignore_conflicts=True)
+
+
+def requeue_stale(now=None):
+    """Remet en file les tâches dont le worker ne donne plus signe de vie"""
+    now = now or timezone.now()
+    stale = Job.all_tenants.filter(status='running', locked_at__lt=now - timedelta(seconds=settings.JOB_LOCK_TIMEOUT))
+    stale.filter(attempts__lt=F('max_attempts')).update(status='pending', run_at=now, locked_by='', locked_at=None,
+                                                        last_error="Worker interrompu")
+    stale.update(status='failed', finished_at=now, last_error="Worker interrompu")
+
+
+class WorkerPool:
+    """Workers (threads) d'un processus run_workers, plus l'ordonnanceur des tâches périodiques"""
+
+    def __init__(self, concurrency, poll_interval, once=False, log=None):
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.once = once
+        self.log = log or logger.info
+        self.stop_event = threading.Event()
+        self.identity = f"{socket.gethostname()}:{os.getpid()}"
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _work(self, index):
+        worker = f"{self.identity}:{index}"
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    job = claim_job(worker)
+                except DatabaseError:
+                    logger.exception("Impossible de lire la file de tâches")
+                    job = None
+                if job is None:
+                    if self.once:
+                        return
+                    self.stop_event.wait(self.poll_interval)
+                    continue
+                self.log(f"{worker} : {job} (tentative {job.attempts}/{job.max_attempts})")
+                execute_job(job, worker)
+                close_old_connections()
+        finally:
+            connection.close()
+
+    def _schedule(self):
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    schedule_periodic()
+                    requeue_stale()
+                except DatabaseError:
+                    logger.exception("Échec de la planification des tâches périodiques")
+                self.stop_event.wait(settings.JOB_SCHEDULER_INTERVAL)
+        finally:
+            connection.close()
+
+    def run(self):
+        if self.once:
+            schedule_periodic()
+            requeue_stale()
+        threads = [threading.Thread(target=self._work, args=(index,), name=f"job-worker-{index}")
+                   for index in range(self.concurrency)]
+        if not self.once:
+            threads.append(threading.Thread(target=self._schedule, name='job-scheduler'))
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                # join avec délai : laisse le thread principal recevoir les signaux
+                while thread.is_alive():
+                    thread.join(0.5)
+        except KeyboardInterrupt:
+            self.stop()
+            for thread in threads:
+                thread.join()
@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.archive import archive_history, pending_counts
+from core.tenancy import tenant_id_for
+
+
+class Command(BaseCommand):
+    help = ("Déplace vers les tables d'archive les ventes livrées et payées, les achats reçus et payés (avec "
+            "lignes, paiements et factures) et les mouvements de stock plus anciens que ARCHIVE_AFTER_DAYS jours, "
+            "par lots transactionnels. Les archives restent lisibles avec ?include_archived=1.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help="Ancienneté minimale en jours (par défaut : ARCHIVE_AFTER_DAYS)")
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help="Nombre de documents par transaction (par défaut : ARCHIVE_BATCH_SIZE)")
+        parser.add_argument('--tenant', default=None, help="Identifiant de la boutique (par défaut : toutes)")
+        parser.add_argument('--dry-run', action='store_true', help="Compte les documents à archiver sans rien déplacer")
+
+    def handle(self, *args, **options):
+        tenant_id = None
+        if options['tenant']:
+            tenant_id = tenant_id_for(options['tenant'])
+            if tenant_id is None:
+                raise CommandError(f"Boutique inconnue : {options['tenant']}")
+
+        if options['dry_run']:
+            counts = pending_counts(options['days'], tenant_id)
+            self.stdout.write(self.style.SUCCESS(
+                "Simulation : " + ", ".join(f"{count} {label}" for label, count in counts.items()) + " à archiver."))
+            return
+
+        started = time.perf_counter()
+
+        def progress(moved):
+            self.stdout.write(f"  {sum(moved.values())} lignes déplacées")
+
+        moved = archive_history(options['days'], options['batch_size'], tenant_id,
+                                progress if options['verbosity'] > 1 else None)
+        self.stdout.write(self.style.SUCCESS(
+            f"Archivage terminé en {time.perf_counter() - started:.2f} s : "
+            + ", ".join(f"{count} {label}" for label, count in moved.items()) + "."))
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+
+from core.models import Product
+from core.thumbnails import backfill_thumbnails
+
+
+class Command(BaseCommand):
+    help = "Génère les miniatures des images produits existantes qui n'en ont pas encore."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help="Traite aussi les produits dont les miniatures sont déjà enregistrées")
+        parser.add_argument('--workers', type=int, default=None,
+                            help="Nombre de processus de génération (par défaut : nombre de processeurs)")
+
+    def handle(self, *args, **options):
+        products = Product.objects.exclude(image__isnull=True).exclude(image='')
+        if not options['force']:
+            products = products.filter(image_hash__isnull=True)
+
+        by_image = {}
+        for product_id, name in products.values_list('id', 'image'):
+            by_image.setdefault(name, []).append(product_id)
+        if not by_image:
+            self.stdout.write("Aucune image à traiter.")
+            return
+
+        updates = []
+        failures = 0
+        for name, digest, error in backfill_thumbnails(list(by_image), workers=options['workers']):
+            if error:
+                failures += 1
+                self.stderr.write(f"{name} : {error}")
+                continue
+            updates.extend(Product(id=product_id, image_hash=digest) for product_id in by_image[name])
+        Product.objects.bulk_update(updates, ['image_hash'], batch_size=500)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(by_image) - failures} images traitées, {len(updates)} produits mis à jour, {failures} échecs."
+        ))
@@ -0,0 +1,68 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import get_runner, setup_test_environment, teardown_test_environment
+
+from core.benchmarks import SCENARIOS, compare, run_benchmarks
+
+
+class Command(BaseCommand):
+    help = ("Mesure la latence (p50/p95), le nombre de requêtes SQL et la mémoire allouée des points "
+            "d'entrée critiques à plusieurs échelles de données, et compare à une référence JSON. "
+            "Les mesures se font dans une base de test dédiée.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', default='0.05,0.25',
+                            help="Échelles de données séparées par des virgules (voir seed_data)")
+        parser.add_argument('--repeat', type=int, default=20, help="Nombre de mesures par scénario")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--baseline', default=os.path.join(settings.BASE_DIR, 'benchmarks', 'api_baseline.json'),
+                            help="Fichier JSON de référence")
+        parser.add_argument('--update-baseline', action='store_true',
+                            help="Enregistre les mesures comme nouvelle référence au lieu de comparer")
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help="Dégradation relative tolérée pour la latence et la mémoire (0.25 = +25 %%)")
+        parser.add_argument('--scenario', action='append', choices=[scenario.name for scenario in SCENARIOS],
+                            help="Limite la mesure à ce scénario (option répétable)")
+
+    def handle(self, *args, **options):
+        scales = [float(scale) for scale in options['scales'].split(',') if scale]
+
+        # L'inspection des requêtes remonte la pile à chaque requête SQL : elle fausserait les mesures
+        settings.QUERY_INSPECTOR_ENABLED = False
+        setup_test_environment(debug=False)
+        runner = get_runner(settings)(verbosity=0, interactive=False)
+        old_config = runner.setup_databases()
+        try:
+            results = run_benchmarks(scales, repeat=options['repeat'], seed=options['seed'],
+                                     log=self.stdout.write, only=options['scenario'])
+        finally:
+            runner.teardown_databases(old_config)
+            teardown_test_environment()
+
+        path = options['baseline']
+        if options['update_baseline']:
+            baseline = {}
+            if os.path.exists(path):
+                with open(path) as handle:
+                    baseline = json.load(handle)
+            for scale, scenarios in results.items():
+                baseline.setdefault(scale, {}).update(scenarios)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as handle:
+                json.dump(baseline, handle, indent=2, sort_keys=True)
+            self.stdout.write(self.style.SUCCESS(f"Référence enregistrée dans {path}"))
+            return
+
+        if not os.path.exists(path):
+            self.stdout.write(self.style.WARNING(
+                f"Aucune référence dans {path} : relancez avec --update-baseline pour en créer une."))
+            return
+
+        with open(path) as handle:
+            regressions = compare(results, json.load(handle), options['tolerance'])
+        if regressions:
+            raise CommandError("Régressions de performance :\n  " + "\n  ".join(regressions))
+        self.stdout.write(self.style.SUCCESS("Aucune régression par rapport à la référence."))
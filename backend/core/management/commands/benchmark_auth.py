@@ -0,0 +1,87 @@
+import statistics
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, get_runner, setup_test_environment, teardown_test_environment
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework.views import APIView
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from core.authentication import CachedJWTAuthentication, invalidate_user
+from core.models import Membership
+from core.tenancy import default_tenant_id
+
+BACKENDS = (('JWTAuthentication', JWTAuthentication), ('CachedJWTAuthentication', CachedJWTAuthentication))
+
+
+class Command(BaseCommand):
+    help = ("Compare l'authentification JWT par défaut et l'authentification avec cache de l'utilisateur "
+            "sur une rafale de requêtes : authentification seule, puis requêtes API complètes. "
+            "Les mesures se font dans une base de test dédiée.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help="Taille de la rafale")
+        parser.add_argument('--path', default='/api/product-categories/',
+                            help="Point d'entrée appelé pour la mesure des requêtes complètes")
+
+    def handle(self, *args, **options):
+        settings.QUERY_INSPECTOR_ENABLED = False
+        setup_test_environment(debug=False)
+        runner = get_runner(settings)(verbosity=0, interactive=False)
+        old_config = runner.setup_databases()
+        try:
+            user = User.objects.create_user('benchmark-auth', password='benchmark-auth')
+            Membership.objects.create(tenant_id=default_tenant_id(), user=user)
+            token = str(RefreshToken.for_user(user).access_token)
+            self.stdout.write(f"Rafale de {options['requests']} requêtes, utilisateur en cache "
+                              f"{settings.JWT_USER_CACHE_TTL} s ({settings.JWT_USER_CACHE})")
+            for label, backend in BACKENDS:
+                invalidate_user(user.pk)
+                self.report(f"{label} (authentification)", *self.authenticate(backend, token, options['requests']))
+            for label, backend in BACKENDS:
+                invalidate_user(user.pk)
+                self.report(f"{label} ({options['path']})",
+                            *self.burst(backend, token, options['path'], options['requests']))
+        finally:
+            runner.teardown_databases(old_config)
+            teardown_test_environment()
+
+    def report(self, label, durations, queries):
+        total = sum(durations)
+        self.stdout.write(
+            f"{label:<56} p50 {statistics.median(durations) * 1000:7.3f} ms  "
+            f"total {total * 1000:8.1f} ms  {len(durations) / total:8.0f} req/s  "
+            f"{queries / len(durations):4.2f} requête(s) SQL par appel"
+        )
+
+    def authenticate(self, backend, token, count):
+        factory = APIRequestFactory()
+        authenticator = backend()
+        durations = []
+        with CaptureQueriesContext(connection) as captured:
+            for _ in range(count):
+                request = factory.get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+                started = time.perf_counter()
+                authenticator.authenticate(request)
+                durations.append(time.perf_counter() - started)
+        return durations, len(captured)
+
+    def burst(self, backend, token, path, count):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        durations = []
+        # Les vues héritent de APIView.authentication_classes, fixé au chargement des réglages
+        with mock.patch.object(APIView, 'authentication_classes', [backend]), \
+                CaptureQueriesContext(connection) as captured:
+            for _ in range(count):
+                started = time.perf_counter()
+                response = client.get(path)
+                durations.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    raise RuntimeError(f"GET {path} a renvoyé {response.status_code}")
+        return durations, len(captured)
@@ -0,0 +1,95 @@
+import os
+import shutil
+import tempfile
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from core.invoices import render_invoice_pdf, render_invoices, with_pdf_relations
+from core.models import Invoice
+
+
+def synthetic_payload(index, items=12):
+    """Facture fictive de taille réaliste, sans accès à la base"""
+    lines = [{
+        'product': f"Sac modèle {index}-{line}",
+        'reference': f"REF-{index:05d}-{line:02d}",
+        'quantity': 1 + line % 4,
+        'unit_price': '45.00',
+        'discount': '0.00',
+        'total_price': str(Decimal('45.00') * (1 + line % 4)),
+    } for line in range(items)]
+    total = sum(Decimal(line['total_price']) for line in lines)
+    return {
+        'template_version': 0,
+        'company': 'Benchmark',
+        'invoice_number': f"INV-{index:05d}",
+        'issue_date': '2024-01-31',
+        'due_date': '2024-03-01',
+        'status': 'Envoyée',
+        'notes': '',
+        'sale_id': index,
+        'sale_reference': '',
+        'sale_date': '2024-01-30',
+        'customer': {'name': f"Client {index}", 'address': '12 rue du Marché\nDakar', 'phone': '', 'email': ''},
+        'items': lines,
+        'currency': 'EUR',
+        'total_amount': str(total),
+        'total_paid': '0',
+        'balance_due': str(total),
+    }
+
+
+class Command(BaseCommand):
+    help = "Mesure le débit de génération des factures PDF (série, pool de processus, cache)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=200, help="Nombre de factures fictives à générer")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Taille du pool de processus")
+        parser.add_argument('--database', action='store_true',
+                            help="Mesure aussi render_invoices() sur les factures existantes (cache froid puis chaud)")
+
+    def report(self, label, count, elapsed):
+        rate = count / elapsed if elapsed else float('inf')
+        self.stdout.write(f"{label:<32} {count:>6} factures  {elapsed:8.2f} s  {rate:10.1f} factures/s")
+
+    def handle(self, *args, **options):
+        from concurrent.futures import ProcessPoolExecutor
+
+        count = options['count']
+        workers = options['workers']
+        payloads = [synthetic_payload(index) for index in range(count)]
+
+        start = time.perf_counter()
+        for payload in payloads:
+            render_invoice_pdf(payload)
+        self.report("Rendu en série", count, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(render_invoice_pdf, payloads, chunksize=max(1, count // (workers * 4))))
+        self.report(f"Pool de {workers} processus", count, time.perf_counter() - start)
+
+        if not options['database']:
+            return
+
+        invoices = list(with_pdf_relations(Invoice.objects.all()))
+        if not invoices:
+            self.stdout.write("Aucune facture en base, mesure ignorée.")
+            return
+
+        media_root = tempfile.mkdtemp(prefix='invoice-bench-')
+        try:
+            # Le stockage par défaut suit MEDIA_ROOT via le signal setting_changed
+            with override_settings(MEDIA_ROOT=media_root):
+                start = time.perf_counter()
+                render_invoices(invoices, workers=workers)
+                self.report("render_invoices (cache froid)", len(invoices), time.perf_counter() - start)
+
+                start = time.perf_counter()
+                render_invoices(invoices, workers=workers)
+                self.report("render_invoices (cache chaud)", len(invoices), time.perf_counter() - start)
+        finally:
+            shutil.rmtree(media_root, ignore_errors=True)
@@ -0,0 +1,42 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.periods import PeriodError, close_period, period_bounds, reopen_period
+from core.tenancy import tenant_id_for
+
+
+class Command(BaseCommand):
+    help = ("Clôture un mois ou une année terminés, à la suite de la dernière clôture : les documents datés "
+            "jusqu'à sa fin sont figés et ses soldes (ventes, coût des ventes, créances, dettes, stock) enregistrés.")
+
+    def add_arguments(self, parser):
+        period = parser.add_mutually_exclusive_group(required=True)
+        period.add_argument('--month', help="Mois à clôturer, au format AAAA-MM")
+        period.add_argument('--year', type=int, help="Année à clôturer")
+        period.add_argument('--reopen', action='store_true', help="Rouvre la dernière période clôturée")
+        parser.add_argument('--tenant', default=None,
+                            help="Identifiant de la boutique (par défaut : boutique DEFAULT_TENANT)")
+
+    def handle(self, *args, **options):
+        tenant_id = tenant_id_for(options['tenant'])
+        if tenant_id is None:
+            raise CommandError(f"Boutique inconnue : {options['tenant']}")
+
+        try:
+            if options['reopen']:
+                period = reopen_period(tenant_id)
+                self.stdout.write(self.style.SUCCESS(f"Période {period} rouverte."))
+                return
+            if options['month']:
+                match = re.fullmatch(r'(\d{4})-(0[1-9]|1[0-2])', options['month'])
+                if match is None:
+                    raise CommandError("Mois attendu au format AAAA-MM.")
+                kind, start, end = 'month', *period_bounds('month', int(match[1]), int(match[2]))
+            else:
+                kind, start, end = 'year', *period_bounds('year', options['year'])
+            period = close_period(tenant_id, kind, start, end)
+        except PeriodError as error:
+            raise CommandError(str(error))
+        self.stdout.write(self.style.SUCCESS(
+            f"Période {period} clôturée : {period.balances.count()} soldes enregistrés."))
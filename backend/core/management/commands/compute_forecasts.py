@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.replenishment import compute_forecasts, generate_draft_purchases
+
+
+class Command(BaseCommand):
+    help = "Recalcule les prévisions de ventes et les points de commande de tout le catalogue"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--generate-orders', action='store_true',
+                            help="Crée ensuite une commande en attente par fournisseur avec les quantités suggérées")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        count = compute_forecasts()
+        self.stdout.write(f"{count} produits recalculés en {time.perf_counter() - started:.2f} s")
+        if options['generate_orders']:
+            purchases = generate_draft_purchases()
+            self.stdout.write(f"{len(purchases)} commandes fournisseurs créées")
+        self.stdout.write(self.style.SUCCESS("Terminé"))
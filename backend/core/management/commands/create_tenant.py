@@ -0,0 +1,41 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core.models import Membership, Tenant
+
+
+class Command(BaseCommand):
+    help = ("Crée une boutique (ou met à jour son nom) et y rattache des utilisateurs. Les requêtes d'API "
+            "choisissent la boutique avec l'en-tête X-Tenant ; sans en-tête, la première boutique de "
+            "l'utilisateur est utilisée.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('slug', help="Identifiant de la boutique (valeur de l'en-tête X-Tenant)")
+        parser.add_argument('--name', default=None, help="Nom affiché (par défaut : l'identifiant)")
+        parser.add_argument('--users', nargs='*', default=[], help="Noms des utilisateurs à rattacher")
+        parser.add_argument('--all-users', action='store_true',
+                            help="Rattache tous les utilisateurs existants (reprise d'une installation mono-boutique)")
+
+    def handle(self, *args, **options):
+        users = User.objects.all() if options['all_users'] else User.objects.filter(username__in=options['users'])
+        users = list(users)
+        missing = set(options['users']) - {user.username for user in users}
+        if missing:
+            raise CommandError(f"Utilisateurs inconnus : {', '.join(sorted(missing))}")
+
+        with transaction.atomic():
+            tenant, created = Tenant.objects.get_or_create(slug=options['slug'],
+                                                           defaults={'name': options['name'] or options['slug']})
+            if not created and options['name'] and tenant.name != options['name']:
+                tenant.name = options['name']
+                tenant.save()
+            existing = set(Membership.objects.filter(tenant=tenant).values_list('user_id', flat=True))
+            for user in users:
+                if user.pk not in existing:
+                    # save() plutôt que bulk_create : invalide le cache des boutiques de l'utilisateur
+                    Membership.objects.create(tenant=tenant, user=user)
+                    existing.add(user.pk)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Boutique {tenant.slug} {'créée' if created else 'mise à jour'} : {len(existing)} membre(s)."))
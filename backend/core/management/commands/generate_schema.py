@@ -0,0 +1,41 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.openapi import FORMATS, build_schemas, schema_path, write_schemas
+
+
+class Command(BaseCommand):
+    help = ("Génère le schéma OpenAPI (JSON et YAML) dans OPENAPI_SCHEMA_DIR, servi ensuite tel quel sur "
+            "/swagger.json/ et /swagger.yaml/. À relancer à chaque déploiement qui modifie l'API.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help="N'écrit rien et échoue si les fichiers générés ne correspondent plus à l'API")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        contents = build_schemas()
+        elapsed = time.perf_counter() - started
+
+        if options['check']:
+            stale = []
+            for fmt in FORMATS:
+                path = schema_path(fmt)
+                if not os.path.exists(path):
+                    stale.append(path)
+                    continue
+                with open(path, 'rb') as stream:
+                    if stream.read() != contents[fmt]:
+                        stale.append(path)
+            if stale:
+                raise CommandError(f"Schéma OpenAPI périmé ou absent : {', '.join(stale)} "
+                                   f"(lancer python manage.py generate_schema)")
+            self.stdout.write(self.style.SUCCESS(f"Schéma OpenAPI à jour dans {settings.OPENAPI_SCHEMA_DIR}."))
+            return
+
+        paths = write_schemas(contents)
+        sizes = ', '.join(f"{os.path.basename(path)} {os.path.getsize(path) // 1024} Ko" for path in paths)
+        self.stdout.write(self.style.SUCCESS(f"Schéma OpenAPI généré en {elapsed:.2f} s : {sizes}."))
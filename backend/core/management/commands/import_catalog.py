@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.imports import CatalogImporter, ImportFormatError
+from core.tenancy import tenant_context, tenant_id_for
+
+
+class Command(BaseCommand):
+    help = ("Importe un catalogue produits (CSV ou XLSX) : produits rapprochés par référence, catégories et "
+            "fournisseurs par nom, stock d'ouverture enregistré en mouvements d'ajustement.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Fichier .csv ou .xlsx à importer")
+        parser.add_argument('--dry-run', action='store_true', help="Valide et simule l'import sans rien enregistrer")
+        parser.add_argument('--chunk-size', type=int, default=None, help="Nombre de lignes écrites par paquet")
+        parser.add_argument('--tenant', default=None,
+                            help="Identifiant de la boutique (par défaut : boutique DEFAULT_TENANT)")
+
+    def handle(self, *args, **options):
+        tenant_id = tenant_id_for(options['tenant'])
+        if tenant_id is None:
+            raise CommandError(f"Boutique inconnue : {options['tenant']}")
+        try:
+            with tenant_context(tenant_id), open(options['path'], 'rb') as stream:
+                importer = CatalogImporter(dry_run=options['dry_run'], chunk_size=options['chunk_size'])
+                report = importer.run(stream, options['path'])
+        except (OSError, ImportFormatError) as error:
+            raise CommandError(str(error))
+
+        for error in report['errors']:
+            details = '; '.join(f"{field} : {' '.join(messages)}" for field, messages in error['errors'].items())
+            self.stderr.write(f"Ligne {error['line']} ({error['reference'] or 'sans référence'}) : {details}")
+        if report['error_count'] > len(report['errors']):
+            self.stderr.write(f"... {report['error_count'] - len(report['errors'])} autres erreurs")
+
+        prefix = "Simulation : " if report['dry_run'] else ""
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}{report['rows']} lignes lues en {report['elapsed']} s : {report['created']} produits créés, "
+            f"{report['updated']} mis à jour, {report['skipped']} ignorées, "
+            f"{report['categories_created']} catégories et {report['suppliers_created']} fournisseurs créés, "
+            f"{report['stock_movements']} mouvements de stock."
+        ))
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.imports import ImportFormatError, RateImporter
+from core.tenancy import tenant_context, tenant_id_for
+
+
+class Command(BaseCommand):
+    help = ("Importe des taux de change datés (CSV ou XLSX, colonnes devise, date, taux : valeur d'une unité "
+            "en devise de base). Un taux existant pour la même devise et la même date est remplacé.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Fichier .csv ou .xlsx à importer")
+        parser.add_argument('--dry-run', action='store_true', help="Valide et simule l'import sans rien enregistrer")
+        parser.add_argument('--chunk-size', type=int, default=None, help="Nombre de taux écrits par paquet")
+        parser.add_argument('--reapply', action='store_true',
+                            help="Reconvertit les documents et paiements datés à partir du premier taux importé")
+        parser.add_argument('--tenant', default=None,
+                            help="Identifiant de la boutique (par défaut : boutique DEFAULT_TENANT)")
+
+    def handle(self, *args, **options):
+        tenant_id = tenant_id_for(options['tenant'])
+        if tenant_id is None:
+            raise CommandError(f"Boutique inconnue : {options['tenant']}")
+        try:
+            with tenant_context(tenant_id), open(options['path'], 'rb') as stream:
+                importer = RateImporter(dry_run=options['dry_run'], chunk_size=options['chunk_size'],
+                                        reapply=options['reapply'])
+                report = importer.run(stream, options['path'])
+        except (OSError, ImportFormatError) as error:
+            raise CommandError(str(error))
+
+        for error in report['errors']:
+            details = '; '.join(f"{field} : {' '.join(messages)}" for field, messages in error['errors'].items())
+            self.stderr.write(f"Ligne {error['line']} : {details}")
+        if report['error_count'] > len(report['errors']):
+            self.stderr.write(f"... {report['error_count'] - len(report['errors'])} autres erreurs")
+
+        prefix = "Simulation : " if report['dry_run'] else ""
+        message = (f"{prefix}{report['rows']} lignes lues en {report['elapsed']} s : {report['imported']} taux "
+                   f"importés ({', '.join(report['currencies']) or 'aucune devise'}), {report['skipped']} ignorées")
+        if options['reapply']:
+            message += f", {report['reapplied']} documents et paiements reconvertis"
+        self.stdout.write(self.style.SUCCESS(message + "."))
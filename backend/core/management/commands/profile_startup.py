@@ -0,0 +1,119 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.openapi import schema_path
+
+# Démarrage d'un worker : chargement de l'application WSGI (réglages, applications, URL), puis première requête
+FIRST_REQUEST_SCRIPT = """
+import json, resource, sys, time
+from wsgiref.util import setup_testing_defaults
+
+started = time.perf_counter()
+from django.conf import settings
+from finance_app.wsgi import application
+loaded = time.perf_counter()
+
+def call(path):
+    environ = {'PATH_INFO': path, 'REQUEST_METHOD': 'GET'}
+    host = next((host for host in settings.ALLOWED_HOSTS if host and '*' not in host and not host.startswith('.')),
+                None)
+    if host:
+        environ['HTTP_HOST'] = host
+    setup_testing_defaults(environ)
+    status = []
+    body = b''.join(application(environ, lambda code, headers, exc_info=None: status.append(code)))
+    return int(status[0].split()[0]), len(body)
+
+status, size = call(sys.argv[1])
+first = time.perf_counter()
+call(sys.argv[1])
+second = time.perf_counter()
+print(json.dumps({
+    'load': loaded - started, 'first_request': first - loaded, 'second_request': second - first,
+    'status': status, 'size': size, 'max_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+}))
+"""
+
+
+class Command(BaseCommand):
+    help = ("Profile le démarrage d'un worker dans des processus neufs : rapport python -X importtime "
+            "(modules les plus coûteux), temps jusqu'à la première réponse et mémoire maximale. "
+            "Avec --max-first-request ou --max-rss, échoue si le démarrage dépasse le seuil.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/swagger.json/', help="URL de la première requête")
+        parser.add_argument('--runs', type=int, default=3, help="Nombre de démarrages mesurés (médiane)")
+        parser.add_argument('--top', type=int, default=15, help="Nombre de modules listés")
+        parser.add_argument('--max-first-request', type=float, default=None,
+                            help="Seuil en secondes du chargement plus la première réponse")
+        parser.add_argument('--max-rss', type=float, default=None, help="Seuil de mémoire maximale en Mo")
+
+    def handle(self, *args, **options):
+        if not os.path.exists(schema_path('.json')):
+            self.stdout.write(self.style.WARNING(
+                "Schéma OpenAPI non généré : une première requête sur /swagger.json/ inclut son calcul "
+                "(python manage.py generate_schema)."))
+        self.import_report(options['top'])
+        self.first_request(options)
+
+    def run_python(self, *arguments):
+        result = subprocess.run([sys.executable, *arguments], cwd=settings.BASE_DIR, capture_output=True, text=True)
+        if result.returncode:
+            raise CommandError(f"Échec du démarrage :\n{result.stderr[-2000:]}")
+        return result
+
+    def import_report(self, top):
+        result = self.run_python('-X', 'importtime', '-c', 'import finance_app.wsgi')
+        modules = []
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:'):
+                continue
+            own, cumulative, name = line[len('import time:'):].split('|')
+            if not own.strip().isdigit():
+                continue
+            modules.append((name.strip(), int(own), int(cumulative)))
+        total = sum(own for _, own, _ in modules)
+        by_package = defaultdict(int)
+        for name, own, _ in modules:
+            by_package[name.split('.')[0]] += own
+        self.stdout.write(f"Imports : {len(modules)} modules en {total / 1000:.0f} ms (python -X importtime)")
+        self.stdout.write("Paquets les plus coûteux (temps propre cumulé de leurs modules) :")
+        for package, own in sorted(by_package.items(), key=lambda item: -item[1])[:top]:
+            self.stdout.write(f"  {package:<40} {own / 1000:8.1f} ms")
+        self.stdout.write("Modules les plus coûteux (temps propre, temps avec leurs imports) :")
+        for name, own, cumulative in sorted(modules, key=lambda module: -module[1])[:top]:
+            self.stdout.write(f"  {name:<56} {own / 1000:8.1f} ms {cumulative / 1000:8.1f} ms")
+
+    def first_request(self, options):
+        runs = [json.loads(self.run_python('-c', FIRST_REQUEST_SCRIPT, options['path']).stdout.splitlines()[-1])
+                for _ in range(max(options['runs'], 1))]
+        if runs[0]['status'] >= 400:
+            raise CommandError(f"GET {options['path']} a renvoyé {runs[0]['status']}")
+
+        def median(key):
+            return statistics.median(run[key] for run in runs)
+
+        boot = median('load') + median('first_request')
+        rss = median('max_rss') / 1024 / 1024
+        self.stdout.write(
+            f"Démarrage ({len(runs)} processus, médiane) : chargement {median('load') * 1000:.0f} ms, "
+            f"première requête {median('first_request') * 1000:.0f} ms, suivante "
+            f"{median('second_request') * 1000:.1f} ms (GET {options['path']}, {runs[0]['size'] // 1024} Ko), "
+            f"mémoire maximale {rss:.0f} Mo"
+        )
+
+        failures = []
+        if options['max_first_request'] is not None and boot > options['max_first_request']:
+            failures.append(f"première réponse après {boot:.2f} s (seuil {options['max_first_request']} s)")
+        if options['max_rss'] is not None and rss > options['max_rss']:
+            failures.append(f"mémoire maximale {rss:.0f} Mo (seuil {options['max_rss']} Mo)")
+        if failures:
+            raise CommandError("Démarrage trop coûteux : " + ", ".join(failures))
+        self.stdout.write(self.style.SUCCESS(f"Première réponse après {boot * 1000:.0f} ms."))
@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.scorecards import refresh_supplier_scores
+
+
+class Command(BaseCommand):
+    help = "Recalcule les indicateurs de performance des fournisseurs (délais, ponctualité, taux de service, prix)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--supplier', type=int, action='append', dest='suppliers',
+                            help="Fournisseur à recalculer (option répétable ; tous par défaut)")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        count = refresh_supplier_scores(options['suppliers'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{count} fournisseurs recalculés en {time.perf_counter() - started:.2f} s"))
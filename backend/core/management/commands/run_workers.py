@@ -0,0 +1,36 @@
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.jobs import WorkerPool
+
+
+class Command(BaseCommand):
+    help = ("Exécute les tâches en arrière-plan stockées en base. Plusieurs processus run_workers peuvent "
+            "tourner en parallèle, sur une ou plusieurs machines.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=None,
+                            help="Nombre de tâches exécutées simultanément par ce processus")
+        parser.add_argument('--poll-interval', type=float, default=None,
+                            help="Attente (secondes) entre deux consultations d'une file vide")
+        parser.add_argument('--once', action='store_true',
+                            help="Traite les tâches disponibles puis s'arrête (tâches cron, tests)")
+
+    def handle(self, *args, **options):
+        pool = WorkerPool(
+            concurrency=options['concurrency'] or settings.JOB_WORKERS,
+            poll_interval=options['poll_interval'] or settings.JOB_POLL_INTERVAL,
+            once=options['once'],
+            log=self.stdout.write,
+        )
+
+        def shutdown(signum, frame):
+            self.stdout.write("Arrêt demandé : fin des tâches en cours...")
+            pool.stop()
+
+        signal.signal(signal.SIGTERM, shutdown)
+        signal.signal(signal.SIGINT, shutdown)
+        self.stdout.write(f"{pool.concurrency} workers démarrés ({pool.identity})")
+        pool.run()
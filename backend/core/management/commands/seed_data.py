@@ -0,0 +1,57 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Product, Sale, Purchase, Customer
+from core.seeding import Seeder
+from core.tenancy import tenant_id_for
+
+
+class Command(BaseCommand):
+    help = ("Génère un jeu de données synthétique réaliste (fournisseurs, produits, achats, ventes, "
+            "paiements, mouvements de stock, factures). Le résultat est identique pour une même graine "
+            "et une même date de fin.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=1.0,
+                            help="Facteur de volume (1 : environ 27 000 lignes, 100 : environ 2,7 millions)")
+        parser.add_argument('--seed', type=int, default=42, help="Graine du générateur aléatoire")
+        parser.add_argument('--days', type=int, default=730, help="Nombre de jours d'historique")
+        parser.add_argument('--end-date', type=date.fromisoformat, default=None,
+                            help="Dernier jour simulé au format AAAA-MM-JJ (par défaut : aujourd'hui)")
+        parser.add_argument('--batch-size', type=int, default=2000, help="Nombre de lignes par requête d'insertion")
+        parser.add_argument('--workers', type=int, default=1,
+                            help="Nombre de processus de génération (utile seulement sur une machine multicœur)")
+        parser.add_argument('--clear', action='store_true',
+                            help="Vide les tables de l'application de TOUTES les boutiques avant la génération, "
+                                 "pas seulement celle de --tenant : les identifiants étant fixés, "
+                                 "le jeu de données exige une base vide")
+        parser.add_argument('--tenant', default=None,
+                            help="Identifiant de la boutique (par défaut : boutique DEFAULT_TENANT)")
+
+    def handle(self, *args, **options):
+        tenant_id = tenant_id_for(options['tenant'])
+        if tenant_id is None:
+            raise CommandError(f"Boutique inconnue : {options['tenant']}")
+        seeder = Seeder(
+            tenant_id=tenant_id,
+            scale=options['scale'],
+            seed=options['seed'],
+            days=options['days'],
+            end_date=options['end_date'],
+            batch_size=options['batch_size'],
+            workers=options['workers'],
+            log=self.stdout.write,
+        )
+
+        if options['clear']:
+            seeder.clear()
+        elif any(model.all_tenants.exists() for model in (Product, Customer, Sale, Purchase)):
+            raise CommandError("La base contient déjà des données. Relancez avec --clear pour la vider.")
+
+        rows, elapsed = seeder.run()
+        total = sum(rows.values())
+        for name, count in sorted(rows.items()):
+            self.stdout.write(f"  {name:<16} {count:>10}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{total} lignes générées en {elapsed:.1f} s ({total / elapsed:,.0f} lignes/s)"))
@@ -0,0 +1,120 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Sum
+from django.test.utils import get_runner, setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from core.models import Customer, Product, Sale, StockReservation
+from core.reservations import StockUnavailable
+from core.serializers import SaleCreateSerializer
+from core.tenancy import default_tenant_id, tenant_context
+
+
+class Command(BaseCommand):
+    help = ("Lance en parallèle des commandes en attente sur un même produit au stock limité, puis confirme "
+            "les ventes réservées, et vérifie qu'aucune unité n'est vendue deux fois. "
+            "Les mesures se font dans une base de test dédiée ; les écritures concurrentes ne sont "
+            "représentatives que sur PostgreSQL (SQLite sérialise les écritures).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stock', type=int, default=50, help="Stock initial du produit")
+        parser.add_argument('--orders', type=int, default=500, help="Nombre de commandes")
+        parser.add_argument('--workers', type=int, default=32, help="Commandes simultanées (threads)")
+        parser.add_argument('--quantity', type=int, default=1, help="Quantité par commande")
+
+    def handle(self, *args, **options):
+        if min(options['stock'], options['orders'], options['workers'], options['quantity']) < 1:
+            raise CommandError("Les options doivent être des entiers positifs.")
+
+        settings.QUERY_INSPECTOR_ENABLED = False
+        setup_test_environment(debug=False)
+        runner = get_runner(settings)(verbosity=0, interactive=False)
+        old_config = runner.setup_databases()
+        try:
+            tenant_id = default_tenant_id()
+            with tenant_context(tenant_id):
+                customer = Customer.objects.create(name="Client stress")
+                product = Product.objects.create(name="Produit stress", buying_price=Decimal('5.00'),
+                                                 selling_price=Decimal('10.00'), stock_quantity=options['stock'])
+            self.run(tenant_id, customer, product, options)
+        finally:
+            runner.teardown_databases(old_config)
+            teardown_test_environment()
+
+    def run(self, tenant_id, customer, product, options):
+        quantity = options['quantity']
+        # Les premières commandes partent ensemble, une fois tous les threads prêts
+        start = threading.Event()
+
+        def order(index):
+            try:
+                start.wait()
+                with tenant_context(tenant_id):
+                    serializer = SaleCreateSerializer(data={
+                        'customer': customer.pk, 'reference': f'STRESS-{index}', 'status': 'pending',
+                        'sale_date': timezone.now().date(),
+                        'items': [{'product': product.pk, 'quantity': quantity, 'unit_price': '10.00'}],
+                    })
+                    serializer.is_valid(raise_exception=True)
+                    serializer.save()
+                return 'reserved'
+            except StockUnavailable:
+                return 'refused'
+            except DatabaseError:
+                return 'error'
+            finally:
+                connection.close()
+
+        def confirm(sale_id):
+            try:
+                with tenant_context(tenant_id), transaction.atomic():
+                    sale = Sale.objects.get(pk=sale_id)
+                    sale.status = 'confirmed'
+                    sale.save()
+                return 'confirmed'
+            except StockUnavailable:
+                return 'refused'
+            except DatabaseError:
+                return 'error'
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(options['workers']) as pool:
+            futures = [pool.submit(order, index) for index in range(options['orders'])]
+            start.set()
+            outcomes = [future.result() for future in futures]
+        elapsed = time.perf_counter() - started
+        reserved = StockReservation.all_tenants.filter(product=product).aggregate(total=Sum('quantity'))['total'] or 0
+        self.stdout.write(
+            f"{options['orders']} commandes, {options['workers']} threads, stock {options['stock']} : "
+            f"{outcomes.count('reserved')} réservées, {outcomes.count('refused')} refusées, "
+            f"{outcomes.count('error')} erreurs SQL en {elapsed * 1000:.0f} ms "
+            f"({options['orders'] / elapsed:.0f} commandes/s) ; {reserved} unités réservées"
+        )
+
+        sales = list(Sale.all_tenants.filter(customer=customer, reservations__isnull=False)
+                     .values_list('pk', flat=True))
+        started = time.perf_counter()
+        with ThreadPoolExecutor(options['workers']) as pool:
+            confirmations = list(pool.map(confirm, sales))
+        elapsed = time.perf_counter() - started
+        product.refresh_from_db()
+        self.stdout.write(
+            f"{len(sales)} confirmations : {confirmations.count('confirmed')} confirmées, "
+            f"{confirmations.count('refused')} refusées, {confirmations.count('error')} erreurs SQL "
+            f"en {elapsed * 1000:.0f} ms ; stock final {product.stock_quantity}"
+        )
+
+        if reserved > options['stock'] or reserved != outcomes.count('reserved') * quantity:
+            raise CommandError(f"Survente : {reserved} unités réservées pour un stock de {options['stock']}.")
+        sold = confirmations.count('confirmed') * quantity
+        if product.stock_quantity < 0 or product.stock_quantity != options['stock'] - sold:
+            raise CommandError(f"Survente : stock final {product.stock_quantity} après {sold} unités vendues.")
+        self.stdout.write(self.style.SUCCESS("Aucune survente."))
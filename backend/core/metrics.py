@@ -0,0 +1,224 @@
+"""
+Instrumentation des requêtes : en-têtes Server-Timing et histogrammes Prometheus.
+
+Pour chaque requête, le middleware mesure le temps et le nombre de requêtes SQL,
+le temps de sérialisation, le temps de rendu et la taille de la réponse, par vue
+et par action. Les agrégats sont propres à chaque processus : avec plusieurs
+workers gunicorn, Prometheus doit interroger chaque worker (ou passer par un
+répartiteur qui les distingue).
+"""
+import bisect
+import hmac
+import threading
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+SIZE_BUCKETS = (1024, 10240, 102400, 1048576, 10485760)
+
+LABELS = ('view', 'action', 'method')
+
+_current = ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    """Mesures accumulées pendant une requête"""
+
+    __slots__ = ('db_time', 'db_queries', 'serialize_time', 'render_time', '_depth', '_serialize_started',
+                 '_render_started')
+
+    def __init__(self):
+        self.db_time = 0.0
+        self.db_queries = 0
+        self.serialize_time = 0.0
+        self.render_time = 0.0
+        self._depth = 0
+        self._serialize_started = 0.0
+        self._render_started = 0.0
+
+
+class Histogram:
+    """Histogramme Prometheus à seaux fixes, sûr entre threads"""
+
+    def __init__(self, name, documentation, buckets, labels=LABELS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self.labels = labels
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_values, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                # Un compteur par seau (plus +Inf), puis la somme
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {labels: list(series) for labels, series in self._series.items()}
+        for label_values, series in sorted(snapshot.items()):
+            base = _format_labels(self.labels, label_values)
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), series[:-1]):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{base},le="{bound}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{base}}} {series[-1]}")
+            lines.append(f"{self.name}_count{{{base}}} {cumulative}")
+        return lines
+
+
+class Counter:
+    """Compteur Prometheus, sûr entre threads"""
+
+    def __init__(self, name, documentation, labels):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            snapshot = dict(self._values)
+        for label_values, value in sorted(snapshot.items()):
+            lines.append(f"{self.name}{{{_format_labels(self.labels, label_values)}}} {value}")
+        return lines
+
+
+def _format_labels(names, values):
+    return ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"')) for name, value in zip(names, values)
+    )
+
+
+REQUESTS = Counter('http_requests_total', "Nombre de requêtes traitées", LABELS + ('status',))
+DURATION = Histogram('http_request_duration_seconds', "Durée totale de traitement", DURATION_BUCKETS)
+DB_TIME = Histogram('http_request_db_seconds', "Temps passé dans les requêtes SQL", DURATION_BUCKETS)
+DB_QUERIES = Histogram('http_request_db_queries', "Nombre de requêtes SQL par requête HTTP", QUERY_BUCKETS)
+SERIALIZE_TIME = Histogram('http_request_serialize_seconds', "Temps de sérialisation", DURATION_BUCKETS)
+RENDER_TIME = Histogram('http_request_render_seconds', "Temps de rendu de la réponse", DURATION_BUCKETS)
+RESPONSE_SIZE = Histogram('http_response_size_bytes', "Taille du corps de la réponse", SIZE_BUCKETS)
+
+METRICS = (REQUESTS, DURATION, DB_TIME, DB_QUERIES, SERIALIZE_TIME, RENDER_TIME, RESPONSE_SIZE)
+
+
+def serialization_started():
+    """Début d'une sérialisation ; seules les sérialisations de premier niveau sont chronométrées"""
+    timings = _current.get()
+    if timings is not None:
+        if timings._depth == 0:
+            timings._serialize_started = time.perf_counter()
+        timings._depth += 1
+
+
+def serialization_finished():
+    timings = _current.get()
+    if timings is not None:
+        timings._depth -= 1
+        if timings._depth == 0:
+            timings.serialize_time += time.perf_counter() - timings._serialize_started
+
+
+def _view_labels(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved', '', request.method
+    view = getattr(match.func, 'cls', None)
+    # Pour les ViewSets, le routeur associe chaque méthode HTTP à une action
+    actions = getattr(match.func, 'actions', None) or {}
+    action = actions.get(request.method.lower(), match.url_name or '')
+    return (view.__name__ if view else match.view_name), action, request.method
+
+
+class PerformanceMiddleware:
+    """Mesure chaque requête, ajoute l'en-tête Server-Timing et alimente les histogrammes"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def _sql_timer(self, execute, sql, params, many, context):
+        timings = _current.get()
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            if timings is not None:
+                timings.db_time += time.perf_counter() - started
+                timings.db_queries += 1
+
+    def process_template_response(self, request, response):
+        # Appelé juste avant response.render() : le rappel post-rendu clôt la mesure
+        timings = _current.get()
+        if timings is not None:
+            timings._render_started = time.perf_counter()
+
+            def render_finished(rendered):
+                timings.render_time += time.perf_counter() - timings._render_started
+
+            response.add_post_render_callback(render_finished)
+        return response
+
+    def __call__(self, request):
+        if not settings.PERFORMANCE_METRICS_ENABLED:
+            return self.get_response(request)
+
+        timings = RequestTimings()
+        token = _current.set(timings)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(self._sql_timer))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        duration = time.perf_counter() - started
+
+        labels = _view_labels(request)
+        REQUESTS.inc(labels + (str(response.status_code),))
+        DURATION.observe(labels, duration)
+        DB_TIME.observe(labels, timings.db_time)
+        DB_QUERIES.observe(labels, timings.db_queries)
+        SERIALIZE_TIME.observe(labels, timings.serialize_time)
+        RENDER_TIME.observe(labels, timings.render_time)
+        if not response.streaming:
+            RESPONSE_SIZE.observe(labels, len(response.content))
+
+        response['Server-Timing'] = ', '.join((
+            f'db;dur={timings.db_time * 1000:.2f};desc="SQL ({timings.db_queries})"',
+            f'serialize;dur={timings.serialize_time * 1000:.2f}',
+            f'render;dur={timings.render_time * 1000:.2f}',
+            f'total;dur={duration * 1000:.2f}',
+        ))
+        return response
+
+
+def metrics_view(request):
+    """Expose les métriques au format texte de Prometheus, uniquement avec le jeton METRICS_TOKEN"""
+    token = settings.METRICS_TOKEN
+    if not token:
+        # Sans jeton configuré, les métriques ne sont pas publiées
+        raise Http404
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {token}"):
+        return HttpResponseForbidden()
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.expose())
+    return HttpResponse('\n'.join(lines) + '\n', content_type='text/plain; version=0.0.4; charset=utf-8')
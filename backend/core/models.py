@@ -1,9 +1,105 @@
-from django.db import models
+from functools import partial
+
+from django.db import models, transaction
 from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
 from django.utils import timezone
 
+from .currency import default_currency, get_rate, refresh_base_totals, to_base
+from .tenancy import TenantManager, active_tenant_id
+from .thumbnails import schedule_thumbnails
+
+
+class Tenant(models.Model):
+    """Boutique : les données des autres modèles appartiennent chacune à une boutique (voir core.tenancy)"""
+    name = models.CharField(max_length=100, verbose_name="Nom")
+    # Valeur de l'en-tête X-Tenant qui désigne la boutique
+    slug = models.SlugField(max_length=50, unique=True, verbose_name="Identifiant")
+    is_active = models.BooleanField(default=True, verbose_name="Active")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Date de création")
+
+    class Meta:
+        verbose_name = "Boutique"
+        verbose_name_plural = "Boutiques"
+        ordering = ["name"]
+
+    def __str__(self):
+        return self.name
+
+
+class Membership(models.Model):
+    """Accès d'un utilisateur à une boutique"""
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, db_index=False, verbose_name="Boutique",
+                               related_name="memberships")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Utilisateur", related_name="memberships")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Date de création")
+
+    class Meta:
+        verbose_name = "Membre"
+        verbose_name_plural = "Membres"
+        constraints = [
+            models.UniqueConstraint(fields=['tenant', 'user'], name='core_membership_tenant_user'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} / {self.tenant}"
+
+
+class InvoiceSequence(models.Model):
+    """Dernier numéro de facture attribué dans une boutique (voir core.invoices.next_invoice_number)"""
+    tenant = models.OneToOneField(Tenant, on_delete=models.CASCADE, primary_key=True, verbose_name="Boutique",
+                                  related_name="invoice_sequence")
+    last_number = models.PositiveIntegerField(default=0, verbose_name="Dernier numéro")
+
+    class Meta:
+        verbose_name = "Numérotation des factures"
+        verbose_name_plural = "Numérotations des factures"
 
-class Supplier(models.Model):
+    def __str__(self):
+        return f"{self.tenant_id} : {self.last_number}"
+
+
+class TenantModel(models.Model):
+    """
+    Base des modèles rattachés à une boutique. La colonne tenant n'a pas
+    d'index propre : elle ouvre les index composites de chaque modèle.
+    """
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, editable=False, db_index=False,
+                               verbose_name="Boutique", related_name="+")
+
+    # Relation dont la boutique est reprise à la création (une ligne suit son document)
+    tenant_parent = None
+
+    objects = TenantManager()
+    # Toutes boutiques confondues, quelle que soit la boutique courante
+    all_tenants = models.Manager()
+
+    class Meta:
+        abstract = True
+
+    def assign_tenant(self):
+        """Rattache l'objet à la boutique de son parent, sinon à la boutique courante ; renvoie son identifiant"""
+        if self.tenant_id is None:
+            parent = None
+            if self.tenant_parent and getattr(self, self._meta.get_field(self.tenant_parent).attname) is not None:
+                parent = getattr(self, self.tenant_parent)
+            self.tenant_id = parent.tenant_id if parent is not None else active_tenant_id()
+        return self.tenant_id
+
+    def validate_constraints(self, exclude=None):
+        # La boutique n'est jamais saisie dans un formulaire : les contraintes d'unicité par boutique
+        # sont tout de même vérifiées
+        if exclude and 'tenant' in exclude:
+            self.assign_tenant()
+            exclude = set(exclude) - {'tenant'}
+        super().validate_constraints(exclude)
+
+    def save(self, *args, **kwargs):
+        self.assign_tenant()
+        super().save(*args, **kwargs)
+
+
+class Supplier(TenantModel):
     """Modèle pour gérer les fournisseurs"""
     name = models.CharField(max_length=100, verbose_name="Nom")
     country = models.CharField(max_length=100, verbose_name="Pays", blank=True, null=True)
@@ -18,28 +114,42 @@ class Supplier(models.Model):
         verbose_name = "Fournisseur"
         verbose_name_plural = "Fournisseurs"
         ordering = ["name"]
+        constraints = [
+            models.UniqueConstraint(fields=['tenant', 'name'], name='core_supplier_tenant_name'),
+        ]
+        indexes = [
+            models.Index(fields=['tenant', 'updated_at'], name='core_supplier_tenant_updated'),
+        ]
 
     def __str__(self):
         return self.name
 
 
-class ProductCategory(models.Model):
+class ProductCategory(TenantModel):
     """Modèle pour catégoriser les produits"""
     name = models.CharField(max_length=100, verbose_name="Nom")
     description = models.TextField(verbose_name="Description", blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Date de mise à jour")
 
     class Meta:
         verbose_name = "Catégorie de produit"
         verbose_name_plural = "Catégories de produits"
         ordering = ["name"]
+        constraints = [
+            models.UniqueConstraint(fields=['tenant', 'name'], name='core_category_tenant_name'),
+        ]
+        indexes = [
+            models.Index(fields=['tenant', 'updated_at'], name='core_category_tenant_updated'),
+        ]
 
     def __str__(self):
         return self.name
 
 
-class Product(models.Model):
+class Product(TenantModel):
     """Modèle pour gérer les produits"""
     name = models.CharField(max_length=100, verbose_name="Nom")
+    # Unique dans la boutique : clé de rapprochement des imports de catalogue
     reference = models.CharField(max_length=50, verbose_name="Référence", blank=True, null=True)
     category = models.ForeignKey(ProductCategory, on_delete=models.SET_NULL, null=True, blank=True, 
                                 verbose_name="Catégorie", related_name="products")
@@ -51,6 +161,9 @@ class Product(models.Model):
     min_stock_level = models.IntegerField(default=5, verbose_name="Niveau minimum de stock")
     description = models.TextField(verbose_name="Description", blank=True, null=True)
     image = models.ImageField(upload_to='products/', verbose_name="Image", blank=True, null=True)
+    # Empreinte du contenu de l'image, renseignée une fois les miniatures générées
+    image_hash = models.CharField(max_length=64, verbose_name="Empreinte de l'image", blank=True, null=True,
+                                  editable=False)
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Date de création")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Date de mise à jour")
 
@@ -58,10 +171,29 @@ class Product(models.Model):
         verbose_name = "Produit"
         verbose_name_plural = "Produits"
         ordering = ["name"]
+        constraints = [
+            models.UniqueConstraint(fields=['tenant', 'reference'], name='core_product_tenant_reference'),
+        ]
+        indexes = [
+            models.Index(fields=['tenant', 'name'], name='core_product_tenant_name'),
+            models.Index(fields=['tenant', 'updated_at'], name='core_product_tenant_updated'),
+        ]
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        # Une référence vide est enregistrée comme absente pour ne pas violer l'unicité
+        if not self.reference:
+            self.reference = None
+        # Nouvelle image : les miniatures de l'ancienne ne sont plus valables
+        image_uploaded = bool(self.image) and not self.image._committed
+        if image_uploaded or not self.image:
+            self.image_hash = None
+        super().save(*args, **kwargs)
+        if image_uploaded:
+            transaction.on_commit(partial(schedule_thumbnails, self.pk))
+
     @property
     def is_low_stock(self):
         """Vérifie si le stock est bas"""
@@ -74,8 +206,21 @@ class Product(models.Model):
             return ((self.selling_price - self.buying_price) / self.buying_price) * 100
         return 0
 
+    @property
+    def reserved_quantity(self):
+        """Quantité réservée par les ventes en attente (voir core.reservations)"""
+        if not hasattr(self, 'reserved_total'):
+            self.reserved_total = self.reservations.filter(expires_at__gt=timezone.now())\
+                .aggregate(total=models.Sum('quantity'))['total'] or 0
+        return self.reserved_total
+
+    @property
+    def available_quantity(self):
+        """Stock disponible à la vente : stock physique moins les réservations en cours"""
+        return self.stock_quantity - self.reserved_quantity
 
-class Purchase(models.Model):
+
+class Purchase(TenantModel):
     """Modèle pour gérer les achats auprès des fournisseurs"""
     STATUS_CHOICES = (
         ('pending', 'En attente'),
@@ -99,18 +244,41 @@ class Purchase(models.Model):
     payment_status = models.CharField(max_length=20, choices=PAYMENT_STATUS_CHOICES, default='unpaid', 
                                      verbose_name="Statut de paiement")
     payment_due_date = models.DateField(verbose_name="Date d'échéance", blank=True, null=True)
+    currency = models.CharField(max_length=3, default=default_currency, verbose_name="Devise")
+    exchange_rate = models.DecimalField(max_digits=18, decimal_places=8, default=1,
+                                        verbose_name="Taux de change", help_text="Valeur d'une unité en devise de base")
+    total_amount_base = models.DecimalField(max_digits=14, decimal_places=2, default=0,
+                                            verbose_name="Montant total (devise de base)")
     notes = models.TextField(verbose_name="Notes", blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Date de création")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Date de mise à jour")
 
+    tenant_parent = 'supplier'
+
     class Meta:
         verbose_name = "Achat"
         verbose_name_plural = "Achats"
         ordering = ["-order_date"]
+        indexes = [
+            # Relevé de compte fournisseur : achats d'un fournisseur par date
+            models.Index(fields=['tenant', 'supplier', 'order_date'], name='core_purchase_supplier_date'),
+            models.Index(fields=['tenant', 'order_date'], name='core_purchase_tenant_date'),
+            models.Index(fields=['tenant', 'updated_at'], name='core_purchase_tenant_updated'),
+        ]
 
     def __str__(self):
         return f"Achat {self.id} - {self.supplier.name}"
 
+    def save(self, *args, **kwargs):
+        """Fixe le taux de change à la date du document ; le total converti suit les lignes"""
+        rate = get_rate(self.currency, self.order_date, self.assign_tenant())
+        rate_changed = self.pk is not None and rate != self.exchange_rate
+        self.exchange_rate = rate
+        super().save(*args, **kwargs)
+        if rate_changed:
+            refresh_base_totals(Purchase, [self.pk])
+            self.refresh_from_db(fields=['total_amount_base'])
+
     @property
     def total_amount(self):
         """Calcule le montant total de l'achat"""
@@ -135,17 +303,24 @@ class Purchase(models.Model):
         return False
 
 
-class PurchaseItem(models.Model):
+class PurchaseItem(TenantModel):
     """Modèle pour les articles d'un achat"""
     purchase = models.ForeignKey(Purchase, on_delete=models.CASCADE, verbose_name="Achat", related_name="items")
     product = models.ForeignKey(Product, on_delete=models.CASCADE, verbose_name="Produit", related_name="purchase_items")
     quantity = models.IntegerField(verbose_name="Quantité")
     unit_price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Prix unitaire")
     received_quantity = models.IntegerField(default=0, verbose_name="Quantité reçue")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Date de mise à jour")
+
+    tenant_parent = 'purchase'
 
     class Meta:
         verbose_name = "Article d'achat"
         verbose_name_plural = "Articles d'achat"
+        indexes = [
+            models.Index(fields=['tenant', 'product'], name='core_purchaseitem_tenant_prod'),
+            models.Index(fields=['tenant', 'updated_at'], name='core_purchaseitem_updated'),
+        ]
 
     def __str__(self):
         return f"{self.product.name} - {self.quantity}"
@@ -156,7 +331,7 @@ class PurchaseItem(models.Model):
         return self.quantity * self.unit_price
 
 
-class PurchasePayment(models.Model):
+class PurchasePayment(TenantModel):
     """Modèle pour les paiements effectués pour un achat"""
     PAYMENT_METHOD_CHOICES = (
         ('cash', 'Espèces'),
@@ -169,22 +344,37 @@ class PurchasePayment(models.Model):
     purchase = models.ForeignKey(Purchase, on_delete=models.CASCADE, verbose_name="Achat", related_name="payments")
     payment_date = models.DateField(verbose_name="Date de paiement", default=timezone.now)
     amount = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Montant")
+    currency = models.CharField(max_length=3, default=default_currency, verbose_name="Devise")
+    exchange_rate = models.DecimalField(max_digits=18, decimal_places=8, default=1, verbose_name="Taux de change")
+    amount_base = models.DecimalField(max_digits=14, decimal_places=2, default=0,
+                                      verbose_name="Montant (devise de base)")
     payment_method = models.CharField(max_length=20, choices=PAYMENT_METHOD_CHOICES, verbose_name="Méthode de paiement")
     reference = models.CharField(max_length=100, verbose_name="Référence", blank=True, null=True)
     notes = models.TextField(verbose_name="Notes", blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Date de mise à jour")
+
+    tenant_parent = 'purchase'
 
     class Meta:
         verbose_name = "Paiement d'achat"
         verbose_name_plural = "Paiements d'achat"
         ordering = ["-payment_date"]
+        indexes = [
+            models.Index(fields=['tenant', 'payment_date'], name='core_purchasepay_tenant_date'),
+            models.Index(fields=['tenant', 'updated_at'], name='core_purchasepay_updated'),
+        ]
 
     def __str__(self):
         return f"Paiement {self.id} - {self.purchase}"
 
     def save(self, *args, **kwargs):
         """Mise à jour du statut de paiement de l'achat après sauvegarde du paiement"""
-        super().save(*args, **kwargs)
         purchase = self.purchase
+        # Un paiement règle le document dans sa devise ; il est converti au taux du jour du paiement
+        self.currency = purchase.currency
+        self.exchange_rate = get_rate(self.currency, self.payment_date, self.assign_tenant())
+        self.amount_base = to_base(self.amount, self.exchange_rate)
+        super().save(*args, **kwargs)
         total_paid = purchase.total_paid
         total_amount = purchase.total_amount
         
@@ -198,7 +388,7 @@ class PurchasePayment(models.Model):
         purchase.save()
 
 
-class Customer(models.Model):
+class Customer(TenantModel):
     """Modèle pour gérer les clients"""
     name = models.CharField(max_length=100, verbose_name="Nom")
     phone = models.CharField(max_length=20, verbose_name="Téléphone", blank=True, null=True)
@@ -212,12 +402,16 @@ class Customer(models.Model):
         verbose_name = "Client"
         verbose_name_plural = "Clients"
         ordering = ["name"]
+        indexes = [
+            models.Index(fields=['tenant', 'name'], name='core_customer_tenant_name'),
+            models.Index(fields=['tenant', 'updated_at'], name='core_customer_tenant_updated'),
+        ]
 
     def __str__(self):
         return self.name
 
 
-class Sale(models.Model):
+class Sale(TenantModel):
     """Modèle pour gérer les ventes"""
     STATUS_CHOICES = (
         ('pending', 'En attente'),
@@ -226,6 +420,8 @@ class Sale(models.Model):
         ('delivered', 'Livrée'),
         ('cancelled', 'Annulée'),
     )
+    # Statuts dont les lignes sont retirées du stock
+    SOLD_STATUSES = ('confirmed', 'shipped', 'delivered')
     
     PAYMENT_STATUS_CHOICES = (
         ('unpaid', 'Non payé'),
@@ -241,18 +437,41 @@ class Sale(models.Model):
                                      verbose_name="Statut de paiement")
     expected_delivery_date = models.DateField(verbose_name="Date de livraison prévue", blank=True, null=True)
     actual_delivery_date = models.DateField(verbose_name="Date de livraison effective", blank=True, null=True)
+    currency = models.CharField(max_length=3, default=default_currency, verbose_name="Devise")
+    exchange_rate = models.DecimalField(max_digits=18, decimal_places=8, default=1,
+                                        verbose_name="Taux de change", help_text="Valeur d'une unité en devise de base")
+    total_amount_base = models.DecimalField(max_digits=14, decimal_places=2, default=0,
+                                            verbose_name="Montant total (devise de base)")
     notes = models.TextField(verbose_name="Notes", blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Date de création")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Date de mise à jour")
 
+    tenant_parent = 'customer'
+
     class Meta:
         verbose_name = "Vente"
         verbose_name_plural = "Ventes"
         ordering = ["-sale_date"]
+        indexes = [
+            # Relevé de compte client : ventes d'un client par date
+            models.Index(fields=['tenant', 'customer', 'sale_date'], name='core_sale_customer_date'),
+            models.Index(fields=['tenant', 'sale_date'], name='core_sale_tenant_date'),
+            models.Index(fields=['tenant', 'updated_at'], name='core_sale_tenant_updated'),
+        ]
 
     def __str__(self):
         return f"Vente {self.id} - {self.customer.name}"
 
+    def save(self, *args, **kwargs):
+        """Fixe le taux de change à la date du document ; le total converti suit les lignes"""
+        rate = get_rate(self.currency, self.sale_date, self.assign_tenant())
+        rate_changed = self.pk is not None and rate != self.exchange_rate
+        self.exchange_rate = rate
+        super().save(*args, **kwargs)
+        if rate_changed:
+            refresh_base_totals(Sale, [self.pk])
+            self.refresh_from_db(fields=['total_amount_base'])
+
     @property
     def total_amount(self):
         """Calcule le montant total de la vente"""
@@ -279,17 +498,24 @@ class Sale(models.Model):
         return None
 
 
-class SaleItem(models.Model):
+class SaleItem(TenantModel):
     """Modèle pour les articles d'une vente"""
     sale = models.ForeignKey(Sale, on_delete=models.CASCADE, verbose_name="Vente", related_name="items")
     product = models.ForeignKey(Product, on_delete=models.CASCADE, verbose_name="Produit", related_name="sale_items")
     quantity = models.IntegerField(verbose_name="Quantité")
     unit_price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Prix unitaire")
     discount = models.DecimalField(max_digits=10, decimal_places=2, default=0, verbose_name="Remise")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Date de mise à jour")
+
+    tenant_parent = 'sale'
 
     class Meta:
         verbose_name = "Article de vente"
         verbose_name_plural = "Articles de vente"
+        indexes = [
+            models.Index(fields=['tenant', 'product'], name='core_saleitem_tenant_product'),
+            models.Index(fields=['tenant', 'updated_at'], name='core_saleitem_tenant_updated'),
+        ]
 
     def __str__(self):
         return f"{self.product.name} - {self.quantity}"
@@ -311,14 +537,14 @@ class SaleItem(models.Model):
         super().save(*args, **kwargs)
         
         # Mettre à jour le stock seulement si le statut de la vente est confirmée ou livrée
-        if self.sale.status in ['confirmed', 'shipped', 'delivered']:
+        if self.sale.status in Sale.SOLD_STATUSES:
             quantity_difference = self.quantity - old_quantity
             if quantity_difference != 0:
                 self.product.stock_quantity -= quantity_difference
                 self.product.save()
 
 
-class SalePayment(models.Model):
+class SalePayment(TenantModel):
     """Modèle pour les paiements reçus pour une vente"""
     PAYMENT_METHOD_CHOICES = (
         ('cash', 'Espèces'),
@@ -331,22 +557,37 @@ class SalePayment(models.Model):
     sale = models.ForeignKey(Sale, on_delete=models.CASCADE, verbose_name="Vente", related_name="payments")
     payment_date = models.DateField(verbose_name="Date de paiement", default=timezone.now)
     amount = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Montant")
+    currency = models.CharField(max_length=3, default=default_currency, verbose_name="Devise")
+    exchange_rate = models.DecimalField(max_digits=18, decimal_places=8, default=1, verbose_name="Taux de change")
+    amount_base = models.DecimalField(max_digits=14, decimal_places=2, default=0,
+                                      verbose_name="Montant (devise de base)")
     payment_method = models.CharField(max_length=20, choices=PAYMENT_METHOD_CHOICES, verbose_name="Méthode de paiement")
     reference = models.CharField(max_length=100, verbose_name="Référence", blank=True, null=True)
     notes = models.TextField(verbose_name="Notes", blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Date de mise à jour")
+
+    tenant_parent = 'sale'
 
     class Meta:
         verbose_name = "Paiement de vente"
         verbose_name_plural = "Paiements de vente"
         ordering = ["-payment_date"]
+        indexes = [
+            models.Index(fields=['tenant', 'payment_date'], name='core_salepay_tenant_date'),
+            models.Index(fields=['tenant', 'updated_at'], name='core_salepay_updated'),
+        ]
 
     def __str__(self):
         return f"Paiement {self.id} - {self.sale}"
 
     def save(self, *args, **kwargs):
         """Mise à jour du statut de paiement de la vente après sauvegarde du paiement"""
-        super().save(*args, **kwargs)
         sale = self.sale
+        # Un paiement règle le document dans sa devise ; il est converti au taux du jour du paiement
+        self.currency = sale.currency
+        self.exchange_rate = get_rate(self.currency, self.payment_date, self.assign_tenant())
+        self.amount_base = to_base(self.amount, self.exchange_rate)
+        super().save(*args, **kwargs)
         total_paid = sale.total_paid
         total_amount = sale.total_amount
         
@@ -360,7 +601,7 @@ class SalePayment(models.Model):
         sale.save()
 
 
-class StockMovement(models.Model):
+class StockMovement(TenantModel):
     """Modèle pour suivre les mouvements de stock"""
     MOVEMENT_TYPE_CHOICES = (
         ('in', 'Entrée'),
@@ -374,11 +615,19 @@ class StockMovement(models.Model):
     reference = models.CharField(max_length=100, verbose_name="Référence", blank=True, null=True)
     date = models.DateTimeField(verbose_name="Date", default=timezone.now)
     notes = models.TextField(verbose_name="Notes", blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Date de mise à jour")
+
+    tenant_parent = 'product'
 
     class Meta:
         verbose_name = "Mouvement de stock"
         verbose_name_plural = "Mouvements de stock"
         ordering = ["-date"]
+        indexes = [
+            models.Index(fields=['tenant', 'product', 'date'], name='core_stockmove_tenant_product'),
+            models.Index(fields=['tenant', 'date'], name='core_stockmove_tenant_date'),
+            models.Index(fields=['tenant', 'updated_at'], name='core_stockmove_tenant_updated'),
+        ]
 
     def __str__(self):
         return f"{self.movement_type} - {self.product.name} - {self.quantity}"
@@ -398,7 +647,37 @@ class StockMovement(models.Model):
         self.product.save()
 
 
-class Invoice(models.Model):
+class StockReservation(TenantModel):
+    """
+    Quantité d'un produit réservée par une vente en attente jusqu'à son
+    expiration (voir core.reservations)
+    """
+    sale = models.ForeignKey(Sale, on_delete=models.CASCADE, verbose_name="Vente", related_name="reservations")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, verbose_name="Produit", related_name="reservations")
+    quantity = models.PositiveIntegerField(verbose_name="Quantité")
+    expires_at = models.DateTimeField(verbose_name="Expire le")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Date de création")
+
+    tenant_parent = 'sale'
+
+    class Meta:
+        verbose_name = "Réservation de stock"
+        verbose_name_plural = "Réservations de stock"
+        constraints = [
+            models.UniqueConstraint(fields=['sale', 'product'], name='core_reservation_sale_product'),
+        ]
+        indexes = [
+            # Stock réservé d'un produit : réservations en cours
+            models.Index(fields=['tenant', 'product', 'expires_at'], name='core_reservation_product'),
+            # Libération des réservations expirées, toutes boutiques confondues
+            models.Index(fields=['expires_at'], name='core_reservation_expires'),
+        ]
+
+    def __str__(self):
+        return f"{self.product.name} - {self.quantity}"
+
+
+class Invoice(TenantModel):
     """Modèle pour les factures"""
     STATUS_CHOICES = (
         ('draft', 'Brouillon'),
@@ -409,7 +688,8 @@ class Invoice(models.Model):
     )
     
     sale = models.OneToOneField(Sale, on_delete=models.CASCADE, verbose_name="Vente", related_name="invoice")
-    invoice_number = models.CharField(max_length=50, verbose_name="Numéro de facture", unique=True)
+    # Unique dans la boutique, attribué par core.invoices.next_invoice_number
+    invoice_number = models.CharField(max_length=50, verbose_name="Numéro de facture")
     issue_date = models.DateField(verbose_name="Date d'émission", default=timezone.now)
     due_date = models.DateField(verbose_name="Date d'échéance", blank=True, null=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='draft', verbose_name="Statut")
@@ -417,10 +697,19 @@ class Invoice(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Date de création")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Date de mise à jour")
 
+    tenant_parent = 'sale'
+
     class Meta:
         verbose_name = "Facture"
         verbose_name_plural = "Factures"
         ordering = ["-issue_date"]
+        constraints = [
+            models.UniqueConstraint(fields=['tenant', 'invoice_number'], name='core_invoice_tenant_number'),
+        ]
+        indexes = [
+            models.Index(fields=['tenant', 'issue_date'], name='core_invoice_tenant_date'),
+            models.Index(fields=['tenant', 'updated_at'], name='core_invoice_tenant_updated'),
+        ]
 
     def __str__(self):
         return f"Facture {self.invoice_number}"
@@ -430,4 +719,412 @@ class Invoice(models.Model):
         """Vérifie si la facture est en retard de paiement"""
         if self.due_date and self.status not in ['paid', 'cancelled']:
             return self.due_date < timezone.now().date()
-        return False
\ No newline at end of file
+        return False
+
+
+class Job(models.Model):
+    """Modèle pour la file de tâches en arrière-plan (voir core.jobs)"""
+    STATUS_CHOICES = (
+        ('pending', 'En attente'),
+        ('running', 'En cours'),
+        ('succeeded', 'Terminée'),
+        ('failed', 'Échouée'),
+        ('cancelled', 'Annulée'),
+    )
+
+    # Boutique pour laquelle la tâche s'exécute ; vide pour les tâches de maintenance globales
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, null=True, blank=True, editable=False,
+                               db_index=False, verbose_name="Boutique", related_name="+")
+    name = models.CharField(max_length=100, verbose_name="Tâche")
+    payload = models.JSONField(default=dict, blank=True, verbose_name="Paramètres")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name="Statut")
+    priority = models.IntegerField(default=0, verbose_name="Priorité")
+    run_at = models.DateTimeField(default=timezone.now, verbose_name="Exécution prévue le")
+    attempts = models.PositiveIntegerField(default=0, verbose_name="Tentatives")
+    max_attempts = models.PositiveIntegerField(default=3, verbose_name="Tentatives maximum")
+    progress = models.PositiveIntegerField(default=0, verbose_name="Avancement")
+    progress_total = models.PositiveIntegerField(blank=True, null=True, verbose_name="Avancement total")
+    progress_message = models.CharField(max_length=200, blank=True, default='', verbose_name="Étape en cours")
+    result = models.JSONField(blank=True, null=True, verbose_name="Résultat")
+    last_error = models.TextField(blank=True, default='', verbose_name="Dernière erreur")
+    # Garantit l'unicité d'une tâche planifiée (une exécution par créneau pour les tâches périodiques)
+    dedupe_key = models.CharField(max_length=200, unique=True, blank=True, null=True, verbose_name="Clé d'unicité")
+    locked_by = models.CharField(max_length=100, blank=True, default='', verbose_name="Worker")
+    locked_at = models.DateTimeField(blank=True, null=True, verbose_name="Dernier signe de vie")
+    started_at = models.DateTimeField(blank=True, null=True, verbose_name="Démarrée le")
+    finished_at = models.DateTimeField(blank=True, null=True, verbose_name="Terminée le")
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True,
+                                   verbose_name="Créée par", related_name="jobs")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Date de création")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Date de mise à jour")
+
+    objects = TenantManager()
+    all_tenants = models.Manager()
+
+    class Meta:
+        verbose_name = "Tâche"
+        verbose_name_plural = "Tâches"
+        ordering = ["-created_at"]
+        indexes = [
+            # Prise des tâches : statut puis date d'exécution, toutes boutiques confondues
+            models.Index(fields=['status', 'run_at'], name='core_job_status_run_at'),
+            models.Index(fields=['tenant', 'created_at'], name='core_job_tenant_created'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.id}"
+
+    @property
+    def percent(self):
+        """Avancement en pourcentage, si la tâche annonce un total"""
+        if self.status == 'succeeded':
+            return 100
+        if self.progress_total:
+            return min(100, round(self.progress * 100 / self.progress_total))
+        return None
+
+    def set_progress(self, done, total=None, message=None):
+        """Publie l'avancement ; vaut aussi signe de vie pour le worker qui exécute la tâche"""
+        self.progress = done
+        changes = {'progress': done, 'locked_at': timezone.now()}
+        if total is not None:
+            self.progress_total = changes['progress_total'] = total
+        if message is not None:
+            self.progress_message = changes['progress_message'] = message[:200]
+        Job.all_tenants.filter(pk=self.pk).update(**changes)
+
+
+class IdempotencyKey(TenantModel):
+    """Modèle pour les clés d'idempotence : réponse mémorisée d'une requête d'écriture (voir core.idempotency)"""
+    key = models.CharField(max_length=255, verbose_name="Clé")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True,
+                             verbose_name="Utilisateur", related_name="idempotency_keys")
+    method = models.CharField(max_length=10, verbose_name="Méthode")
+    path = models.CharField(max_length=500, verbose_name="Chemin")
+    fingerprint = models.CharField(max_length=64, verbose_name="Empreinte de la requête")
+    # Vide tant que la requête d'origine est en cours de traitement
+    status_code = models.PositiveSmallIntegerField(blank=True, null=True, verbose_name="Code de réponse")
+    response_body = models.JSONField(blank=True, null=True, encoder=DjangoJSONEncoder, verbose_name="Réponse")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Date de création")
+    expires_at = models.DateTimeField(db_index=True, verbose_name="Expire le")
+
+    class Meta:
+        verbose_name = "Clé d'idempotence"
+        verbose_name_plural = "Clés d'idempotence"
+        constraints = [
+            models.UniqueConstraint(fields=['tenant', 'user', 'key'], name='core_idempotency_user_key'),
+        ]
+
+    def __str__(self):
+        return self.key
+
+
+class AuditLog(models.Model):
+    """Modèle pour le journal d'audit : une ligne par création, modification ou suppression (voir core.audit)"""
+    ACTION_CHOICES = (
+        ('c', 'Création'),
+        ('u', 'Modification'),
+        ('d', 'Suppression'),
+    )
+
+    # Vide pour une entrée écrite hors boutique
+    tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, null=True, blank=True, editable=False,
+                               db_index=False, verbose_name="Boutique", related_name="+")
+    model = models.CharField(max_length=50, verbose_name="Modèle")
+    object_id = models.BigIntegerField(verbose_name="Identifiant de l'objet")
+    action = models.CharField(max_length=1, choices=ACTION_CHOICES, verbose_name="Action")
+    # Création : {champ: valeur} ; modification : {champ: [avant, après]} ; suppression : dernières valeurs
+    changes = models.JSONField(default=dict, encoder=DjangoJSONEncoder, verbose_name="Modifications")
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True,
+                             verbose_name="Utilisateur", related_name="audit_logs")
+    timestamp = models.DateTimeField(default=timezone.now, verbose_name="Date")
+
+    objects = TenantManager()
+    all_tenants = models.Manager()
+
+    class Meta:
+        verbose_name = "Entrée du journal d'audit"
+        verbose_name_plural = "Journal d'audit"
+        ordering = ["-id"]
+        indexes = [
+            # Historique d'un objet et activité d'un utilisateur, du plus récent au plus ancien
+            models.Index(fields=['tenant', 'model', 'object_id', '-id'], name='core_audit_object'),
+            models.Index(fields=['tenant', 'user', '-id'], name='core_audit_user'),
+            models.Index(fields=['tenant', '-id'], name='core_audit_tenant'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_action_display()} {self.model} #{self.object_id}"
+
+    def save(self, *args, **kwargs):
+        # Journal en ajout seul : une entrée enregistrée n'est jamais modifiée
+        if self.pk is not None:
+            raise ValueError("Une entrée du journal d'audit ne peut pas être modifiée.")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValueError("Une entrée du journal d'audit ne peut pas être supprimée.")
+
+
+class SupplierScore(TenantModel):
+    """Indicateurs de performance d'un fournisseur, pré-calculés (voir core.scorecards)"""
+    supplier = models.OneToOneField(Supplier, on_delete=models.CASCADE, primary_key=True,
+                                    verbose_name="Fournisseur", related_name="score")
+    received_purchases = models.PositiveIntegerField(default=0, verbose_name="Achats reçus")
+    lead_time_avg = models.DecimalField(max_digits=7, decimal_places=1, blank=True, null=True,
+                                        verbose_name="Délai moyen (jours)")
+    lead_time_p50 = models.PositiveIntegerField(blank=True, null=True, verbose_name="Délai médian (jours)")
+    lead_time_p90 = models.PositiveIntegerField(blank=True, null=True, verbose_name="Délai 90e centile (jours)")
+    on_time_rate = models.DecimalField(max_digits=5, decimal_places=1, blank=True, null=True,
+                                       verbose_name="Livraisons à l'heure (%)")
+    fill_rate = models.DecimalField(max_digits=5, decimal_places=1, blank=True, null=True,
+                                    verbose_name="Taux de service (%)")
+    ordered_quantity = models.PositiveIntegerField(default=0, verbose_name="Quantité commandée")
+    received_quantity = models.PositiveIntegerField(default=0, verbose_name="Quantité reçue")
+    last_receipt_date = models.DateField(blank=True, null=True, verbose_name="Dernière réception")
+    refreshed_at = models.DateTimeField(default=timezone.now, verbose_name="Calculé le")
+
+    tenant_parent = 'supplier'
+
+    class Meta:
+        verbose_name = "Performance fournisseur"
+        verbose_name_plural = "Performances fournisseurs"
+        indexes = [
+            models.Index(fields=['tenant', 'supplier'], name='core_supplierscore_tenant'),
+        ]
+
+    def __str__(self):
+        return f"Performance {self.supplier_id}"
+
+
+class SupplierProductScore(TenantModel):
+    """Indicateurs de performance d'un fournisseur pour un produit, pré-calculés (voir core.scorecards)"""
+    supplier = models.ForeignKey(Supplier, on_delete=models.CASCADE, verbose_name="Fournisseur",
+                                 related_name="product_scores")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, verbose_name="Produit",
+                                related_name="supplier_scores")
+    received_purchases = models.PositiveIntegerField(default=0, verbose_name="Achats reçus")
+    lead_time_avg = models.DecimalField(max_digits=7, decimal_places=1, blank=True, null=True,
+                                        verbose_name="Délai moyen (jours)")
+    fill_rate = models.DecimalField(max_digits=5, decimal_places=1, blank=True, null=True,
+                                    verbose_name="Taux de service (%)")
+    ordered_quantity = models.PositiveIntegerField(default=0, verbose_name="Quantité commandée")
+    received_quantity = models.PositiveIntegerField(default=0, verbose_name="Quantité reçue")
+    average_unit_price = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True,
+                                             verbose_name="Prix unitaire moyen")
+    recent_unit_price = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True,
+                                            verbose_name="Prix unitaire moyen récent")
+    # Variation du prix moyen entre la période récente et la précédente, en pourcentage
+    price_trend = models.DecimalField(max_digits=7, decimal_places=1, blank=True, null=True,
+                                      verbose_name="Tendance du prix (%)")
+
+    tenant_parent = 'supplier'
+
+    class Meta:
+        verbose_name = "Performance fournisseur par produit"
+        verbose_name_plural = "Performances fournisseurs par produit"
+        ordering = ["supplier", "product"]
+        constraints = [
+            models.UniqueConstraint(fields=['tenant', 'supplier', 'product'], name='core_supplier_product_score'),
+        ]
+
+    def __str__(self):
+        return f"Performance {self.supplier_id} / {self.product_id}"
+
+
+class ProductForecast(TenantModel):
+    """Prévision de la demande et point de commande d'un produit, pré-calculés (voir core.replenishment)"""
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True,
+                                   verbose_name="Produit", related_name="forecast")
+    daily_velocity = models.DecimalField(max_digits=10, decimal_places=3, default=0,
+                                         verbose_name="Ventes moyennes par jour")
+    seasonality = models.DecimalField(max_digits=5, decimal_places=2, default=1, verbose_name="Coefficient saisonnier")
+    daily_forecast = models.DecimalField(max_digits=10, decimal_places=3, default=0,
+                                         verbose_name="Prévision de ventes par jour")
+    lead_time_days = models.DecimalField(max_digits=7, decimal_places=1, verbose_name="Délai d'approvisionnement (jours)")
+    safety_stock = models.PositiveIntegerField(default=0, verbose_name="Stock de sécurité")
+    reorder_point = models.PositiveIntegerField(default=0, verbose_name="Point de commande")
+    on_order = models.PositiveIntegerField(default=0, verbose_name="Quantité en commande")
+    reorder_quantity = models.PositiveIntegerField(default=0, verbose_name="Quantité à commander")
+    refreshed_at = models.DateTimeField(default=timezone.now, verbose_name="Calculé le")
+
+    tenant_parent = 'product'
+
+    class Meta:
+        verbose_name = "Prévision produit"
+        verbose_name_plural = "Prévisions produits"
+        indexes = [
+            # Suggestions de commande : produits à recommander
+            models.Index(fields=['tenant', 'reorder_quantity'], name='core_forecast_reorder_qty'),
+        ]
+
+    def __str__(self):
+        return f"Prévision {self.product_id}"
+
+
+class ExchangeRate(TenantModel):
+    """Taux de change daté : valeur d'une unité de la devise en devise de base (voir core.currency)"""
+    currency = models.CharField(max_length=3, verbose_name="Devise")
+    date = models.DateField(verbose_name="Date")
+    rate = models.DecimalField(max_digits=18, decimal_places=8, verbose_name="Taux")
+
+    class Meta:
+        verbose_name = "Taux de change"
+        verbose_name_plural = "Taux de change"
+        ordering = ["currency", "-date"]
+        constraints = [
+            models.UniqueConstraint(fields=['tenant', 'currency', 'date'], name='core_exchange_rate_currency_date'),
+        ]
+
+    def __str__(self):
+        return f"{self.currency} {self.date} : {self.rate}"
+
+
+class Tombstone(TenantModel):
+    """Suppression d'une ligne, gardée pour le flux de synchronisation (voir core.sync)"""
+    model = models.CharField(max_length=50, verbose_name="Modèle")
+    object_id = models.BigIntegerField(verbose_name="Identifiant")
+    deleted_at = models.DateTimeField(default=timezone.now, verbose_name="Date de suppression")
+
+    class Meta:
+        verbose_name = "Suppression"
+        verbose_name_plural = "Suppressions"
+        indexes = [
+            models.Index(fields=['tenant', 'deleted_at'], name='core_tombstone_tenant_deleted'),
+        ]
+
+    def __str__(self):
+        return f"{self.model} {self.object_id}"
+
+
+class AccountingPeriod(TenantModel):
+    """
+    Période comptable clôturée, mois ou année (voir core.periods) : les
+    documents datés jusqu'à sa fin sont figés et ses soldes sont enregistrés.
+    """
+    KIND_CHOICES = (
+        ('month', 'Mois'),
+        ('year', 'Année'),
+    )
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, verbose_name="Type")
+    start = models.DateField(verbose_name="Début")
+    end = models.DateField(verbose_name="Fin")
+    closed_at = models.DateTimeField(default=timezone.now, verbose_name="Clôturée le")
+    closed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True,
+                                  verbose_name="Clôturée par", related_name="+")
+
+    class Meta:
+        verbose_name = "Période clôturée"
+        verbose_name_plural = "Périodes clôturées"
+        ordering = ["-end"]
+        constraints = [
+            models.UniqueConstraint(fields=['tenant', 'end'], name='core_period_tenant_end'),
+        ]
+
+    def __str__(self):
+        return f"{self.start:%Y}" if self.kind == 'year' else f"{self.start:%m/%Y}"
+
+
+class PeriodBalance(TenantModel):
+    """
+    Soldes figés d'une période clôturée pour un produit (ventes, coût des
+    ventes, stock), un client (ventes, créance) ou un fournisseur (achats, dette).
+    Montants en devise de base ; créances, dettes et stock à la fin de la période.
+    """
+    period = models.ForeignKey(AccountingPeriod, on_delete=models.CASCADE, verbose_name="Période",
+                               related_name="balances")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, null=True, blank=True, verbose_name="Produit",
+                                related_name="+")
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, null=True, blank=True, verbose_name="Client",
+                                 related_name="+")
+    supplier = models.ForeignKey(Supplier, on_delete=models.CASCADE, null=True, blank=True,
+                                 verbose_name="Fournisseur", related_name="+")
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Chiffre d'affaires")
+    cogs = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Coût des ventes")
+    quantity_sold = models.IntegerField(default=0, verbose_name="Quantité vendue")
+    purchases = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Achats")
+    receivable = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Créance")
+    payable = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Dette")
+    stock_quantity = models.IntegerField(default=0, verbose_name="Stock")
+    stock_value = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Valeur du stock")
+
+    tenant_parent = 'period'
+
+    class Meta:
+        verbose_name = "Solde de période"
+        verbose_name_plural = "Soldes de période"
+        indexes = [
+            models.Index(fields=['tenant', 'period'], name='core_periodbalance_period'),
+        ]
+
+    def __str__(self):
+        return f"{self.period} - {self.product_id or self.customer_id or self.supplier_id}"
+
+
+def archive_model(model, verbose_name, verbose_name_plural, parents=None, indexes=()):
+    """
+    Table d'archive d'un modèle (voir core.archive) : mêmes colonnes, mêmes
+    identifiants et mêmes propriétés calculées, pour que vues et sérialiseurs
+    lisent une ligne archivée comme une ligne vivante. Les relations vers un
+    document archivé (parents : {champ: modèle d'archive}) pointent vers son
+    archive sous le même nom (items, payments, invoice) ; les autres n'ont pas
+    de relation inverse.
+    """
+    parents = parents or {}
+    attrs = {'__module__': __name__, 'tenant_parent': model.tenant_parent}
+    for field in model._meta.local_fields:
+        if field.name == 'tenant':
+            continue
+        if field.primary_key:
+            # Identifiant repris de la ligne vivante, jamais généré
+            pk_class = models.BigIntegerField if isinstance(field, models.BigAutoField) else models.IntegerField
+            attrs[field.name] = pk_class(primary_key=True, verbose_name="ID")
+        elif field.is_relation:
+            parent = parents.get(field.name)
+            attrs[field.name] = type(field)(
+                parent or field.remote_field.model, on_delete=field.remote_field.on_delete,
+                null=field.null, blank=field.blank, verbose_name=field.verbose_name,
+                related_name=field.remote_field.related_name if parent else '+',
+            )
+        else:
+            attrs[field.name] = field.clone()
+    for name, value in vars(model).items():
+        if isinstance(value, property) or name == '__str__':
+            attrs[name] = value
+    attrs['Meta'] = type('Meta', (), {
+        'verbose_name': verbose_name,
+        'verbose_name_plural': verbose_name_plural,
+        'ordering': model._meta.ordering,
+        'indexes': list(indexes),
+    })
+    return type(f"Archived{model.__name__}", (TenantModel,), attrs)
+
+
+ArchivedPurchase = archive_model(Purchase, "Achat archivé", "Achats archivés", indexes=[
+    models.Index(fields=['tenant', 'supplier', 'order_date'], name='core_archpurchase_supplier_dt'),
+    models.Index(fields=['tenant', 'order_date'], name='core_archpurchase_tenant_date'),
+])
+ArchivedPurchaseItem = archive_model(PurchaseItem, "Article d'achat archivé", "Articles d'achat archivés",
+                                     parents={'purchase': ArchivedPurchase})
+ArchivedPurchasePayment = archive_model(PurchasePayment, "Paiement d'achat archivé", "Paiements d'achat archivés",
+                                        parents={'purchase': ArchivedPurchase})
+ArchivedSale = archive_model(Sale, "Vente archivée", "Ventes archivées", indexes=[
+    models.Index(fields=['tenant', 'customer', 'sale_date'], name='core_archsale_customer_date'),
+    models.Index(fields=['tenant', 'sale_date'], name='core_archsale_tenant_date'),
+])
+ArchivedSaleItem = archive_model(SaleItem, "Article de vente archivé", "Articles de vente archivés",
+                                 parents={'sale': ArchivedSale})
+ArchivedSalePayment = archive_model(SalePayment, "Paiement de vente archivé", "Paiements de vente archivés",
+                                    parents={'sale': ArchivedSale})
+ArchivedInvoice = archive_model(Invoice, "Facture archivée", "Factures archivées", parents={'sale': ArchivedSale},
+                                indexes=[
+                                    models.Index(fields=['tenant', 'invoice_number'], name='core_archinvoice_number'),
+                                    models.Index(fields=['tenant', 'issue_date'], name='core_archinvoice_tenant_date'),
+                                ])
+ArchivedStockMovement = archive_model(StockMovement, "Mouvement de stock archivé", "Mouvements de stock archivés",
+                                      indexes=[
+                                          models.Index(fields=['tenant', 'product', 'date'],
+                                                       name='core_archmove_tenant_product'),
+                                          models.Index(fields=['tenant', 'date'], name='core_archmove_tenant_date'),
+                                      ])
@@ -0,0 +1,131 @@
+"""
+Schéma OpenAPI précalculé.
+
+drf_yasg produit le schéma en introspectant toutes les vues et tous les
+sérialiseurs, ce qui prend plusieurs centaines de millisecondes par appel. Le
+schéma est donc généré une fois, au déploiement (python manage.py
+generate_schema), dans OPENAPI_SCHEMA_DIR, puis servi tel quel avec un ETag :
+un client qui possède déjà la version courante reçoit un 304. Les processus
+relisent le fichier lorsqu'il est régénéré. Sans fichier, le schéma est
+calculé au premier appel puis gardé en mémoire par le processus.
+"""
+import hashlib
+import logging
+import os
+import threading
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition, require_safe
+from drf_yasg import openapi
+from drf_yasg.codecs import OpenAPICodecJson, OpenAPICodecYaml
+from drf_yasg.generators import OpenAPISchemaGenerator
+
+logger = logging.getLogger(__name__)
+
+API_INFO = openapi.Info(
+    title="Finance App API",
+    default_version='v1',
+    description="API pour l'application de gestion des finances d'entreprise",
+    contact=openapi.Contact(email="contact@example.com"),
+    license=openapi.License(name="BSD License"),
+)
+
+# Extension de l'URL (swagger.json, swagger.yaml) : type de contenu et encodeur
+FORMATS = {
+    '.json': ('application/json', OpenAPICodecJson),
+    '.yaml': ('application/yaml', OpenAPICodecYaml),
+}
+
+
+@dataclass(frozen=True)
+class SchemaDocument:
+    content: bytes
+    etag: str
+    # Date de modification du fichier lu, None pour un schéma calculé en mémoire
+    mtime: int = None
+
+
+def schema_path(fmt):
+    return os.path.join(settings.OPENAPI_SCHEMA_DIR, f'swagger{fmt}')
+
+
+def build_schemas():
+    """Introspecte l'API et renvoie le schéma encodé dans chaque format"""
+    schema = OpenAPISchemaGenerator(API_INFO).get_schema(request=None, public=True)
+    return {fmt: codec(validators=[]).encode(schema) for fmt, (_, codec) in FORMATS.items()}
+
+
+def write_schemas(contents):
+    """Écrit les schémas dans OPENAPI_SCHEMA_DIR ; chaque fichier est remplacé d'un bloc"""
+    os.makedirs(settings.OPENAPI_SCHEMA_DIR, exist_ok=True)
+    paths = []
+    for fmt, content in contents.items():
+        path = schema_path(fmt)
+        temporary = f'{path}.tmp'
+        with open(temporary, 'wb') as stream:
+            stream.write(content)
+        # Un processus qui lit le fichier au même moment voit l'ancienne ou la nouvelle version, jamais un mélange
+        os.replace(temporary, path)
+        paths.append(path)
+    return paths
+
+
+def _document(content, mtime=None):
+    return SchemaDocument(content, hashlib.sha256(content).hexdigest()[:32], mtime)
+
+
+class SchemaStore:
+    """Schémas servis par le processus, relus quand le fichier généré change"""
+
+    def __init__(self):
+        self.documents = {}
+        self.lock = threading.Lock()
+
+    def get(self, fmt):
+        path = schema_path(fmt)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        document = self.documents.get(fmt)
+        if document is not None and (document.mtime == mtime or mtime is None):
+            return document
+        with self.lock:
+            document = self.documents.get(fmt)
+            if document is not None and (document.mtime == mtime or mtime is None):
+                return document
+            if mtime is not None:
+                with open(path, 'rb') as stream:
+                    self.documents[fmt] = _document(stream.read(), mtime)
+            else:
+                logger.warning("Schéma OpenAPI absent de %s : calcul en mémoire (lancer generate_schema)",
+                               settings.OPENAPI_SCHEMA_DIR)
+                for name, content in build_schemas().items():
+                    self.documents[name] = _document(content)
+            return self.documents[fmt]
+
+    def clear(self):
+        with self.lock:
+            self.documents.clear()
+
+
+store = SchemaStore()
+
+
+def _etag(request, format):
+    return store.get(format).etag if format in FORMATS else None
+
+
+@require_safe
+@condition(etag_func=_etag)
+def schema_file_view(request, format):
+    """Sert le schéma précalculé ; le client revalide à chaque fois et reçoit un 304 s'il est à jour"""
+    if format not in FORMATS:
+        raise Http404
+    document = store.get(format)
+    response = HttpResponse(document.content, content_type=FORMATS[format][0])
+    patch_cache_control(response, public=True, no_cache=True)
+    return response
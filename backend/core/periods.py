@@ -0,0 +1,357 @@
+"""
+Clôture des périodes comptables.
+
+Un mois ou une année se clôture une fois terminé, à la suite de la clôture
+précédente. Les ventes, achats, lignes, paiements, mouvements de stock et
+factures datés jusqu'à la fin de la dernière période clôturée sont figés :
+leur création, leur suppression ou la modification d'un champ saisi lève
+PeriodClosed (réponse 400 dans l'API). La clôture enregistre les soldes de
+la période en devise de base (PeriodBalance) : chiffre d'affaires, coût des
+ventes et stock par produit, chiffre d'affaires et créance par client,
+achats et dette par fournisseur.
+
+Les rapports lisent ces soldes pour les périodes clôturées et ne calculent,
+sur les tables vivantes et archivées, que les mouvements des dates non
+couvertes : créances, dettes et stock partent du dernier solde figé. Le coût
+des ventes est valorisé au prix d'achat du produit au moment du calcul, figé
+à la clôture pour les périodes clôturées.
+"""
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from django.db import models, transaction
+from django.db.models import Case, DecimalField, ExpressionWrapper, F, Max, Sum, Value, When
+from django.db.models.signals import pre_delete, pre_save
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.views import exception_handler as drf_exception_handler, set_rollback
+
+from .archive import ARCHIVES
+from .models import (
+    AccountingPeriod, Customer, Invoice, PeriodBalance, Product, Purchase, PurchaseItem, PurchasePayment, Sale,
+    SaleItem, SalePayment, StockMovement, Supplier, Tenant,
+)
+
+CENT = Decimal('0.01')
+AMOUNT = DecimalField(max_digits=24, decimal_places=8)
+
+# Colonnes de PeriodBalance renseignées pour chaque type de ligne
+FIELDS = {
+    'product': ('revenue', 'cogs', 'quantity_sold', 'stock_quantity', 'stock_value'),
+    'customer': ('revenue', 'receivable'),
+    'supplier': ('purchases', 'payable'),
+}
+FLOW_FIELDS = ('revenue', 'cogs', 'quantity_sold', 'purchases')
+BALANCE_FIELDS = ('receivable', 'payable', 'stock_quantity', 'stock_value')
+QUANTITY_FIELDS = ('quantity_sold', 'stock_quantity')
+# Type de ligne dont chaque total est la somme
+TOTALS = {'revenue': 'customer', 'cogs': 'product', 'quantity_sold': 'product', 'purchases': 'supplier',
+          'receivable': 'customer', 'payable': 'supplier', 'stock_quantity': 'product', 'stock_value': 'product'}
+PARTIES = {'product': Product, 'customer': Customer, 'supplier': Supplier}
+
+# Pour chaque modèle figé : date qui le rattache à une période et champs saisis qui ne changent plus
+# (le statut seulement vers ou depuis l'annulation, qui retire le document des totaux)
+GUARDED = {
+    Sale: ('sale_date', ('customer', 'sale_date', 'currency', 'exchange_rate', 'status')),
+    SaleItem: ('sale__sale_date', ('sale', 'product', 'quantity', 'unit_price', 'discount')),
+    SalePayment: ('payment_date', ('sale', 'payment_date', 'amount', 'currency', 'exchange_rate')),
+    Purchase: ('order_date', ('supplier', 'order_date', 'currency', 'exchange_rate', 'status')),
+    PurchaseItem: ('purchase__order_date', ('purchase', 'product', 'quantity', 'unit_price')),
+    PurchasePayment: ('payment_date', ('purchase', 'payment_date', 'amount', 'currency', 'exchange_rate')),
+    StockMovement: ('date', ('product', 'quantity', 'movement_type', 'date')),
+    Invoice: ('issue_date', ('sale', 'invoice_number', 'issue_date')),
+}
+
+
+class PeriodClosed(Exception):
+    """Écriture datée dans une période clôturée"""
+
+    def __init__(self, model, day, locked):
+        self.day = day
+        self.locked = locked
+        super().__init__(f"Période clôturée jusqu'au {locked:%d/%m/%Y} : écriture refusée "
+                         f"({model._meta.verbose_name.lower()} du {day:%d/%m/%Y}).")
+
+
+class PeriodError(Exception):
+    """Clôture ou réouverture impossible"""
+
+
+def _day(value):
+    # Les champs DateField ont timezone.now pour défaut : un datetime avant l'enregistrement
+    if isinstance(value, datetime):
+        return timezone.localdate(value) if timezone.is_aware(value) else value.date()
+    return value
+
+
+def _decimal(value):
+    # SQLite renvoie des flottants pour les sommes de décimaux
+    return Decimal(str(value or 0))
+
+
+def locked_through(tenant_id):
+    """Fin de la dernière période clôturée de la boutique, None si aucune"""
+    return AccountingPeriod.all_tenants.filter(tenant_id=tenant_id).aggregate(end=Max('end'))['end']
+
+
+def period_bounds(kind, year, month=None):
+    """Premier et dernier jour d'un mois ou d'une année"""
+    if kind == 'year':
+        return date(year, 1, 1), date(year, 12, 31)
+    following = date(year + month // 12, month % 12 + 1, 1)
+    return date(year, month, 1), following - timedelta(days=1)
+
+
+# Garde des périodes clôturées
+
+def _follow(instance, path):
+    for name in path.split('__'):
+        instance = getattr(instance, name)
+    return _day(instance)
+
+
+def _frozen(field, value):
+    if field.name == 'status':
+        return value == 'cancelled'
+    return value if isinstance(field, models.DateTimeField) else _day(value)
+
+
+def _check_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    locked = locked_through(instance.tenant_id)
+    if locked is None:
+        return
+    date_path, frozen = GUARDED[sender]
+    day = _follow(instance, date_path)
+    fields = [sender._meta.get_field(name) for name in frozen]
+    old = None
+    if not instance._state.adding:
+        old = sender.all_tenants.filter(pk=instance.pk).values(date_path, *(field.attname for field in fields))\
+            .first()
+    if old is None:
+        if day <= locked:
+            raise PeriodClosed(sender, day, locked)
+        return
+    old_day = _day(old[date_path])
+    if min(day, old_day) > locked:
+        return
+    if any(_frozen(field, old[field.attname]) != _frozen(field, getattr(instance, field.attname))
+           for field in fields):
+        raise PeriodClosed(sender, min(day, old_day), locked)
+
+
+def _check_delete(sender, instance, **kwargs):
+    locked = locked_through(instance.tenant_id)
+    if locked is None:
+        return
+    day = _follow(instance, GUARDED[sender][0])
+    if day <= locked:
+        raise PeriodClosed(sender, day, locked)
+
+
+def connect_signals():
+    for model in GUARDED:
+        name = model.__name__
+        pre_save.connect(_check_save, sender=model, dispatch_uid=f'periods_save_{name}')
+        pre_delete.connect(_check_delete, sender=model, dispatch_uid=f'periods_delete_{name}')
+
+
+def exception_handler(exc, context):
+    """Gestionnaire d'erreurs de l'API : une écriture dans une période clôturée est refusée (400)"""
+    if isinstance(exc, PeriodClosed):
+        set_rollback()
+        return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+    return drf_exception_handler(exc, context)
+
+
+# Calcul des soldes
+
+def _rows():
+    return defaultdict(lambda: defaultdict(Decimal))
+
+
+def _both(model, tenant_id):
+    """Lignes de la boutique dans la table vivante puis dans son archive"""
+    return [table.all_tenants.filter(tenant_id=tenant_id) for table in (model, ARCHIVES[model])]
+
+
+def _between(queryset, field, after, through):
+    """Lignes datées après after et jusqu'à through inclus (bornes facultatives)"""
+    if after is not None:
+        queryset = queryset.filter(**{f'{field}__gt': after})
+    if through is not None:
+        queryset = queryset.filter(**{f'{field}__lte': through})
+    return queryset
+
+
+def _sum_into(rows, kind, queryset, key, **values):
+    """Ajoute aux lignes de type kind les sommes des expressions, regroupées par key"""
+    sums = {name: Sum(ExpressionWrapper(expression, output_field=AMOUNT)) for name, expression in values.items()}
+    for row in queryset.order_by().values(key).annotate(**sums):
+        bucket = rows[(kind, row[key])]
+        for name in values:
+            bucket[name] += _decimal(row[name])
+
+
+def _add_flows(rows, tenant_id, after, through):
+    """Ventes, coût des ventes et achats des documents datés sur l'intervalle"""
+    for items in _both(SaleItem, tenant_id):
+        items = _between(items.exclude(sale__status='cancelled'), 'sale__sale_date', after, through)
+        _sum_into(rows, 'product', items, 'product',
+                  revenue=(F('quantity') * F('unit_price') - F('discount')) * F('sale__exchange_rate'),
+                  cogs=F('quantity') * F('product__buying_price'), quantity_sold=F('quantity'))
+    for sales in _both(Sale, tenant_id):
+        _sum_into(rows, 'customer', _between(sales.exclude(status='cancelled'), 'sale_date', after, through),
+                  'customer', revenue=F('total_amount_base'))
+    for purchases in _both(Purchase, tenant_id):
+        _sum_into(rows, 'supplier', _between(purchases.exclude(status='cancelled'), 'order_date', after, through),
+                  'supplier', purchases=F('total_amount_base'))
+
+
+def _add_balance_moves(rows, tenant_id, after, through):
+    """Variation des créances et dettes sur l'intervalle : documents moins paiements, comme les relevés"""
+    for sales in _both(Sale, tenant_id):
+        _sum_into(rows, 'customer', _between(sales.exclude(status='cancelled'), 'sale_date', after, through),
+                  'customer', receivable=F('total_amount_base'))
+    for payments in _both(SalePayment, tenant_id):
+        _sum_into(rows, 'customer', _between(payments, 'payment_date', after, through), 'sale__customer',
+                  receivable=-F('amount_base'))
+    for purchases in _both(Purchase, tenant_id):
+        _sum_into(rows, 'supplier', _between(purchases.exclude(status='cancelled'), 'order_date', after, through),
+                  'supplier', payable=F('total_amount_base'))
+    for payments in _both(PurchasePayment, tenant_id):
+        _sum_into(rows, 'supplier', _between(payments, 'payment_date', after, through), 'purchase__supplier',
+                  payable=-F('amount_base'))
+
+
+def _add_stock_moves(rows, tenant_id, after, through, sign=1):
+    """Variation du stock sur l'intervalle (retranchée si sign vaut -1) : mouvements et lignes vendues"""
+    movement = Case(When(movement_type='out', then=F('quantity') * Value(-sign)), default=F('quantity') * Value(sign))
+    for movements in _both(StockMovement, tenant_id):
+        _sum_into(rows, 'product', _between(movements, 'date__date', after, through), 'product',
+                  stock_quantity=movement)
+    for items in _both(SaleItem, tenant_id):
+        items = _between(items.filter(sale__status__in=Sale.SOLD_STATUSES), 'sale__sale_date', after, through)
+        _sum_into(rows, 'product', items, 'product', stock_quantity=F('quantity') * Value(-sign))
+
+
+def _add_snapshots(rows, periods, fields):
+    """Ajoute les soldes figés des périodes données"""
+    balances = PeriodBalance.all_tenants.filter(period__in=periods).order_by()\
+        .values('product', 'customer', 'supplier').annotate(**{field: Sum(field) for field in fields})
+    for balance in balances:
+        kind = next(kind for kind in FIELDS if balance[kind] is not None)
+        bucket = rows[(kind, balance[kind])]
+        for field in fields:
+            if field in FIELDS[kind]:
+                bucket[field] += _decimal(balance[field])
+
+
+def _add_balances(rows, tenant_id, end, snapshot):
+    """Créances, dettes et stock à la date end, à partir de la dernière période clôturée snapshot (ou None)"""
+    if snapshot is not None:
+        _add_snapshots(rows, [snapshot], BALANCE_FIELDS)
+        if snapshot.end == end:
+            return
+        _add_balance_moves(rows, tenant_id, snapshot.end, end)
+        _add_stock_moves(rows, tenant_id, snapshot.end, end)
+    else:
+        _add_balance_moves(rows, tenant_id, None, end)
+        # Stock actuel, dont on retranche ce qui a bougé après end
+        _sum_into(rows, 'product', Product.all_tenants.filter(tenant_id=tenant_id), 'id',
+                  stock_quantity=F('stock_quantity'))
+        _add_stock_moves(rows, tenant_id, end, None, sign=-1)
+    # Stock valorisé au prix d'achat actuel
+    prices = dict(Product.all_tenants.filter(tenant_id=tenant_id).values_list('id', 'buying_price'))
+    for (kind, key), bucket in rows.items():
+        if kind == 'product':
+            bucket['stock_value'] = bucket['stock_quantity'] * prices.get(key, 0)
+
+
+def _clean(bucket, fields):
+    return {field: int(bucket[field]) if field in QUANTITY_FIELDS else bucket[field].quantize(CENT)
+            for field in fields}
+
+
+# Clôture et rapports
+
+def close_period(tenant_id, kind, start, end, user=None):
+    """
+    Clôture la période [start, end] de la boutique et enregistre ses soldes ;
+    renvoie la période. Lève PeriodError si elle ne suit pas la dernière
+    clôture ou n'est pas terminée.
+    """
+    with transaction.atomic():
+        # Une clôture à la fois par boutique
+        Tenant.objects.select_for_update().get(pk=tenant_id)
+        last = AccountingPeriod.all_tenants.filter(tenant_id=tenant_id).order_by('-end').first()
+        if last is not None and start != last.end + timedelta(days=1):
+            following = last.end + timedelta(days=1)
+            raise PeriodError(f"La prochaine période à clôturer commence le {following:%d/%m/%Y}.")
+        if end >= timezone.localdate():
+            raise PeriodError(f"La période se termine le {end:%d/%m/%Y} : elle ne peut être clôturée qu'ensuite.")
+
+        rows = _rows()
+        _add_flows(rows, tenant_id, start - timedelta(days=1), end)
+        _add_balances(rows, tenant_id, end, last)
+        period = AccountingPeriod.all_tenants.create(tenant_id=tenant_id, kind=kind, start=start, end=end,
+                                                     closed_by=user)
+        PeriodBalance.all_tenants.bulk_create([
+            PeriodBalance(tenant_id=tenant_id, period=period, **{f'{kind}_id': key}, **values)
+            for (kind, key), bucket in rows.items()
+            if any((values := _clean(bucket, FIELDS[kind])).values())
+        ], batch_size=1000)
+    return period
+
+
+def reopen_period(tenant_id):
+    """Rouvre la dernière période clôturée de la boutique et supprime ses soldes ; renvoie la période"""
+    with transaction.atomic():
+        Tenant.objects.select_for_update().get(pk=tenant_id)
+        period = AccountingPeriod.all_tenants.filter(tenant_id=tenant_id).order_by('-end').first()
+        if period is None:
+            raise PeriodError("Aucune période clôturée.")
+        period.delete()
+    return period
+
+
+def period_report(tenant_id, start, end, by=None):
+    """
+    Chiffre d'affaires, coût des ventes et achats de [start, end], créances,
+    dettes et stock à la date end, en totaux et, si by est donné, par
+    produit, client ou fournisseur.
+    """
+    rows = _rows()
+    periods = list(AccountingPeriod.all_tenants.filter(tenant_id=tenant_id, start__gte=start, end__lte=end)
+                   .order_by('start'))
+    if periods:
+        # Les périodes clôturées se suivent : seules les dates avant la première et après la dernière
+        # sont calculées
+        _add_snapshots(rows, periods, FLOW_FIELDS)
+        gaps = [(start - timedelta(days=1), periods[0].start - timedelta(days=1)), (periods[-1].end, end)]
+    else:
+        gaps = [(start - timedelta(days=1), end)]
+    for after, through in gaps:
+        if after < through:
+            _add_flows(rows, tenant_id, after, through)
+    snapshot = AccountingPeriod.all_tenants.filter(tenant_id=tenant_id, end__lte=end).order_by('-end').first()
+    _add_balances(rows, tenant_id, end, snapshot)
+
+    totals = {field: sum((bucket[field] for (kind, _), bucket in rows.items() if kind == source), Decimal('0'))
+              for field, source in TOTALS.items()}
+    report = {
+        'start': start,
+        'end': end,
+        'closed_periods': [str(period) for period in periods],
+        'totals': _clean(totals, TOTALS),
+    }
+    if by is not None:
+        names = dict(PARTIES[by].all_tenants.filter(tenant_id=tenant_id).values_list('id', 'name'))
+        report['rows'] = sorted(
+            ({'id': key, 'name': names.get(key), **_clean(bucket, FIELDS[by])}
+             for (kind, key), bucket in rows.items() if kind == by and any(_clean(bucket, FIELDS[by]).values())),
+            key=lambda row: (row['name'] or '', row['id']))
+    return report
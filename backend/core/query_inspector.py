@@ -0,0 +1,182 @@
+"""
+Détection des requêtes N+1 et journal des requêtes lentes (développement et tests).
+
+Chaque requête SQL d'une requête HTTP est réduite à son empreinte (sa forme, sans
+les valeurs). Une même empreinte répétée au moins QUERY_REPEAT_THRESHOLD fois et
+déclenchée par un accès paresseux (relation, propriété de modèle, champ de
+sérialiseur) est signalée avec le champ ou la propriété responsable. En mode
+strict (activé par core.test_runner), le signalement lève une exception pour
+que la régression fasse échouer les tests.
+
+Les requêtes plus lentes que SLOW_QUERY_MS sont journalisées avec leur plan
+d'exécution (EXPLAIN).
+"""
+import logging
+import os
+import re
+import sys
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DatabaseError, connections
+from rest_framework.fields import Field
+
+from . import models as core_models
+
+logger = logging.getLogger('core.queries')
+
+_current = ContextVar('query_inspection', default=None)
+
+MODELS_FILE = os.path.normcase(os.path.abspath(core_models.__file__))
+RELATED_DESCRIPTORS = os.path.join('django', 'db', 'models', 'fields', 'related_descriptors.py')
+DRF_DIRECTORY = os.sep + 'rest_framework' + os.sep
+
+_IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SPACES = re.compile(r'\s+')
+
+
+class RepeatedQueriesError(AssertionError):
+    """Requêtes N+1 détectées en mode strict"""
+
+
+def fingerprint(sql):
+    """Forme d'une requête : les valeurs et la longueur des listes IN sont ignorées"""
+    sql = _IN_LIST.sub('IN (...)', sql)
+    sql = _LITERALS.sub('?', sql)
+    return _SPACES.sub(' ', sql).strip()
+
+
+def _origin():
+    """
+    Remonte la pile pour trouver ce qui a déclenché la requête : le champ de
+    sérialiseur en cours, la propriété ou méthode de modèle, l'accès à une relation.
+    """
+    field = member = None
+    lazy = False
+    frame = sys._getframe(3)
+    while frame is not None:
+        code = frame.f_code
+        filename = code.co_filename
+        if filename.endswith(RELATED_DESCRIPTORS):
+            lazy = True
+        elif member is None and os.path.normcase(filename) == MODELS_FILE:
+            owner = frame.f_locals.get('self')
+            if owner is not None:
+                member = f"{type(owner).__name__}.{code.co_name} (core/models.py:{frame.f_lineno})"
+        elif field is None and DRF_DIRECTORY in filename and code.co_name in ('get_attribute', 'to_representation'):
+            owner = frame.f_locals.get('self')
+            if isinstance(owner, Field) and owner.parent is not None and owner.field_name:
+                field = f"{type(owner.parent).__name__}.{owner.field_name}"
+        frame = frame.f_back
+    if not (lazy or member or field):
+        return None
+    return ' -> '.join(part for part in (field, member) if part) or "accès à une relation"
+
+
+class QueryInspection:
+    """Requêtes observées pendant une requête HTTP (ou un bloc de code)"""
+
+    def __init__(self, label):
+        self.label = label
+        self.counts = Counter()
+        self.origins = {}
+        self.explaining = False
+
+    def __call__(self, execute, sql, params, many, context):
+        if self.explaining:
+            return execute(sql, params, many, context)
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = (time.perf_counter() - started) * 1000
+            if not many and sql.lstrip()[:6].upper() == 'SELECT':
+                shape = fingerprint(sql)
+                self.counts[shape] += 1
+                origin = _origin()
+                if origin:
+                    self.origins.setdefault(shape, Counter())[origin] += 1
+            if duration >= settings.SLOW_QUERY_MS:
+                self._log_slow(context['connection'], sql, params, duration)
+
+    def _log_slow(self, connection, sql, params, duration):
+        plan = ''
+        if sql.lstrip()[:6].upper() == 'SELECT':
+            self.explaining = True
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute(f"{connection.ops.explain_query_prefix()} {sql}", params)
+                    plan = '\n'.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
+            except DatabaseError as error:
+                plan = f"(EXPLAIN impossible : {error})"
+            finally:
+                self.explaining = False
+        logger.warning("Requête lente (%.1f ms) sur %s :\n%s\n%s", duration, self.label, sql, plan)
+
+    def repeated(self):
+        """Empreintes répétées dues à des accès paresseux, avec leurs responsables"""
+        threshold = settings.QUERY_REPEAT_THRESHOLD
+        return [
+            (shape, count, self.origins[shape])
+            for shape, count in self.counts.most_common()
+            if count >= threshold and shape in self.origins
+        ]
+
+    def report(self, strict):
+        problems = self.repeated()
+        if not problems:
+            return
+        lines = [f"Requêtes N+1 sur {self.label} :"]
+        for shape, count, origins in problems:
+            culprits = ', '.join(f"{origin} ({hits}x)" for origin, hits in origins.most_common(3))
+            lines.append(f"  {count}x {shape}\n    déclenchées par : {culprits}")
+        message = '\n'.join(lines)
+        if strict:
+            raise RepeatedQueriesError(message)
+        logger.warning(message)
+
+
+@contextmanager
+def inspect_queries(label='bloc', strict=None):
+    """Inspecte les requêtes d'un bloc de code, hors requête HTTP"""
+    inspection = QueryInspection(label)
+    token = _current.set(inspection)
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(inspection))
+            yield inspection
+    finally:
+        _current.reset(token)
+    inspection.report(settings.QUERY_INSPECTOR_STRICT if strict is None else strict)
+
+
+@contextmanager
+def allow_repeated_queries():
+    """Suspend la détection pour un bloc où la répétition est voulue"""
+    inspection = _current.get()
+    saved = inspection.counts.copy() if inspection is not None else None
+    try:
+        yield
+    finally:
+        if inspection is not None:
+            inspection.counts = saved
+
+
+class QueryInspectorMiddleware:
+    """Inspecte les requêtes SQL de chaque requête HTTP"""
+
+    def __init__(self, get_response):
+        if not settings.QUERY_INSPECTOR_ENABLED:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with inspect_queries(f"{request.method} {request.path}"):
+            return self.get_response(request)
+
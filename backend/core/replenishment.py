@@ -0,0 +1,221 @@
+"""
+Prévision de la demande et suggestions de réapprovisionnement.
+
+La demande de tout le catalogue est lue en quelques requêtes agrégées par la
+base (ventes par produit et par mois sur un peu plus d'un an, ventes récentes par
+produit, quantités en commande, délais fournisseurs) : le coût ne dépend pas du
+nombre de lignes de vente renvoyées, seulement du nombre de produits.
+
+Pour chaque produit :
+- vitesse : ventes quotidiennes moyennes sur REPLENISHMENT_VELOCITY_DAYS jours ;
+- saisonnalité : rapport, l'an dernier, entre les ventes du mois en cours et
+  celles des mois de la fenêtre de vitesse (borné, neutre sans un an
+  d'historique) ;
+- délai : délai moyen (positif) constaté chez le fournisseur pour ce produit,
+  sinon pour l'ensemble de ses livraisons, sinon REPLENISHMENT_DEFAULT_LEAD_TIME ;
+- point de commande : demande prévue pendant le délai plus un stock de sécurité
+  (REPLENISHMENT_SERVICE_LEVEL_Z écarts-types de la demande sur le délai) ;
+- quantité à commander : de quoi remonter au point de commande plus
+  REPLENISHMENT_REVIEW_DAYS jours de ventes, déduction faite du stock et des
+  quantités déjà en commande.
+"""
+import math
+import statistics
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Max, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .audit import record
+from .currency import refresh_base_totals
+from .models import (
+    Product, ProductForecast, Purchase, PurchaseItem, SaleItem, SupplierProductScore, SupplierScore
+)
+
+SEASONALITY_BOUNDS = (Decimal('0.5'), Decimal('2.0'))
+DAYS_PER_MONTH = 30.4
+OPEN_PURCHASE_STATUSES = ('pending', 'ordered')
+BATCH_SIZE = 2000
+INCREMENTAL_LIMIT = 5000
+
+
+def _add_months(day, months):
+    month = day.year * 12 + day.month - 1 + months
+    return day.replace(year=month // 12, month=month % 12 + 1, day=1)
+
+
+def _seasonality(history, this_month, reference_months):
+    """
+    Coefficient saisonnier : ventes du mois en cours l'an dernier rapportées aux ventes
+    moyennes des mois de la fenêtre de vitesse, l'an dernier également.
+    """
+    if not history or min(history) > reference_months[0]:
+        # Moins d'un an d'historique : pas de saisonnalité mesurable
+        return Decimal('1')
+    reference = sum(history.get(month, 0) for month in reference_months) / len(reference_months)
+    if not reference:
+        return Decimal('1')
+    factor = Decimal(history.get(_add_months(this_month, -12), 0) / reference).quantize(Decimal('0.01'))
+    return min(max(factor, SEASONALITY_BOUNDS[0]), SEASONALITY_BOUNDS[1])
+
+
+def _monthly_deviation(history, this_month):
+    """Écart-type des ventes mensuelles depuis le premier mois de vente (mois en cours exclu)"""
+    if not history:
+        return 0.0
+    month, months = max(min(history), _add_months(this_month, -12)), []
+    while month < this_month:
+        months.append(history.get(month, 0))
+        month = _add_months(month, 1)
+    return statistics.pstdev(months) if len(months) > 1 else 0.0
+
+
+def compute_forecasts(product_ids=None):
+    """Recalcule les prévisions des produits donnés (tout le catalogue si None) ; renvoie le nombre traité"""
+    today = timezone.now().date()
+    this_month = today.replace(day=1)
+    scope = {} if product_ids is None else {'product_id__in': list(product_ids)}
+    products = Product.objects.all() if product_ids is None else Product.objects.filter(id__in=scope['product_id__in'])
+    catalog = list(products.values_list('id', 'tenant_id', 'supplier_id', 'stock_quantity'))
+
+    velocity_days = settings.REPLENISHMENT_VELOCITY_DAYS
+    velocity_start = today - timedelta(days=velocity_days)
+    # Mois de la fenêtre de vitesse, un an plus tôt : base du coefficient saisonnier
+    reference_months = []
+    month = velocity_start.replace(day=1)
+    while month <= this_month:
+        reference_months.append(_add_months(month, -12))
+        month = _add_months(month, 1)
+
+    sold = SaleItem.objects.filter(sale__sale_date__gte=reference_months[0], **scope)\
+        .exclude(sale__status='cancelled')
+    history = defaultdict(dict)
+    for product_id, month, quantity in sold.annotate(month=TruncMonth('sale__sale_date'))\
+            .values('product_id', 'month').annotate(total=Sum('quantity')).values_list('product_id', 'month', 'total'):
+        history[product_id][month] = quantity
+    recent_sales = dict(sold.filter(sale__sale_date__gt=velocity_start).values('product_id')
+                        .annotate(total=Sum('quantity')).values_list('product_id', 'total'))
+
+    on_order = dict(
+        PurchaseItem.objects.filter(purchase__status__in=OPEN_PURCHASE_STATUSES, **scope).values('product_id')
+        .annotate(total=Sum(F('quantity') - F('received_quantity'))).values_list('product_id', 'total')
+    )
+    # Un délai nul ou négatif (livraisons datées avant la commande) n'est pas un délai : niveau suivant
+    product_lead_times = {
+        (supplier_id, product_id): lead_time
+        for supplier_id, product_id, lead_time in SupplierProductScore.objects.filter(
+            lead_time_avg__gt=0, **scope).values_list('supplier_id', 'product_id', 'lead_time_avg')
+    }
+    supplier_lead_times = dict(SupplierScore.objects.filter(lead_time_avg__gt=0)
+                               .values_list('supplier_id', 'lead_time_avg'))
+
+    z = settings.REPLENISHMENT_SERVICE_LEVEL_Z
+    review_days = settings.REPLENISHMENT_REVIEW_DAYS
+    default_lead_time = Decimal(settings.REPLENISHMENT_DEFAULT_LEAD_TIME)
+    now = timezone.now()
+    forecasts = []
+    for product_id, tenant_id, supplier_id, stock in catalog:
+        product_history = history.get(product_id, {})
+        velocity = Decimal(recent_sales.get(product_id, 0) / velocity_days)
+        seasonality = _seasonality(product_history, this_month, reference_months)
+        daily = velocity * seasonality
+        lead_time = product_lead_times.get((supplier_id, product_id)) or supplier_lead_times.get(supplier_id) \
+            or default_lead_time
+        daily_deviation = _monthly_deviation(product_history, this_month) / math.sqrt(DAYS_PER_MONTH)
+        safety_stock = math.ceil(z * daily_deviation * math.sqrt(lead_time))
+        reorder_point = math.ceil(daily * lead_time) + safety_stock
+        pending = max(on_order.get(product_id) or 0, 0)
+        quantity = 0
+        if stock + pending <= reorder_point and daily > 0:
+            quantity = max(math.ceil(reorder_point + daily * review_days - stock - pending), 0)
+        forecasts.append(ProductForecast(
+            tenant_id=tenant_id,
+            product_id=product_id,
+            daily_velocity=velocity.quantize(Decimal('0.001')),
+            seasonality=seasonality,
+            daily_forecast=daily.quantize(Decimal('0.001')),
+            lead_time_days=Decimal(lead_time).quantize(Decimal('0.1')),
+            safety_stock=safety_stock,
+            reorder_point=reorder_point,
+            on_order=pending,
+            reorder_quantity=quantity,
+            refreshed_at=now,
+        ))
+
+    with transaction.atomic():
+        existing = ProductForecast.objects.all()
+        if product_ids is not None:
+            existing = existing.filter(product_id__in=scope['product_id__in'])
+        existing.delete()
+        ProductForecast.objects.bulk_create(forecasts, batch_size=BATCH_SIZE)
+    return len(forecasts)
+
+
+def changed_products(since):
+    """Produits dont les ventes ou les commandes fournisseurs ont changé depuis la date donnée"""
+    sold = SaleItem.objects.filter(sale__updated_at__gte=since).values_list('product_id', flat=True)
+    ordered = PurchaseItem.objects.filter(purchase__updated_at__gte=since).values_list('product_id', flat=True)
+    return set(sold.distinct()) | set(ordered.distinct())
+
+
+def refresh_forecasts():
+    """Mise à jour incrémentale : seuls les produits touchés depuis le dernier calcul"""
+    last_refresh = ProductForecast.objects.aggregate(last=Max('refreshed_at'))['last']
+    if last_refresh is None:
+        return compute_forecasts()
+    products = changed_products(last_refresh)
+    if len(products) > INCREMENTAL_LIMIT:
+        # Au-delà, un recalcul complet coûte moins que de longues listes IN
+        return compute_forecasts()
+    return compute_forecasts(products) if products else 0
+
+
+def generate_draft_purchases(supplier_ids=None):
+    """
+    Crée une commande en attente par fournisseur pour les produits à recommander.
+
+    Renvoie les achats créés. Les quantités commandées passent « en commande » :
+    un nouvel appel ne les recommande pas.
+    """
+    suggestions = ProductForecast.objects.filter(reorder_quantity__gt=0, product__supplier__isnull=False)\
+        .select_related('product')
+    if supplier_ids:
+        suggestions = suggestions.filter(product__supplier_id__in=supplier_ids)
+    by_supplier = defaultdict(list)
+    for forecast in suggestions.order_by('product__supplier_id', 'product_id'):
+        by_supplier[forecast.product.supplier_id].append(forecast)
+    if not by_supplier:
+        return []
+
+    today = timezone.now().date()
+    with transaction.atomic():
+        purchases = Purchase.objects.bulk_create([
+            Purchase(
+                tenant_id=forecasts[0].tenant_id,
+                supplier_id=supplier_id,
+                reference=f"AUTO-{today:%Y%m%d}-{supplier_id}",
+                order_date=today,
+                expected_delivery_date=today + timedelta(days=math.ceil(max(f.lead_time_days for f in forecasts))),
+                status='pending',
+                notes="Commande générée automatiquement à partir des prévisions de ventes.",
+            )
+            for supplier_id, forecasts in by_supplier.items()
+        ])
+        PurchaseItem.objects.bulk_create([
+            PurchaseItem(tenant_id=purchase.tenant_id, purchase=purchase, product_id=forecast.product_id,
+                         quantity=forecast.reorder_quantity, unit_price=forecast.product.buying_price)
+            for purchase in purchases for forecast in by_supplier[purchase.supplier_id]
+        ], batch_size=BATCH_SIZE)
+        refresh_base_totals(Purchase, [purchase.pk for purchase in purchases])
+        ProductForecast.objects.filter(pk__in=[f.pk for forecasts in by_supplier.values() for f in forecasts])\
+            .update(on_order=F('on_order') + F('reorder_quantity'), reorder_quantity=0)
+        for purchase in purchases:
+            # bulk_create n'appelle pas les signaux : création journalisée explicitement
+            record('purchase', purchase.pk, 'c', {'supplier_id': purchase.supplier_id, 'status': purchase.status,
+                                                  'reference': purchase.reference}, tenant_id=purchase.tenant_id)
+    return purchases
@@ -0,0 +1,156 @@
+"""
+Réservations de stock des ventes en attente.
+
+Une vente créée en attente réserve, pour STOCK_RESERVATION_MINUTES minutes,
+la quantité de chacun de ses produits, tout ou rien : les lignes produits
+sont verrouillées (SELECT ... FOR UPDATE, par identifiant croissant pour
+éviter les interblocages) le temps de vérifier le stock disponible et
+d'écrire la réservation. Deux commandes simultanées ne peuvent donc pas
+réserver les mêmes dernières unités : la seconde attend la première et voit
+sa réservation.
+
+Le stock disponible d'un produit est son stock physique moins ses
+réservations en cours. Une réservation expirée ne compte plus ; la tâche
+reservations.release supprime ces lignes par lots. Confirmer (ou expédier,
+livrer) une vente en attente consomme ses réservations : le stock physique
+de ses lignes diminue, après une nouvelle vérification du stock disponible
+si la réservation a expiré entre-temps. L'annuler les libère.
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.db.models.signals import pre_save
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.views import set_rollback
+
+from .models import Product, Sale, SaleItem, StockReservation
+from .periods import exception_handler as periods_exception_handler
+
+BATCH_SIZE = 1000
+
+
+class StockUnavailable(Exception):
+    """Stock disponible insuffisant pour un ou plusieurs produits"""
+
+    def __init__(self, shortages):
+        # Quantité encore disponible, par nom de produit
+        self.shortages = shortages
+        details = ', '.join(f"{name} : {available}" for name, available in shortages.items())
+        super().__init__(f"Stock disponible insuffisant ({details}).")
+
+
+def active_reservations():
+    """Réservations non expirées, toutes boutiques confondues"""
+    return StockReservation.all_tenants.filter(expires_at__gt=timezone.now())
+
+
+def with_reserved(queryset):
+    """Ajoute aux produits leur quantité réservée (reserved_total, voir Product.reserved_quantity)"""
+    reserved = active_reservations().filter(product=OuterRef('pk')).order_by().values('product')\
+        .annotate(total=Sum('quantity')).values('total')
+    return queryset.annotate(reserved_total=Coalesce(Subquery(reserved, output_field=IntegerField()), Value(0)))
+
+
+def _quantities(sale):
+    """Quantité commandée de chaque produit de la vente"""
+    quantities = Counter()
+    for product_id, quantity in SaleItem.all_tenants.filter(sale=sale).values_list('product_id', 'quantity'):
+        quantities[product_id] += quantity
+    return quantities
+
+
+def _lock_available(quantities, sale):
+    """
+    Verrouille les produits, puis vérifie que leur stock disponible hors
+    réservations de la vente couvre les quantités ; lève StockUnavailable.
+    """
+    products = list(Product.all_tenants.select_for_update().filter(pk__in=quantities).order_by('pk'))
+    reserved = dict(active_reservations().filter(product__in=quantities).exclude(sale=sale).order_by()
+                    .values('product').annotate(total=Sum('quantity')).values_list('product', 'total'))
+    available = {product: product.stock_quantity - reserved.get(product.pk, 0) for product in products}
+    shortages = {product.name: max(count, 0) for product, count in available.items()
+                 if count < quantities[product.pk]}
+    if shortages:
+        raise StockUnavailable(shortages)
+
+
+def reserve_sale(sale):
+    """
+    Réserve, ou prolonge, les quantités d'une vente en attente, tout ou
+    rien ; renvoie la date d'expiration. Lève StockUnavailable.
+    """
+    quantities = _quantities(sale)
+    expires_at = timezone.now() + timedelta(minutes=settings.STOCK_RESERVATION_MINUTES)
+    with transaction.atomic():
+        _lock_available(quantities, sale)
+        StockReservation.all_tenants.filter(sale=sale).delete()
+        StockReservation.all_tenants.bulk_create([
+            StockReservation(tenant_id=sale.tenant_id, sale=sale, product_id=product_id, quantity=quantity,
+                             expires_at=expires_at)
+            for product_id, quantity in quantities.items() if quantity > 0
+        ])
+    return expires_at
+
+
+def consume_sale(sale):
+    """Retire du stock physique les lignes d'une vente confirmée et supprime ses réservations"""
+    quantities = _quantities(sale)
+    with transaction.atomic():
+        _lock_available(quantities, sale)
+        now = timezone.now()
+        for product_id, quantity in quantities.items():
+            Product.all_tenants.filter(pk=product_id).update(stock_quantity=F('stock_quantity') - quantity,
+                                                             updated_at=now)
+        StockReservation.all_tenants.filter(sale=sale).delete()
+
+
+def release_sale(sale):
+    """Libère les réservations d'une vente ; renvoie leur nombre"""
+    released, _ = StockReservation.all_tenants.filter(sale=sale).delete()
+    return released
+
+
+def release_expired(batch_size=None):
+    """Supprime par lots les réservations expirées, toutes boutiques confondues ; renvoie leur nombre"""
+    batch_size = batch_size or BATCH_SIZE
+    released = 0
+    while True:
+        with transaction.atomic():
+            # Une réservation en cours de consommation ou de prolongation est laissée au passage suivant
+            ids = list(StockReservation.all_tenants.filter(expires_at__lte=timezone.now()).order_by('pk')
+                       .select_for_update(skip_locked=connection.features.has_select_for_update_skip_locked)
+                       .values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                return released
+            released += StockReservation.all_tenants.filter(pk__in=ids).delete()[0]
+
+
+def _status_changed(sender, instance, raw=False, **kwargs):
+    if raw or instance._state.adding:
+        return
+    previous = Sale.all_tenants.filter(pk=instance.pk).values_list('status', flat=True).first()
+    if previous is None or previous == instance.status:
+        return
+    # Une vente qui passe à un statut vendu consomme ses réservations
+    if instance.status in Sale.SOLD_STATUSES and previous not in Sale.SOLD_STATUSES:
+        consume_sale(instance)
+    elif instance.status == 'cancelled':
+        release_sale(instance)
+
+
+def exception_handler(exc, context):
+    """Gestionnaire d'erreurs de l'API : une vente sans stock disponible suffisant est refusée (400)"""
+    if isinstance(exc, StockUnavailable):
+        set_rollback()
+        return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+    return periods_exception_handler(exc, context)
+
+
+def connect_signals():
+    pre_save.connect(_status_changed, sender=Sale, dispatch_uid='reservations_sale_status')
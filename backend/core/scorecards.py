@@ -0,0 +1,152 @@
+"""
+Indicateurs de performance des fournisseurs : délais, ponctualité, taux de service, prix.
+
+Les indicateurs sont pré-calculés dans SupplierScore (par fournisseur) et
+SupplierProductScore (par fournisseur et produit) à partir des achats reçus sur
+les SUPPLIER_SCORE_DAYS derniers jours. Une réception ne recalcule que son
+fournisseur ; la tâche périodique suppliers.scores et la commande
+refresh_supplier_scores reconstruisent l'ensemble.
+"""
+import math
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Avg, Count, DurationField, F, Q, Sum, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import Purchase, PurchaseItem, Supplier, SupplierProductScore, SupplierScore
+
+TENTH = Decimal('0.1')
+CENT = Decimal('0.01')
+CHUNK_SIZE = 500
+
+
+def percentile(sorted_values, percent):
+    """Centile par la méthode du rang le plus proche"""
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, math.ceil(percent / 100 * len(sorted_values)) - 1)]
+
+
+def _rate(part, total):
+    if not total:
+        return None
+    return (Decimal(part) * 100 / Decimal(total)).quantize(TENTH)
+
+
+def _days(duration):
+    if duration is None:
+        return None
+    return Decimal(duration.total_seconds() / 86400).quantize(TENTH)
+
+
+def _price(value):
+    if value is None:
+        return None
+    return Decimal(str(value)).quantize(CENT)
+
+
+def refresh_supplier_scores(supplier_ids=None):
+    """Recalcule les indicateurs des fournisseurs donnés (tous si None) ; renvoie le nombre traité"""
+    if supplier_ids is None:
+        supplier_ids = list(Supplier.objects.order_by('id').values_list('id', flat=True))
+    supplier_ids = list(supplier_ids)
+    for start in range(0, len(supplier_ids), CHUNK_SIZE):
+        _refresh(supplier_ids[start:start + CHUNK_SIZE])
+    return len(supplier_ids)
+
+
+def _refresh(supplier_ids):
+    today = timezone.now().date()
+    # Les indicateurs sont rangés dans la boutique de leur fournisseur
+    tenants = dict(Supplier.all_tenants.filter(id__in=supplier_ids).values_list('id', 'tenant_id'))
+    received = Purchase.objects.filter(
+        supplier_id__in=supplier_ids, status='received', actual_delivery_date__isnull=False,
+        actual_delivery_date__gte=today - timedelta(days=settings.SUPPLIER_SCORE_DAYS),
+    )
+
+    # Délais et ponctualité : une ligne par achat, les centiles demandent toutes les valeurs
+    lead_times = defaultdict(list)
+    deliveries_on_time = defaultdict(int)
+    deliveries_expected = defaultdict(int)
+    last_receipt = {}
+    for supplier_id, ordered, expected, delivered in received.values_list(
+            'supplier_id', 'order_date', 'expected_delivery_date', 'actual_delivery_date'):
+        lead_times[supplier_id].append(max(0, (delivered - ordered).days))
+        if expected is not None:
+            deliveries_expected[supplier_id] += 1
+            deliveries_on_time[supplier_id] += delivered <= expected
+        last_receipt[supplier_id] = max(delivered, last_receipt.get(supplier_id, delivered))
+
+    # Quantités, délais et prix par produit : agrégés par la base, prix convertis en devise de base
+    recent = today - timedelta(days=settings.SUPPLIER_PRICE_TREND_DAYS)
+    previous = recent - timedelta(days=settings.SUPPLIER_PRICE_TREND_DAYS)
+    base_price = F('unit_price') * F('purchase__exchange_rate')
+    rows = PurchaseItem.objects.filter(purchase__in=received).values('purchase__supplier_id', 'product_id').annotate(
+        purchases=Count('purchase_id', distinct=True),
+        ordered=Sum('quantity'),
+        received_total=Sum('received_quantity'),
+        # Livraison datée avant la commande : délai nul, comme pour les délais par fournisseur
+        lead_time=Avg(Greatest(F('purchase__actual_delivery_date') - F('purchase__order_date'),
+                               Value(timedelta(0), output_field=DurationField()))),
+        average_price=Avg(base_price),
+        recent_price=Avg(base_price, filter=Q(purchase__order_date__gte=recent)),
+        previous_price=Avg(base_price, filter=Q(purchase__order_date__gte=previous,
+                                                purchase__order_date__lt=recent)),
+    ).order_by()
+
+    product_scores = []
+    quantities = defaultdict(lambda: [0, 0])
+    for row in rows:
+        supplier_id = row['purchase__supplier_id']
+        recent_price, previous_price = _price(row['recent_price']), _price(row['previous_price'])
+        trend = None
+        if recent_price is not None and previous_price:
+            trend = ((recent_price - previous_price) * 100 / previous_price).quantize(TENTH)
+        quantities[supplier_id][0] += row['ordered'] or 0
+        quantities[supplier_id][1] += row['received_total'] or 0
+        product_scores.append(SupplierProductScore(
+            tenant_id=tenants[supplier_id],
+            supplier_id=supplier_id,
+            product_id=row['product_id'],
+            received_purchases=row['purchases'],
+            lead_time_avg=_days(row['lead_time']),
+            fill_rate=_rate(row['received_total'] or 0, row['ordered']),
+            ordered_quantity=row['ordered'] or 0,
+            received_quantity=row['received_total'] or 0,
+            average_unit_price=_price(row['average_price']),
+            recent_unit_price=recent_price,
+            price_trend=trend,
+        ))
+
+    now = timezone.now()
+    scores = []
+    for supplier_id in supplier_ids:
+        if supplier_id not in tenants:
+            continue
+        days = sorted(lead_times.get(supplier_id, []))
+        ordered, received_quantity = quantities.get(supplier_id, (0, 0))
+        scores.append(SupplierScore(
+            tenant_id=tenants[supplier_id],
+            supplier_id=supplier_id,
+            received_purchases=len(days),
+            lead_time_avg=(Decimal(sum(days)) / len(days)).quantize(TENTH) if days else None,
+            lead_time_p50=percentile(days, 50),
+            lead_time_p90=percentile(days, 90),
+            on_time_rate=_rate(deliveries_on_time[supplier_id], deliveries_expected[supplier_id]),
+            fill_rate=_rate(received_quantity, ordered),
+            ordered_quantity=ordered,
+            received_quantity=received_quantity,
+            last_receipt_date=last_receipt.get(supplier_id),
+            refreshed_at=now,
+        ))
+
+    with transaction.atomic():
+        SupplierProductScore.objects.filter(supplier_id__in=supplier_ids).delete()
+        SupplierScore.objects.filter(supplier_id__in=supplier_ids).delete()
+        SupplierScore.objects.bulk_create(scores, batch_size=1000)
+        SupplierProductScore.objects.bulk_create(product_scores, batch_size=1000)
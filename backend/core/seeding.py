@@ -0,0 +1,547 @@
+"""
+Génération de données synthétiques réalistes pour reproduire la volumétrie de production.
+
+Les documents (achats, ventes) sont produits par blocs. Chaque bloc a son propre
+générateur aléatoire, dérivé de la graine et de son numéro : le résultat ne dépend
+donc ni du nombre de processus ni de l'ordre d'exécution. Les blocs peuvent être
+calculés dans des processus séparés ; l'insertion se fait toujours dans le
+processus principal, dans l'ordre des blocs.
+
+Les lignes sont écrites par lots, déjà converties en valeurs SQL natives
+(executemany sur SQLite, execute_values sur PostgreSQL) : la préparation champ
+par champ de bulk_create plafonne autour de 20 000 lignes/s sur SQLite. Sur un
+seul cœur et SQLite, la génération complète atteint environ 50 000 lignes/s :
+l'insertion, bornée par la mise à jour des index, en prend les deux tiers et
+n'est pas plus rapide en sqlite3 direct. Les processus de génération
+(workers) ne font gagner du temps que sur une machine multicœur.
+
+Toutes les lignes vont dans une seule boutique, écrite comme une constante de
+la requête d'insertion ; les identifiants étant fixés explicitement, le jeu de
+données est prévu pour une base vide.
+"""
+import bisect
+import random
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.management.color import no_style
+from django.db import connection, connections, transaction
+
+from .archive import ARCHIVES
+from .models import (
+    Supplier, ProductCategory, Product,
+    Purchase, PurchaseItem, PurchasePayment,
+    Customer, Sale, SaleItem, SalePayment,
+    StockMovement, Invoice, AccountingPeriod, PeriodBalance, Tombstone
+)
+from .tenancy import active_tenant_id
+
+# Volumes pour une échelle de 1 (environ 27 000 lignes au total)
+BASE_COUNTS = {
+    'suppliers': 20,
+    'categories': 12,
+    'products': 400,
+    'customers': 800,
+    'purchases': 300,
+    'sales': 4000,
+}
+
+# Saisonnalité des ventes, de janvier à décembre puis du lundi au dimanche
+MONTH_WEIGHTS = (0.8, 0.7, 0.9, 0.95, 1.0, 1.0, 1.1, 0.9, 1.25, 1.0, 1.3, 1.8)
+WEEKDAY_WEIGHTS = (0.9, 0.9, 1.0, 1.0, 1.2, 1.5, 0.6)
+# Croissance de l'activité sur la période simulée
+YEARLY_GROWTH = 0.15
+# Hausse annuelle des prix fournisseurs
+YEARLY_INFLATION = 0.04
+
+SALE_CHUNK = 2000
+PURCHASE_CHUNK = 500
+
+CATEGORY_NAMES = [
+    'Sacs à main', 'Sacs à dos', 'Chaussures femme', 'Chaussures homme', 'Sandales',
+    'Portefeuilles', 'Ceintures', 'Bijoux', 'Foulards', 'Lunettes', 'Montres', 'Valises',
+]
+PRODUCT_WORDS = ['Classique', 'Élégance', 'Urbain', 'Soirée', 'Voyage', 'Cuir', 'Tressé', 'Sport', 'Mini', 'Maxi']
+COLORS = ['noir', 'camel', 'rouge', 'blanc', 'beige', 'bleu', 'vert', 'doré']
+COUNTRIES = ['Chine', 'Turquie', 'Italie', 'Nigeria', 'Sénégal', 'France', 'Maroc', 'Inde']
+FIRST_NAMES = ['Awa', 'Fatou', 'Aminata', 'Marie', 'Sophie', 'Kadi', 'Nadia', 'Julie', 'Moussa', 'Ibrahima', 'Paul', 'Léa']
+LAST_NAMES = ['Diop', 'Ndiaye', 'Sow', 'Fall', 'Martin', 'Bernard', 'Traoré', 'Koné', 'Diallo', 'Mensah', 'Dubois', 'Ba']
+PAYMENT_METHODS = ['cash', 'cash', 'mobile_money', 'mobile_money', 'bank_transfer', 'check']
+
+# Contexte partagé par les générateurs de blocs (initialisé dans chaque processus)
+_context = None
+
+
+class SeedContext:
+    """Données de référence nécessaires pour générer les documents"""
+
+    def __init__(self, seed, start, end, day_weights, products, product_weights,
+                 supplier_products, customer_weights, supplier_weights, total_sales, total_purchases,
+                 tz_suffix, currency):
+        self.seed = seed
+        self.start = start
+        self.end = end
+        self.day_weights = day_weights
+        self.products = products
+        self.product_ids = list(products)
+        self.product_weights = product_weights
+        self.supplier_products = supplier_products
+        self.customer_weights = customer_weights
+        self.supplier_weights = supplier_weights
+        self.total_sales = total_sales
+        self.total_purchases = total_purchases
+        # SQLite stocke les horodatages en UTC naïf, PostgreSQL attend un décalage explicite
+        self.tz_suffix = tz_suffix
+        # Documents générés en devise de base (taux 1)
+        self.currency = currency
+
+    def day(self, rng, low, high):
+        """Tire une date selon la saisonnalité, dans le quantile [low, high) de l'activité"""
+        index = bisect.bisect_left(self.day_weights, rng.uniform(low, high) * self.day_weights[-1])
+        return self.start + timedelta(days=min(index, len(self.day_weights) - 1))
+
+
+def _init_worker(context):
+    global _context
+    _context = context
+
+
+def _cumulative(weights):
+    total = 0
+    cumulative = []
+    for weight in weights:
+        total += weight
+        cumulative.append(total)
+    return cumulative
+
+
+def _timestamp(moment, suffix):
+    return moment.strftime('%Y-%m-%d %H:%M:%S') + suffix
+
+
+def _moment(rng, day, suffix):
+    """Horodatage aléatoire pendant les heures d'ouverture"""
+    minutes = rng.randint(0, 600)
+    return _timestamp(datetime(day.year, day.month, day.day, 9 + minutes // 60, minutes % 60), suffix)
+
+
+def _iso(day):
+    return day.isoformat() if day else None
+
+
+def _money(cents):
+    """Montant en centimes vers sa représentation décimale SQL"""
+    return f"{cents // 100}.{cents % 100:02d}"
+
+
+def _chunks(total, size):
+    return [(index, index * size + 1, min(size, total - index * size)) for index in range((total + size - 1) // size)]
+
+
+def _payment_delay(rng):
+    """Délai de paiement en jours après livraison (None : jamais payé intégralement)"""
+    draw = rng.random()
+    if draw < 0.45:
+        return 0
+    if draw < 0.75:
+        return rng.randint(1, 30)
+    if draw < 0.90:
+        return rng.randint(31, 90)
+    return None
+
+
+def _sale_status(rng, age):
+    if rng.random() < 0.03:
+        return 'cancelled'
+    if age > 14:
+        return 'delivered'
+    if age > 7:
+        return rng.choice(('shipped', 'delivered', 'delivered'))
+    if age > 2:
+        return rng.choice(('confirmed', 'shipped'))
+    return rng.choice(('pending', 'confirmed'))
+
+
+# Colonnes écrites pour chaque table, dans l'ordre des tuples générés
+SUPPLIER_COLUMNS = ('id', 'name', 'country', 'contact_name', 'contact_phone', 'payment_terms',
+                    'created_at', 'updated_at')
+CATEGORY_COLUMNS = ('id', 'name')
+PRODUCT_COLUMNS = ('id', 'name', 'reference', 'category', 'supplier', 'buying_price', 'selling_price',
+                   'stock_quantity', 'min_stock_level', 'created_at', 'updated_at')
+CUSTOMER_COLUMNS = ('id', 'name', 'phone', 'email', 'created_at', 'updated_at')
+SALE_COLUMNS = ('id', 'customer', 'reference', 'sale_date', 'status', 'payment_status',
+                'expected_delivery_date', 'actual_delivery_date', 'currency', 'exchange_rate', 'total_amount_base',
+                'created_at', 'updated_at')
+SALE_ITEM_COLUMNS = ('sale', 'product', 'quantity', 'unit_price', 'discount')
+SALE_PAYMENT_COLUMNS = ('sale', 'payment_date', 'amount', 'currency', 'exchange_rate', 'amount_base',
+                        'payment_method')
+INVOICE_COLUMNS = ('id', 'sale', 'invoice_number', 'issue_date', 'due_date', 'status', 'created_at', 'updated_at')
+PURCHASE_COLUMNS = ('id', 'supplier', 'reference', 'order_date', 'expected_delivery_date', 'actual_delivery_date',
+                    'status', 'payment_status', 'payment_due_date', 'currency', 'exchange_rate', 'total_amount_base',
+                    'created_at', 'updated_at')
+PURCHASE_ITEM_COLUMNS = ('purchase', 'product', 'quantity', 'unit_price', 'received_quantity')
+PURCHASE_PAYMENT_COLUMNS = ('purchase', 'payment_date', 'amount', 'currency', 'exchange_rate', 'amount_base',
+                            'payment_method')
+STOCK_MOVEMENT_COLUMNS = ('product', 'quantity', 'movement_type', 'reference', 'date', 'notes')
+
+
+def _payment_status(paid, total):
+    if paid >= total and paid > 0:
+        return 'paid'
+    if paid > 0:
+        return 'partial'
+    return 'unpaid'
+
+
+def generate_sales(chunk):
+    """Génère un bloc de ventes avec leurs articles, paiements et factures"""
+    index, first_id, count = chunk
+    ctx = _context
+    rng = random.Random(f"{ctx.seed}:sales:{index}")
+    low, high = (first_id - 1) / ctx.total_sales, (first_id - 1 + count) / ctx.total_sales
+    dates = sorted(ctx.day(rng, low, high) for _ in range(count))
+    created = _timestamp(datetime(ctx.end.year, ctx.end.month, ctx.end.day, 20), ctx.tz_suffix)
+
+    sales, items, payments, invoices = [], [], [], []
+    stock_out = Counter()
+    for offset, sale_date in enumerate(dates):
+        sale_id = first_id + offset
+        age = (ctx.end - sale_date).days
+        status = _sale_status(rng, age)
+        expected = sale_date + timedelta(days=rng.randint(2, 10))
+        delivered = None
+        if status == 'delivered':
+            delivered = min(sale_date + timedelta(days=rng.randint(0, 10)), ctx.end)
+
+        # Les montants sont calculés en centimes entiers, bien plus rapides que Decimal
+        total = 0
+        count_items = 1 + min(int(rng.expovariate(0.6)), 7)
+        for product_id in sorted(set(rng.choices(ctx.product_ids, cum_weights=ctx.product_weights, k=count_items))):
+            quantity = 1 + int(rng.expovariate(0.8))
+            unit_price = ctx.products[product_id][1]
+            discount = 0
+            if rng.random() < 0.1:
+                discount = unit_price * quantity * rng.choice((5, 10)) // 100
+            items.append((sale_id, product_id, quantity, _money(unit_price), _money(discount)))
+            total += unit_price * quantity - discount
+            if status in Sale.SOLD_STATUSES:
+                stock_out[product_id] += quantity
+
+        paid = 0
+        if status != 'cancelled':
+            delay = _payment_delay(rng)
+            if rng.random() < 0.25:
+                # Acompte versé à la commande
+                deposit = total * rng.choice((30, 40, 50)) // 100
+                payments.append((sale_id, sale_date.isoformat(), _money(deposit), ctx.currency, '1', _money(deposit),
+                                 rng.choice(PAYMENT_METHODS)))
+                paid += deposit
+            if delay is not None and total > paid:
+                paid_on = (delivered or sale_date) + timedelta(days=delay)
+                if paid_on <= ctx.end:
+                    payments.append((sale_id, paid_on.isoformat(), _money(total - paid), ctx.currency, '1',
+                                     _money(total - paid), rng.choice(PAYMENT_METHODS)))
+                    paid = total
+
+        payment_status = _payment_status(paid, total)
+        customer_id = bisect.bisect_left(ctx.customer_weights, rng.random() * ctx.customer_weights[-1]) + 1
+        sales.append((sale_id, customer_id, f"V-{sale_id:08d}", sale_date.isoformat(), status, payment_status,
+                      expected.isoformat(), _iso(delivered), ctx.currency, '1', _money(total), created, created))
+
+        if delivered:
+            due_date = delivered + timedelta(days=30)
+            if payment_status == 'paid':
+                invoice_status = 'paid'
+            elif due_date < ctx.end:
+                invoice_status = 'overdue'
+            else:
+                invoice_status = 'sent'
+            # Même numérotation que SaleViewSet (INV-<id>), la facture reprenant l'identifiant de la vente
+            invoices.append((sale_id, sale_id, f"INV-{sale_id:05d}", delivered.isoformat(), due_date.isoformat(),
+                             invoice_status, created, created))
+
+    return {'sales': sales, 'items': items, 'payments': payments, 'invoices': invoices, 'stock_out': stock_out}
+
+
+def generate_purchases(chunk):
+    """Génère un bloc d'achats avec leurs articles, paiements et entrées en stock"""
+    index, first_id, count = chunk
+    ctx = _context
+    rng = random.Random(f"{ctx.seed}:purchases:{index}")
+    low, high = (first_id - 1) / ctx.total_purchases, (first_id - 1 + count) / ctx.total_purchases
+    dates = sorted(ctx.day(rng, low, high) for _ in range(count))
+    created = _timestamp(datetime(ctx.end.year, ctx.end.month, ctx.end.day, 20), ctx.tz_suffix)
+
+    purchases, items, payments, movements = [], [], [], []
+    stock_in = Counter()
+    for offset, order_date in enumerate(dates):
+        purchase_id = first_id + offset
+        supplier_id = bisect.bisect_left(ctx.supplier_weights, rng.random() * ctx.supplier_weights[-1]) + 1
+        catalog = ctx.supplier_products.get(supplier_id) or ctx.product_ids
+        expected = order_date + timedelta(days=rng.randint(7, 30))
+        # Retard (ou avance) de livraison, jamais avant la commande
+        actual = max(expected + timedelta(days=round(rng.gauss(2, 4))), order_date)
+        if actual <= ctx.end:
+            status = 'cancelled' if rng.random() < 0.02 else 'received'
+        elif (ctx.end - order_date).days > 2:
+            status = 'ordered'
+        else:
+            status = 'pending'
+        if status != 'received':
+            actual = None
+
+        inflation = 1 + YEARLY_INFLATION * (order_date - ctx.start).days / 365
+        total = 0
+        for product_id in sorted(set(rng.choices(catalog, k=rng.randint(2, 8)))):
+            quantity = rng.randint(1, 10) * 10
+            unit_price = round(ctx.products[product_id][0] * inflation * rng.uniform(0.95, 1.05))
+            received = 0
+            if status == 'received':
+                received = quantity if rng.random() < 0.85 else int(quantity * rng.uniform(0.6, 0.99))
+                if received:
+                    stock_in[product_id] += received
+                    movements.append((product_id, received, 'in', f"Purchase #{purchase_id}",
+                                      _moment(rng, actual, ctx.tz_suffix), f"Réception de l'achat #{purchase_id}"))
+            items.append((purchase_id, product_id, quantity, _money(unit_price), received))
+            total += unit_price * quantity
+
+        due_date = order_date + timedelta(days=30)
+        paid = 0
+        if status != 'cancelled':
+            if rng.random() < 0.3:
+                deposit = total * 30 // 100
+                payments.append((purchase_id, order_date.isoformat(), _money(deposit), ctx.currency, '1',
+                                 _money(deposit), 'bank_transfer'))
+                paid += deposit
+            paid_on = max(due_date - timedelta(days=rng.randint(-15, 20)), order_date)
+            if paid_on <= ctx.end and rng.random() < 0.9 and total > paid:
+                payments.append((purchase_id, paid_on.isoformat(), _money(total - paid), ctx.currency, '1',
+                                 _money(total - paid), 'bank_transfer'))
+                paid = total
+
+        purchases.append((purchase_id, supplier_id, f"A-{purchase_id:07d}", order_date.isoformat(),
+                          expected.isoformat(), _iso(actual), status, _payment_status(paid, total),
+                          due_date.isoformat(), ctx.currency, '1', _money(total), created, created))
+
+    return {'purchases': purchases, 'items': items, 'payments': payments,
+            'movements': movements, 'stock_in': stock_in}
+
+
+def _run_chunks(function, chunks, context, workers):
+    """Exécute les blocs dans l'ordre, éventuellement dans un pool de processus"""
+    if workers <= 1:
+        _init_worker(context)
+        for chunk in chunks:
+            yield function(chunk)
+        return
+
+    # Les connexions ne doivent pas être partagées avec les processus enfants
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(context,)) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(function, chunk))
+            # Fenêtre bornée pour limiter la mémoire si l'insertion est plus lente que la génération
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class Seeder:
+    """Génère et insère un jeu de données complet"""
+
+    models = [
+        Supplier, ProductCategory, Product, Customer,
+        Purchase, PurchaseItem, PurchasePayment,
+        Sale, SaleItem, SalePayment, StockMovement, Invoice,
+    ]
+
+    def __init__(self, scale=1.0, seed=42, days=730, end_date=None, batch_size=2000, workers=1, log=None,
+                 tenant_id=None):
+        self.tenant_id = int(tenant_id if tenant_id is not None else active_tenant_id())
+        self.counts = {name: max(1, round(count * scale)) for name, count in BASE_COUNTS.items()}
+        self.seed = seed
+        self.end = end_date or datetime.now(dt_timezone.utc).date()
+        self.start = self.end - timedelta(days=days)
+        self.batch_size = batch_size
+        self.workers = workers
+        self.log = log or (lambda message: None)
+        self.rows = Counter()
+
+    def _write(self, model, fields, rows):
+        """Insère par lots des lignes déjà converties en valeurs SQL, sans instancier de modèles"""
+        if not rows:
+            return
+        quote = connection.ops.quote_name
+        constants = {'tenant': str(self.tenant_id)}
+        if 'updated_at' not in fields and any(field.name == 'updated_at' for field in model._meta.fields):
+            # Lignes sans date de mise à jour générée : date de l'insertion
+            constants['updated_at'] = 'CURRENT_TIMESTAMP'
+        columns = ', '.join(quote(model._meta.get_field(name).column) for name in (*fields, *constants))
+        table = quote(model._meta.db_table)
+        # La boutique est la même pour toutes les lignes : constante de la requête, les lignes restent intactes
+        placeholders = ', '.join(['%s'] * len(fields) + list(constants.values()))
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                from psycopg2.extras import execute_values
+                execute_values(cursor.cursor, f"INSERT INTO {table} ({columns}) VALUES %s", rows,
+                               template=f"({placeholders})", page_size=self.batch_size)
+            else:
+                sql = f"INSERT INTO {table} ({columns}) VALUES ({placeholders})"
+                for start in range(0, len(rows), self.batch_size):
+                    cursor.executemany(sql, rows[start:start + self.batch_size])
+        self.rows[model._meta.model_name] += len(rows)
+
+    def _calendar(self):
+        weights = []
+        period = max((self.end - self.start).days, 1)
+        for offset in range(period + 1):
+            day = self.start + timedelta(days=offset)
+            growth = 1 + YEARLY_GROWTH * offset / 365
+            weights.append(MONTH_WEIGHTS[day.month - 1] * WEEKDAY_WEIGHTS[day.weekday()] * growth)
+        return _cumulative(weights)
+
+    def _catalog(self, rng, created, tz_suffix):
+        counts = self.counts
+        suppliers = [(
+            index,
+            f"{rng.choice(LAST_NAMES)} {rng.choice(('Import', 'Trading', 'Cuirs', 'Mode', 'Export'))} {index}",
+            rng.choice(COUNTRIES),
+            f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            f"+221 77 {rng.randint(100, 999)} {rng.randint(10, 99)} {rng.randint(10, 99)}",
+            rng.choice(('30 jours', '45 jours fin de mois', 'Paiement à la commande')),
+            created, created,
+        ) for index in range(1, counts['suppliers'] + 1)]
+        categories = [(
+            index,
+            CATEGORY_NAMES[(index - 1) % len(CATEGORY_NAMES)] + (
+                f" {(index - 1) // len(CATEGORY_NAMES) + 1}" if index > len(CATEGORY_NAMES) else ''),
+        ) for index in range(1, counts['categories'] + 1)]
+
+        products = []
+        prices = {}
+        supplier_products = {}
+        for index in range(1, counts['products'] + 1):
+            buying_price = rng.randint(500, 40000)
+            selling_price = round(buying_price * rng.uniform(1.3, 2.5))
+            supplier_id = rng.randint(1, counts['suppliers'])
+            category_id = rng.randint(1, counts['categories'])
+            products.append((
+                index,
+                f"{CATEGORY_NAMES[(category_id - 1) % len(CATEGORY_NAMES)]} "
+                f"{rng.choice(PRODUCT_WORDS)} {rng.choice(COLORS)} {index}",
+                f"P-{index:06d}", category_id, supplier_id, _money(buying_price), _money(selling_price),
+                0, rng.choice((3, 5, 5, 10, 20)), created, created,
+            ))
+            prices[index] = (buying_price, selling_price)
+            supplier_products.setdefault(supplier_id, []).append(index)
+
+        customers = [(
+            index,
+            f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {index}",
+            f"+221 76 {rng.randint(100, 999)} {rng.randint(10, 99)} {rng.randint(10, 99)}",
+            f"client{index}@example.com" if rng.random() < 0.6 else None,
+            created, created,
+        ) for index in range(1, counts['customers'] + 1)]
+
+        # Quelques produits et clients concentrent l'essentiel de l'activité
+        context = SeedContext(
+            seed=self.seed, start=self.start, end=self.end,
+            day_weights=self._calendar(),
+            products=prices,
+            product_weights=_cumulative(rng.paretovariate(1.2) for _ in products),
+            supplier_products=supplier_products,
+            customer_weights=_cumulative(rng.paretovariate(1.5) for _ in customers),
+            supplier_weights=_cumulative(rng.paretovariate(1.5) for _ in suppliers),
+            total_sales=counts['sales'],
+            total_purchases=counts['purchases'],
+            tz_suffix=tz_suffix,
+            currency=settings.BASE_CURRENCY,
+        )
+        return suppliers, categories, products, customers, context
+
+    def clear(self):
+        """Vide les tables de l'application, leurs archives et les clôtures (toutes boutiques) et leurs séquences"""
+        models = [*self.models, *ARCHIVES.values(), PeriodBalance, AccountingPeriod, Tombstone]
+        tables = [model._meta.db_table for model in models]
+        sql = connection.ops.sql_flush(no_style(), tables, reset_sequences=True, allow_cascade=True)
+        connection.ops.execute_sql_flush(sql)
+
+    def _tune_connection(self):
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                # Données jetables : on privilégie la vitesse à la durabilité
+                cursor.execute('PRAGMA synchronous = OFF')
+                cursor.execute('PRAGMA journal_mode = MEMORY')
+                cursor.execute('PRAGMA cache_size = -262144')
+
+    def run(self):
+        started = time.perf_counter()
+        rng = random.Random(f"{self.seed}:catalog")
+        tz_suffix = '' if connection.vendor == 'sqlite' else '+00:00'
+        created = _timestamp(datetime(self.end.year, self.end.month, self.end.day, 20), tz_suffix)
+        suppliers, categories, products, customers, context = self._catalog(rng, created, tz_suffix)
+
+        self._tune_connection()
+        with transaction.atomic():
+            self._write(Supplier, SUPPLIER_COLUMNS, suppliers)
+            self._write(ProductCategory, CATEGORY_COLUMNS, categories)
+            self._write(Product, PRODUCT_COLUMNS, products)
+            self._write(Customer, CUSTOMER_COLUMNS, customers)
+        self.log(f"Référentiel : {sum(self.rows.values())} lignes")
+
+        stock = Counter()
+        for result in _run_chunks(generate_purchases, _chunks(self.counts['purchases'], PURCHASE_CHUNK),
+                                  context, self.workers):
+            self._tune_connection()
+            with transaction.atomic():
+                self._write(Purchase, PURCHASE_COLUMNS, result['purchases'])
+                self._write(PurchaseItem, PURCHASE_ITEM_COLUMNS, result['items'])
+                self._write(PurchasePayment, PURCHASE_PAYMENT_COLUMNS, result['payments'])
+                self._write(StockMovement, STOCK_MOVEMENT_COLUMNS, result['movements'])
+            stock.update(result['stock_in'])
+        self.log(f"Achats : {self.rows['purchase']} documents")
+
+        for result in _run_chunks(generate_sales, _chunks(self.counts['sales'], SALE_CHUNK), context, self.workers):
+            self._tune_connection()
+            with transaction.atomic():
+                self._write(Sale, SALE_COLUMNS, result['sales'])
+                self._write(SaleItem, SALE_ITEM_COLUMNS, result['items'])
+                self._write(SalePayment, SALE_PAYMENT_COLUMNS, result['payments'])
+                self._write(Invoice, INVOICE_COLUMNS, result['invoices'])
+            stock.subtract(result['stock_out'])
+        self.log(f"Ventes : {self.rows['sale']} documents")
+
+        # Stock d'ouverture suffisant pour ne jamais passer en négatif, puis quelques pertes
+        movements = []
+        period = (self.end - self.start).days
+        for product_id in context.product_ids:
+            opening = rng.randint(0, 40) + max(0, -stock[product_id])
+            movements.append((product_id, opening, 'adjustment', 'Inventaire initial',
+                              _moment(rng, self.start, context.tz_suffix), None))
+            stock[product_id] += opening
+            if rng.random() < 0.05 and stock[product_id] > 0:
+                loss = rng.randint(1, min(3, stock[product_id]))
+                movements.append((product_id, loss, 'out', 'Casse',
+                                  _moment(rng, self.start + timedelta(days=rng.randint(0, period)),
+                                          context.tz_suffix), None))
+                stock[product_id] -= loss
+
+        with transaction.atomic():
+            self._write(StockMovement, STOCK_MOVEMENT_COLUMNS, movements)
+            with connection.cursor() as cursor:
+                cursor.executemany(
+                    f"UPDATE {connection.ops.quote_name(Product._meta.db_table)} SET stock_quantity = %s WHERE id = %s",
+                    [(stock[product_id], product_id) for product_id in context.product_ids],
+                )
+            # Les identifiants ont été fixés explicitement : on recale les séquences
+            with connection.cursor() as cursor:
+                for statement in connection.ops.sequence_reset_sql(no_style(), self.models):
+                    cursor.execute(statement)
+
+        elapsed = time.perf_counter() - started
+        return self.rows, elapsed
@@ -1,69 +1,343 @@
+from django.db import transaction
+from django.utils import timezone
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.validators import UniqueValidator
+from .currency import ExchangeRateMissing, default_currency, get_rate
 from .models import (
     Supplier, ProductCategory, Product, 
     Purchase, PurchaseItem, PurchasePayment,
     Customer, Sale, SaleItem, SalePayment,
-    StockMovement, Invoice
+    StockMovement, Invoice, Job, AuditLog, SupplierScore, SupplierProductScore,
+    ProductForecast, ExchangeRate, AccountingPeriod
 )
+from .metrics import serialization_started, serialization_finished
+from .reservations import reserve_sale
+from .thumbnails import thumbnail_urls
+
+
+def unique_in_tenant(model):
+    """
+    Unicité d'un champ dans la boutique courante (contrainte (boutique, champ) en
+    base) ; le gestionnaire est évalué à chaque validation, déjà limité à la boutique.
+    """
+    return {'validators': [UniqueValidator(queryset=model.objects)]}
+
+
+def _parse_tree(value):
+    """'id,items.quantity' -> {'id': {}, 'items': {'quantity': {}}} ; None si absent"""
+    if not value:
+        return None
+    tree = {}
+    for path in value.split(','):
+        node = tree
+        for name in path.strip().split('.'):
+            if name:
+                node = node.setdefault(name, {})
+    return tree
+
+
+def parse_selection(request):
+    """Champs demandés (?fields=, lectures uniquement) et champs à déplier (?expand=)"""
+    if request is None:
+        return None, {}
+    params = getattr(request, 'query_params', request.GET)
+    fields = _parse_tree(params.get('fields')) if request.method in SAFE_METHODS else None
+    return fields, _parse_tree(params.get('expand')) or {}
+
+
+class BaseModelSerializer(serializers.ModelSerializer):
+    """
+    Base commune des sérialiseurs.
+
+    ?fields=id,reference,items.quantity ne renvoie que les champs demandés et
+    ?expand=items,payments ajoute les champs déclarés dans Meta.expandable_fields
+    (un champ dépliable cité dans ?fields= est aussi déplié). Les relations à
+    charger pour chaque champ sont déclarées dans Meta.select_related_fields et
+    Meta.prefetch_related_fields, les colonnes lues par les champs calculés dans
+    Meta.field_columns : optimize_queryset() n'en charge que ce qui sera renvoyé.
+    La sérialisation est aussi chronométrée pour l'en-tête Server-Timing. La
+    boutique des objets n'est jamais exposée : elle est celle de la requête.
+    """
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._fields_tree = fields
+        self._expand_tree = expand
+
+    def _selection(self):
+        # Seul le sérialiseur racine lit la requête ; les sérialiseurs imbriqués reçoivent leur sous-arbre
+        parent = self.parent
+        is_root = parent is None or (isinstance(parent, serializers.ListSerializer) and parent.parent is None)
+        if is_root and self._fields_tree is None and self._expand_tree is None:
+            return parse_selection(self.context.get('request'))
+        return self._fields_tree, self._expand_tree or {}
+
+    def get_fields(self):
+        fields = super().get_fields()
+        fields.pop('tenant', None)
+        requested, expand = self._selection()
+        for name, (serializer_class, options) in getattr(self.Meta, 'expandable_fields', {}).items():
+            if name in expand or (requested and name in requested):
+                fields[name] = serializer_class(fields=(requested or {}).get(name) or None,
+                                                expand=expand.get(name) or None, read_only=True, **options)
+        if requested:
+            fields = {name: field for name, field in fields.items() if name in requested}
+        return fields
+
+    def to_representation(self, instance):
+        serialization_started()
+        try:
+            return super().to_representation(instance)
+        finally:
+            serialization_finished()
+
+    @classmethod
+    def query_plan(cls, requested, expand):
+        """Relations à joindre, relations à précharger et colonnes à lire (None : toutes)"""
+        meta = cls.Meta
+        expandable = getattr(meta, 'expandable_fields', {})
+        expanded = {name for name in expandable if name in expand or (requested and name in requested)}
+
+        def wanted(name):
+            if name in expandable:
+                return name in expanded
+            return requested is None or name in requested
+
+        select, prefetch = set(), set()
+        for name, paths in getattr(meta, 'select_related_fields', {}).items():
+            if wanted(name):
+                select.update(paths)
+        for name, paths in getattr(meta, 'prefetch_related_fields', {}).items():
+            if wanted(name):
+                prefetch.update(paths)
+        for name in expanded:
+            serializer_class, options = expandable[name]
+            sub_select, sub_prefetch, _ = serializer_class.query_plan((requested or {}).get(name) or None,
+                                                                      expand.get(name) or {})
+            relation = options.get('source', name)
+            if options.get('many'):
+                prefetch.add(relation)
+                prefetch.update(f"{relation}__{path}" for path in sub_select | sub_prefetch)
+            else:
+                select.add(relation)
+                select.update(f"{relation}__{path}" for path in sub_select)
+                prefetch.update(f"{relation}__{path}" for path in sub_prefetch)
+
+        columns = None
+        if requested is not None:
+            model = meta.model
+            concrete = {field.name for field in model._meta.concrete_fields}
+            dependencies = getattr(meta, 'field_columns', {})
+            related = {*getattr(meta, 'select_related_fields', {}), *getattr(meta, 'prefetch_related_fields', {}),
+                       *expandable}
+            columns = {model._meta.pk.name}
+            for name in requested:
+                if name in concrete:
+                    columns.add(name)
+                elif name in dependencies:
+                    columns.update(dependencies[name])
+                elif name not in related:
+                    # Champ calculé dont on ignore les colonnes : on les lit toutes
+                    columns = None
+                    break
+            if columns is not None:
+                columns.update(path.split('__')[0] for path in select)
+        return select, prefetch, columns
+
+    @classmethod
+    def optimize_queryset(cls, queryset, request=None):
+        """Adapte le queryset aux champs que la requête renverra"""
+        select, prefetch, columns = cls.query_plan(*parse_selection(request))
+        if select:
+            queryset = queryset.select_related(*sorted(select))
+        if prefetch:
+            queryset = queryset.prefetch_related(*sorted(prefetch))
+        if columns is not None:
+            queryset = queryset.only(*sorted(columns))
+        return queryset
+
+
+class ThumbnailsField(serializers.ReadOnlyField):
+    """URL des miniatures de l'image du produit, par taille et par format"""
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = 'image_hash'
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        return thumbnail_urls(value, self.context.get('request'))
+
+
+class SupplierScoreSerializer(BaseModelSerializer):
+    class Meta:
+        model = SupplierScore
+        exclude = ['supplier']
+
+
+class SupplierProductScoreSerializer(BaseModelSerializer):
+    product_name = serializers.ReadOnlyField(source='product.name')
+    product_reference = serializers.ReadOnlyField(source='product.reference')
+
+    class Meta:
+        model = SupplierProductScore
+        exclude = ['supplier']
+        select_related_fields = {'product_name': ['product'], 'product_reference': ['product']}
+
+
+class SupplierSerializer(BaseModelSerializer):
+    # Indicateurs pré-calculés, joints à la liste (aucune requête par fournisseur)
+    score = SupplierScoreSerializer(read_only=True, allow_null=True)
 
-class SupplierSerializer(serializers.ModelSerializer):
     class Meta:
         model = Supplier
         fields = '__all__'
+        extra_kwargs = {'name': unique_in_tenant(Supplier)}
+        select_related_fields = {'score': ['score']}
 
 
-class ProductCategorySerializer(serializers.ModelSerializer):
+class ProductCategorySerializer(BaseModelSerializer):
     class Meta:
         model = ProductCategory
         fields = '__all__'
+        extra_kwargs = {'name': unique_in_tenant(ProductCategory)}
 
 
-class ProductSimpleSerializer(serializers.ModelSerializer):
+class ProductSimpleSerializer(BaseModelSerializer):
     """Sérialiseur simplifié pour les produits"""
+    thumbnails = ThumbnailsField()
+
     class Meta:
         model = Product
-        fields = ['id', 'name', 'reference', 'selling_price', 'stock_quantity']
+        fields = ['id', 'name', 'reference', 'selling_price', 'stock_quantity', 'thumbnails']
+        field_columns = {'thumbnails': ['image_hash']}
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(BaseModelSerializer):
     category_name = serializers.ReadOnlyField(source='category.name')
     supplier_name = serializers.ReadOnlyField(source='supplier.name')
     is_low_stock = serializers.ReadOnlyField()
     margin = serializers.ReadOnlyField()
+    thumbnails = ThumbnailsField()
+    # Stock physique (stock_quantity) moins les réservations des ventes en attente
+    reserved_quantity = serializers.ReadOnlyField()
+    available_quantity = serializers.ReadOnlyField()
     
     class Meta:
         model = Product
         fields = '__all__'
+        extra_kwargs = {'reference': unique_in_tenant(Product)}
+        select_related_fields = {'category_name': ['category'], 'supplier_name': ['supplier']}
+        field_columns = {'is_low_stock': ['stock_quantity', 'min_stock_level'],
+                         'margin': ['buying_price', 'selling_price'], 'thumbnails': ['image_hash'],
+                         'reserved_quantity': [], 'available_quantity': ['stock_quantity']}
 
 
-class ProductDetailSerializer(serializers.ModelSerializer):
+class ProductDetailSerializer(BaseModelSerializer):
+    """Détail d'un produit : catégorie et fournisseur complets avec ?expand=category,supplier"""
     category_name = serializers.ReadOnlyField(source='category.name')
     supplier_name = serializers.ReadOnlyField(source='supplier.name')
     is_low_stock = serializers.ReadOnlyField()
     margin = serializers.ReadOnlyField()
+    thumbnails = ThumbnailsField()
+    reserved_quantity = serializers.ReadOnlyField()
+    available_quantity = serializers.ReadOnlyField()
     
     class Meta:
         model = Product
         fields = '__all__'
-        depth = 1
-
-
-class PurchaseItemSerializer(serializers.ModelSerializer):
+        extra_kwargs = ProductSerializer.Meta.extra_kwargs
+        expandable_fields = {
+            'category': (ProductCategorySerializer, {}),
+            'supplier': (SupplierSerializer, {}),
+        }
+        select_related_fields = ProductSerializer.Meta.select_related_fields
+        field_columns = ProductSerializer.Meta.field_columns
+
+
+class ProductBulkUpdateSerializer(serializers.Serializer):
+    """Une ligne d'une mise à jour groupée : produit visé par id ou par référence"""
+    id = serializers.IntegerField(required=False)
+    reference = serializers.CharField(max_length=50, required=False)
+    buying_price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+    selling_price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+    min_stock_level = serializers.IntegerField(min_value=0, required=False)
+
+    UPDATABLE_FIELDS = ('buying_price', 'selling_price', 'min_stock_level')
+
+    def validate(self, attrs):
+        if ('id' in attrs) == ('reference' in attrs):
+            raise serializers.ValidationError("Indiquez soit l'id, soit la référence du produit.")
+        if not any(field in attrs for field in self.UPDATABLE_FIELDS):
+            raise serializers.ValidationError("Aucun champ à mettre à jour.")
+        return attrs
+
+
+class ProductRepriceSerializer(serializers.Serializer):
+    """Révision des prix en pourcentage pour une catégorie et/ou un fournisseur"""
+    PRICE_CHOICES = (
+        ('selling', 'Prix de vente'),
+        ('buying', "Prix d'achat"),
+        ('both', 'Les deux'),
+    )
+
+    percentage = serializers.DecimalField(max_digits=6, decimal_places=2, min_value=-99.99)
+    category = serializers.PrimaryKeyRelatedField(queryset=ProductCategory.objects, required=False)
+    supplier = serializers.PrimaryKeyRelatedField(queryset=Supplier.objects, required=False)
+    price = serializers.ChoiceField(choices=PRICE_CHOICES, default='selling')
+
+    def validate(self, attrs):
+        if 'category' not in attrs and 'supplier' not in attrs:
+            raise serializers.ValidationError("Indiquez une catégorie ou un fournisseur.")
+        return attrs
+
+
+def currency_code(value):
+    value = value.upper()
+    if len(value) != 3 or not value.isalpha():
+        raise serializers.ValidationError("Code devise ISO 4217 attendu (par exemple EUR, USD).")
+    return value
+
+
+class DocumentCurrencyMixin:
+    """Devise d'une vente ou d'un achat : code en majuscules, taux connu à la date du document"""
+    date_field = None
+
+    def validate_currency(self, value):
+        return currency_code(value)
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        currency = attrs.get('currency') or getattr(self.instance, 'currency', None) or default_currency()
+        day = attrs.get(self.date_field) or getattr(self.instance, self.date_field, None) or timezone.now().date()
+        try:
+            get_rate(currency, day)
+        except ExchangeRateMissing as error:
+            raise serializers.ValidationError({'currency': str(error)})
+        return attrs
+
+
+class PurchaseItemSerializer(BaseModelSerializer):
     product_name = serializers.ReadOnlyField(source='product.name')
     total_price = serializers.ReadOnlyField()
     
     class Meta:
         model = PurchaseItem
         fields = ['id', 'product', 'product_name', 'quantity', 'unit_price', 'received_quantity', 'total_price']
+        select_related_fields = {'product_name': ['product']}
+        field_columns = {'total_price': ['quantity', 'unit_price']}
 
 
-class PurchasePaymentSerializer(serializers.ModelSerializer):
+class PurchasePaymentSerializer(BaseModelSerializer):
     class Meta:
         model = PurchasePayment
-        fields = ['id', 'payment_date', 'amount', 'payment_method', 'reference', 'notes']
+        fields = ['id', 'payment_date', 'amount', 'currency', 'exchange_rate', 'amount_base',
+                  'payment_method', 'reference', 'notes']
+        read_only_fields = ['currency', 'exchange_rate', 'amount_base']
 
 
-class PurchaseListSerializer(serializers.ModelSerializer):
+class PurchaseListSerializer(BaseModelSerializer):
+    """Liste d'achats : lignes et paiements avec ?expand=items,payments"""
     supplier_name = serializers.ReadOnlyField(source='supplier.name')
     total_amount = serializers.ReadOnlyField()
     balance_due = serializers.ReadOnlyField()
@@ -71,30 +345,43 @@ class PurchaseListSerializer(serializers.ModelSerializer):
     class Meta:
         model = Purchase
         fields = ['id', 'supplier', 'supplier_name', 'reference', 'order_date', 'status', 
-                  'payment_status', 'total_amount', 'balance_due']
+                  'payment_status', 'currency', 'total_amount', 'total_amount_base', 'balance_due']
+        expandable_fields = {
+            'items': (PurchaseItemSerializer, {'many': True}),
+            'payments': (PurchasePaymentSerializer, {'many': True}),
+        }
+        select_related_fields = {'supplier_name': ['supplier']}
+        prefetch_related_fields = {'total_amount': ['items'], 'balance_due': ['items', 'payments']}
 
 
-class PurchaseDetailSerializer(serializers.ModelSerializer):
+class PurchaseDetailSerializer(DocumentCurrencyMixin, BaseModelSerializer):
+    """Détail d'un achat : lignes et paiements avec ?expand=items,payments"""
     supplier_name = serializers.ReadOnlyField(source='supplier.name')
     total_amount = serializers.ReadOnlyField()
     total_paid = serializers.ReadOnlyField()
     balance_due = serializers.ReadOnlyField()
     is_overdue = serializers.ReadOnlyField()
-    items = PurchaseItemSerializer(many=True, read_only=True)
-    payments = PurchasePaymentSerializer(many=True, read_only=True)
+    date_field = 'order_date'
     
     class Meta:
         model = Purchase
         fields = '__all__'
+        read_only_fields = ['exchange_rate', 'total_amount_base']
+        expandable_fields = PurchaseListSerializer.Meta.expandable_fields
+        select_related_fields = {'supplier_name': ['supplier']}
+        prefetch_related_fields = {'total_amount': ['items'], 'total_paid': ['payments'],
+                                   'balance_due': ['items', 'payments']}
+        field_columns = {'is_overdue': ['payment_due_date', 'payment_status']}
 
 
-class PurchaseCreateSerializer(serializers.ModelSerializer):
+class PurchaseCreateSerializer(DocumentCurrencyMixin, BaseModelSerializer):
     items = PurchaseItemSerializer(many=True)
+    date_field = 'order_date'
     
     class Meta:
         model = Purchase
         fields = ['supplier', 'reference', 'order_date', 'expected_delivery_date', 
-                  'status', 'payment_status', 'payment_due_date', 'notes', 'items']
+                  'status', 'payment_status', 'payment_due_date', 'currency', 'notes', 'items']
     
     def create(self, validated_data):
         items_data = validated_data.pop('items')
@@ -106,28 +393,33 @@ class PurchaseCreateSerializer(serializers.ModelSerializer):
         return purchase
 
 
-class CustomerSerializer(serializers.ModelSerializer):
+class CustomerSerializer(BaseModelSerializer):
     class Meta:
         model = Customer
         fields = '__all__'
 
 
-class SaleItemSerializer(serializers.ModelSerializer):
+class SaleItemSerializer(BaseModelSerializer):
     product_name = serializers.ReadOnlyField(source='product.name')
     total_price = serializers.ReadOnlyField()
     
     class Meta:
         model = SaleItem
         fields = ['id', 'product', 'product_name', 'quantity', 'unit_price', 'discount', 'total_price']
+        select_related_fields = {'product_name': ['product']}
+        field_columns = {'total_price': ['quantity', 'unit_price', 'discount']}
 
 
-class SalePaymentSerializer(serializers.ModelSerializer):
+class SalePaymentSerializer(BaseModelSerializer):
     class Meta:
         model = SalePayment
-        fields = ['id', 'payment_date', 'amount', 'payment_method', 'reference', 'notes']
+        fields = ['id', 'payment_date', 'amount', 'currency', 'exchange_rate', 'amount_base',
+                  'payment_method', 'reference', 'notes']
+        read_only_fields = ['currency', 'exchange_rate', 'amount_base']
 
 
-class SaleListSerializer(serializers.ModelSerializer):
+class SaleListSerializer(BaseModelSerializer):
+    """Liste de ventes : lignes et paiements avec ?expand=items,payments"""
     customer_name = serializers.ReadOnlyField(source='customer.name')
     total_amount = serializers.ReadOnlyField()
     balance_due = serializers.ReadOnlyField()
@@ -135,60 +427,83 @@ class SaleListSerializer(serializers.ModelSerializer):
     class Meta:
         model = Sale
         fields = ['id', 'customer', 'customer_name', 'reference', 'sale_date', 'status', 
-                  'payment_status', 'total_amount', 'balance_due']
+                  'payment_status', 'currency', 'total_amount', 'total_amount_base', 'balance_due']
+        expandable_fields = {
+            'items': (SaleItemSerializer, {'many': True}),
+            'payments': (SalePaymentSerializer, {'many': True}),
+        }
+        select_related_fields = {'customer_name': ['customer']}
+        prefetch_related_fields = {'total_amount': ['items'], 'balance_due': ['items', 'payments']}
 
 
-class SaleDetailSerializer(serializers.ModelSerializer):
+class SaleDetailSerializer(DocumentCurrencyMixin, BaseModelSerializer):
+    """Détail d'une vente : lignes et paiements avec ?expand=items,payments"""
     customer_name = serializers.ReadOnlyField(source='customer.name')
     total_amount = serializers.ReadOnlyField()
     total_paid = serializers.ReadOnlyField()
     balance_due = serializers.ReadOnlyField()
     payment_days = serializers.ReadOnlyField()
-    items = SaleItemSerializer(many=True, read_only=True)
-    payments = SalePaymentSerializer(many=True, read_only=True)
+    date_field = 'sale_date'
     
     class Meta:
         model = Sale
         fields = '__all__'
+        read_only_fields = ['exchange_rate', 'total_amount_base']
+        expandable_fields = SaleListSerializer.Meta.expandable_fields
+        select_related_fields = {'customer_name': ['customer']}
+        prefetch_related_fields = {'total_amount': ['items'], 'total_paid': ['payments'],
+                                   'balance_due': ['items', 'payments']}
+        field_columns = {'payment_days': ['actual_delivery_date', 'payment_status']}
 
 
-class SaleCreateSerializer(serializers.ModelSerializer):
+class SaleCreateSerializer(DocumentCurrencyMixin, BaseModelSerializer):
     items = SaleItemSerializer(many=True)
+    date_field = 'sale_date'
     
     class Meta:
         model = Sale
         fields = ['customer', 'reference', 'sale_date', 'status', 'payment_status', 
-                  'expected_delivery_date', 'notes', 'items']
+                  'expected_delivery_date', 'currency', 'notes', 'items']
     
     def create(self, validated_data):
         items_data = validated_data.pop('items')
-        sale = Sale.objects.create(**validated_data)
-        
-        for item_data in items_data:
-            SaleItem.objects.create(sale=sale, **item_data)
-        
+        with transaction.atomic():
+            sale = Sale.objects.create(**validated_data)
+
+            for item_data in items_data:
+                SaleItem.objects.create(sale=sale, **item_data)
+
+            # Vente en attente : ses quantités sont réservées, ou la vente n'est pas créée
+            if sale.status == 'pending':
+                reserve_sale(sale)
         return sale
 
 
-class StockMovementSerializer(serializers.ModelSerializer):
+class StockMovementSerializer(BaseModelSerializer):
     product_name = serializers.ReadOnlyField(source='product.name')
     
     class Meta:
         model = StockMovement
         fields = '__all__'
+        select_related_fields = {'product_name': ['product']}
 
 
-class InvoiceSerializer(serializers.ModelSerializer):
+class InvoiceSerializer(BaseModelSerializer):
     customer_name = serializers.ReadOnlyField(source='sale.customer.name')
     total_amount = serializers.ReadOnlyField(source='sale.total_amount')
+    currency = serializers.ReadOnlyField(source='sale.currency')
     is_overdue = serializers.ReadOnlyField()
     
     class Meta:
         model = Invoice
         fields = '__all__'
+        extra_kwargs = {'invoice_number': unique_in_tenant(Invoice)}
+        select_related_fields = {'customer_name': ['sale__customer'], 'total_amount': ['sale'], 'currency': ['sale']}
+        prefetch_related_fields = {'total_amount': ['sale__items']}
+        field_columns = {'is_overdue': ['due_date', 'status']}
 
 
-class DashboardSupplierPaymentSerializer(serializers.ModelSerializer):
+class DashboardSupplierPaymentSerializer(BaseModelSerializer):
     supplier_name = serializers.ReadOnlyField(source='supplier.name')
     total_amount = serializers.ReadOnlyField()
     total_paid = serializers.ReadOnlyField()
@@ -198,10 +513,13 @@ class DashboardSupplierPaymentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Purchase
         fields = ['id', 'supplier_name', 'order_date', 'payment_due_date', 
-                  'payment_status', 'total_amount', 'total_paid', 'balance_due', 'is_overdue']
+                  'payment_status', 'currency', 'total_amount', 'total_amount_base', 'total_paid', 'balance_due', 'is_overdue']
+        select_related_fields = PurchaseDetailSerializer.Meta.select_related_fields
+        prefetch_related_fields = PurchaseDetailSerializer.Meta.prefetch_related_fields
+        field_columns = PurchaseDetailSerializer.Meta.field_columns
 
 
-class DashboardCustomerPaymentSerializer(serializers.ModelSerializer):
+class DashboardCustomerPaymentSerializer(BaseModelSerializer):
     customer_name = serializers.ReadOnlyField(source='customer.name')
     total_amount = serializers.ReadOnlyField()
     total_paid = serializers.ReadOnlyField()
@@ -211,12 +529,114 @@ class DashboardCustomerPaymentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Sale
         fields = ['id', 'customer_name', 'sale_date', 'actual_delivery_date', 
-                  'payment_status', 'total_amount', 'total_paid', 'balance_due', 'days_since_delivery']
+                  'payment_status', 'currency', 'total_amount', 'total_amount_base', 'total_paid', 'balance_due', 'days_since_delivery']
+        select_related_fields = SaleDetailSerializer.Meta.select_related_fields
+        prefetch_related_fields = SaleDetailSerializer.Meta.prefetch_related_fields
+        field_columns = {'days_since_delivery': ['actual_delivery_date']}
     
     def get_days_since_delivery(self, obj):
         if obj.actual_delivery_date:
-            from django.utils import timezone
-            import datetime
             today = timezone.now().date()
             return (today - obj.actual_delivery_date).days
-        return None
\ No newline at end of file
+        return None
+
+
+class ProductForecastSerializer(BaseModelSerializer):
+    product_name = serializers.ReadOnlyField(source='product.name')
+    product_reference = serializers.ReadOnlyField(source='product.reference')
+    supplier = serializers.ReadOnlyField(source='product.supplier_id')
+    stock_quantity = serializers.ReadOnlyField(source='product.stock_quantity')
+
+    class Meta:
+        model = ProductForecast
+        fields = '__all__'
+        select_related_fields = {'product_name': ['product'], 'product_reference': ['product'],
+                                 'supplier': ['product'], 'stock_quantity': ['product']}
+
+
+class DraftPurchasesSerializer(serializers.Serializer):
+    """Fournisseurs pour lesquels générer les commandes suggérées (tous si la liste est vide)"""
+    suppliers = serializers.PrimaryKeyRelatedField(queryset=Supplier.objects, many=True, required=False)
+
+
+class ExchangeRateSerializer(BaseModelSerializer):
+    class Meta:
+        model = ExchangeRate
+        fields = ['id', 'currency', 'date', 'rate']
+
+    def validate_currency(self, value):
+        return currency_code(value)
+
+    def validate_rate(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("Le taux doit être strictement positif.")
+        return value
+
+
+class StatementQuerySerializer(serializers.Serializer):
+    """Paramètres d'un relevé de compte : période (bornes incluses) et format de sortie"""
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    output = serializers.ChoiceField(choices=['json', 'csv', 'pdf'], default='json')
+
+    def validate(self, attrs):
+        if attrs.get('start') and attrs.get('end') and attrs['start'] > attrs['end']:
+            raise serializers.ValidationError("La date de début doit précéder la date de fin.")
+        return attrs
+
+
+class AccountingPeriodSerializer(BaseModelSerializer):
+    closed_by_username = serializers.ReadOnlyField(source='closed_by.username')
+
+    class Meta:
+        model = AccountingPeriod
+        fields = ['id', 'kind', 'start', 'end', 'closed_at', 'closed_by', 'closed_by_username']
+        select_related_fields = {'closed_by_username': ['closed_by']}
+
+
+class PeriodCloseSerializer(serializers.Serializer):
+    """Période à clôturer : un mois (AAAA-MM) ou une année"""
+    month = serializers.RegexField(r'^\d{4}-(0[1-9]|1[0-2])$', required=False,
+                                   error_messages={'invalid': "Mois attendu au format AAAA-MM."})
+    year = serializers.IntegerField(min_value=1900, max_value=9999, required=False)
+
+    def validate(self, attrs):
+        if ('month' in attrs) == ('year' in attrs):
+            raise serializers.ValidationError("Indiquez soit un mois (month), soit une année (year).")
+        if 'month' in attrs:
+            year, month = attrs['month'].split('-')
+            return {'kind': 'month', 'year': int(year), 'month': int(month)}
+        return {'kind': 'year', 'year': attrs['year']}
+
+
+class PeriodReportQuerySerializer(serializers.Serializer):
+    """Paramètres d'un rapport de période : bornes incluses et détail facultatif"""
+    start = serializers.DateField()
+    end = serializers.DateField()
+    by = serializers.ChoiceField(choices=['product', 'customer', 'supplier'], required=False)
+
+    def validate(self, attrs):
+        if attrs['start'] > attrs['end']:
+            raise serializers.ValidationError("La date de début doit précéder la date de fin.")
+        return attrs
+
+
+class JobSerializer(BaseModelSerializer):
+    """État et avancement d'une tâche en arrière-plan"""
+    percent = serializers.ReadOnlyField()
+
+    class Meta:
+        model = Job
+        fields = ['id', 'name', 'status', 'priority', 'run_at', 'attempts', 'max_attempts', 'progress',
+                  'progress_total', 'percent', 'progress_message', 'result', 'last_error', 'started_at',
+                  'finished_at', 'created_at']
+        field_columns = {'percent': ['status', 'progress', 'progress_total']}
+
+
+class AuditLogSerializer(BaseModelSerializer):
+    username = serializers.ReadOnlyField(source='user.username')
+
+    class Meta:
+        model = AuditLog
+        fields = ['id', 'model', 'object_id', 'action', 'changes', 'user', 'username', 'timestamp']
+        select_related_fields = {'username': ['user']}
@@ -0,0 +1,256 @@
+"""
+Relevés de compte clients et fournisseurs.
+
+Ventes (ou achats) et paiements, vivants et archivés (voir core.archive), sont
+réunis dans un seul grand livre daté par une requête UNION ALL, sur leurs montants en devise de base enregistrés à
+l'écriture (voir core.currency) ; le solde cumulé est calculé par la base avec une
+fonction de fenêtre, à partir du solde d'ouverture (tout ce qui précède la
+période). Les lignes sont lues par paquets avec un curseur côté serveur et
+écrites au fil de l'eau en CSV ou en PDF, sans charger le relevé en mémoire.
+"""
+import csv
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connections, router
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.pdfgen import canvas
+
+from .models import (
+    ArchivedPurchase, ArchivedPurchasePayment, ArchivedSale, ArchivedSalePayment, Customer, Purchase,
+    PurchasePayment, Sale, SalePayment,
+)
+
+CENT = Decimal('0.01')
+FETCH_SIZE = 2000
+
+
+class Ledger:
+    """Description des tables d'un type de compte : documents et paiements, puis leurs archives"""
+
+    def __init__(self, tables, party_column, date_column, kinds):
+        self.tables = tables
+        self.document = tables[0][0]
+        self.party_column = party_column
+        self.date_column = date_column
+        self.kinds = kinds
+
+    def entries_sql(self, tenant_id, party_id, start=None, end=None):
+        """
+        Écritures du compte (documents puis paiements, vivants puis archivés) sur la période, avec leurs
+        paramètres ; la boutique ouvre le filtre comme elle ouvre l'index
+        (boutique, tiers, date).
+        """
+        def period(column):
+            # Filtre dans chaque branche de l'union, pour profiter des index sur les dates
+            return (f" AND {column} >= %s" if start is not None else '') + \
+                (f" AND {column} <= %s" if end is not None else '')
+
+        bounds = [value for value in (start, end) if value is not None]
+        branches, params = [], []
+        for document_model, payment_model in self.tables:
+            document = document_model._meta.db_table
+            payment = payment_model._meta.db_table
+            payment_fk = payment_model._meta.get_field(self.document._meta.model_name).column
+            branches.append(f"""
+                SELECT d.{self.date_column} AS entry_date, 0 AS position, '{self.kinds[0]}' AS kind,
+                       d.id AS document_id, d.reference AS reference, d.total_amount_base AS document_amount,
+                       0 AS payment_amount
+                FROM {document} d
+                WHERE d.tenant_id = %s AND d.{self.party_column} = %s AND d.status <> 'cancelled'
+                    {period('d.' + self.date_column)}
+                UNION ALL
+                SELECT p.payment_date, 1, '{self.kinds[1]}', p.id, p.reference, 0, p.amount_base
+                FROM {payment} p INNER JOIN {document} d ON d.id = p.{payment_fk}
+                WHERE d.tenant_id = %s AND d.{self.party_column} = %s{period('p.payment_date')}
+            """)
+            params += [tenant_id, party_id, *bounds, tenant_id, party_id, *bounds]
+        return "UNION ALL".join(branches), params
+
+
+LEDGERS = {
+    'customer': Ledger([(Sale, SalePayment), (ArchivedSale, ArchivedSalePayment)], 'customer_id', 'sale_date',
+                       ('sale', 'payment')),
+    'supplier': Ledger([(Purchase, PurchasePayment), (ArchivedPurchase, ArchivedPurchasePayment)], 'supplier_id',
+                       'order_date', ('purchase', 'payment')),
+}
+
+KIND_LABELS = {'sale': "Vente", 'purchase': "Achat", 'payment': "Paiement"}
+
+
+def _decimal(value):
+    # SQLite renvoie des flottants pour les sommes de décimaux
+    return Decimal(str(value or 0)).quantize(CENT)
+
+
+class Statement:
+    """Relevé d'un client ou d'un fournisseur sur une période (bornes incluses, facultatives)"""
+
+    def __init__(self, party, start=None, end=None):
+        self.party = party
+        self.party_type = 'customer' if isinstance(party, Customer) else 'supplier'
+        self.ledger = LEDGERS[self.party_type]
+        self.start = start
+        self.end = end
+        self.alias = router.db_for_read(self.ledger.document)
+        self.total_documents = Decimal('0.00')
+        self.total_payments = Decimal('0.00')
+        self._opening_balance = None
+        self.closing_balance = None
+
+    @property
+    def opening_balance(self):
+        """Solde dû avant le début de la période"""
+        if self._opening_balance is None:
+            self._opening_balance = Decimal('0.00')
+            if self.start is not None:
+                sql, params = self.ledger.entries_sql(self.party.tenant_id, self.party.pk,
+                                                      end=self.start - timedelta(days=1))
+                with connections[self.alias].cursor() as cursor:
+                    cursor.execute(f"SELECT SUM(document_amount - payment_amount) FROM ({sql}) e", params)
+                    self._opening_balance = _decimal(cursor.fetchone()[0])
+        return self._opening_balance
+
+    def entries(self):
+        """Écritures de la période avec leur solde cumulé, dans l'ordre chronologique"""
+        sql, params = self.ledger.entries_sql(self.party.tenant_id, self.party.pk, self.start, self.end)
+        opening = self.opening_balance
+        query = f"""
+            SELECT entry_date, kind, document_id, reference, document_amount, payment_amount,
+                   SUM(document_amount - payment_amount) OVER (
+                       ORDER BY entry_date, position, document_id ROWS UNBOUNDED PRECEDING
+                   ) AS running_total
+            FROM ({sql}) e
+            ORDER BY entry_date, position, document_id
+        """
+        balance = opening
+        connection = connections[self.alias]
+        connection.ensure_connection()
+        with connection.chunked_cursor() as cursor:
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(FETCH_SIZE)
+                if not rows:
+                    break
+                for entry_date, kind, document_id, reference, document_amount, payment_amount, running in rows:
+                    document_amount = _decimal(document_amount)
+                    payment_amount = _decimal(payment_amount)
+                    self.total_documents += document_amount
+                    self.total_payments += payment_amount
+                    balance = opening + _decimal(running)
+                    yield {
+                        'date': str(entry_date)[:10],
+                        'kind': kind,
+                        'document_id': document_id,
+                        'reference': reference or '',
+                        'document_amount': document_amount,
+                        'payment_amount': payment_amount,
+                        'balance': balance,
+                    }
+        self.closing_balance = balance
+
+    def summary(self):
+        """En-tête du relevé ; les totaux ne sont complets qu'après lecture des écritures"""
+        return {
+            'party_type': self.party_type,
+            'party_id': self.party.pk,
+            'party_name': self.party.name,
+            'start': self.start.isoformat() if self.start else None,
+            'end': self.end.isoformat() if self.end else None,
+            'currency': settings.BASE_CURRENCY,
+            'opening_balance': self.opening_balance,
+            'total_documents': self.total_documents,
+            'total_payments': self.total_payments,
+            'closing_balance': self.closing_balance,
+        }
+
+
+class _Echo:
+    """Pseudo-fichier pour csv.writer : renvoie la ligne au lieu de l'écrire"""
+
+    def write(self, value):
+        return value
+
+
+def statement_csv(statement):
+    """Génère le relevé en CSV, ligne par ligne (séparateur « ; » pour les tableurs français)"""
+    writer = csv.writer(_Echo(), delimiter=';')
+    # BOM : Excel reconnaît ainsi l'UTF-8
+    yield '\ufeff' + writer.writerow(["Date", "Type", "Document", "Référence", "Montant", "Règlement", "Solde"])
+    yield writer.writerow([statement.start or '', "Solde d'ouverture", '', '', '', '', statement.opening_balance])
+    for entry in statement.entries():
+        yield writer.writerow([entry['date'], KIND_LABELS[entry['kind']], entry['document_id'], entry['reference'],
+                               entry['document_amount'] or '', entry['payment_amount'] or '', entry['balance']])
+    yield writer.writerow([statement.end or '', "Solde de clôture", '', '', statement.total_documents,
+                           statement.total_payments, statement.closing_balance])
+
+
+def statement_pdf(statement, company_name):
+    """Dessine le relevé page par page dans un fichier temporaire et le renvoie, prêt à être lu"""
+    output = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    pdf = canvas.Canvas(output, pagesize=A4, pageCompression=1)
+    party_label = "Client" if statement.party_type == 'customer' else "Fournisseur"
+    pdf.setTitle(f"Relevé de compte - {statement.party.name}")
+    width, height = A4
+    left = 20 * mm
+    right = width - 20 * mm
+    period = f"du {statement.start or 'début'} au {statement.end or 'ce jour'}"
+
+    def header():
+        pdf.setFont('Helvetica-Bold', 16)
+        pdf.drawString(left, height - 25 * mm, company_name)
+        pdf.setFont('Helvetica-Bold', 12)
+        pdf.drawRightString(right, height - 25 * mm, "Relevé de compte")
+        pdf.setFont('Helvetica', 9)
+        pdf.drawRightString(right, height - 31 * mm, f"{party_label} : {statement.party.name[:60]}")
+        pdf.drawRightString(right, height - 36 * mm, f"Période {period} - montants en {settings.BASE_CURRENCY}")
+
+    def table_header(y):
+        pdf.setFont('Helvetica-Bold', 9)
+        pdf.drawString(left, y, "Date")
+        pdf.drawString(left + 22 * mm, y, "Type")
+        pdf.drawString(left + 44 * mm, y, "Document")
+        pdf.drawRightString(left + 115 * mm, y, "Montant")
+        pdf.drawRightString(left + 143 * mm, y, "Règlement")
+        pdf.drawRightString(right, y, "Solde")
+        pdf.line(left, y - 2 * mm, right, y - 2 * mm)
+        pdf.setFont('Helvetica', 9)
+        return y - 7 * mm
+
+    header()
+    y = table_header(height - 50 * mm)
+    pdf.drawString(left + 22 * mm, y, "Solde d'ouverture")
+    pdf.drawRightString(right, y, str(statement.opening_balance))
+    y -= 6 * mm
+    for entry in statement.entries():
+        if y < 30 * mm:
+            pdf.showPage()
+            header()
+            y = table_header(height - 50 * mm)
+        document = f"#{entry['document_id']}"
+        if entry['reference']:
+            document += f" {entry['reference'][:25]}"
+        pdf.drawString(left, y, entry['date'])
+        pdf.drawString(left + 22 * mm, y, KIND_LABELS[entry['kind']])
+        pdf.drawString(left + 44 * mm, y, document)
+        if entry['document_amount']:
+            pdf.drawRightString(left + 115 * mm, y, str(entry['document_amount']))
+        if entry['payment_amount']:
+            pdf.drawRightString(left + 143 * mm, y, str(entry['payment_amount']))
+        pdf.drawRightString(right, y, str(entry['balance']))
+        y -= 6 * mm
+
+    pdf.line(left, y + 2 * mm, right, y + 2 * mm)
+    y -= 4 * mm
+    pdf.setFont('Helvetica-Bold', 9)
+    pdf.drawString(left + 22 * mm, y, "Solde de clôture")
+    pdf.drawRightString(left + 115 * mm, y, str(statement.total_documents))
+    pdf.drawRightString(left + 143 * mm, y, str(statement.total_payments))
+    pdf.drawRightString(right, y, str(statement.closing_balance))
+    pdf.showPage()
+    pdf.save()
+    output.seek(0)
+    return output
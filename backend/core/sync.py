@@ -0,0 +1,140 @@
+"""
+Flux de synchronisation des clients qui gardent une copie locale des données
+(application React, appareils hors ligne).
+
+GET /api/sync/ renvoie les lignes créées ou modifiées (updated_at) et les
+suppressions (Tombstone) depuis un jeton de synchronisation, par pages d'au
+plus SYNC_PAGE_SIZE lignes ; sans jeton, tout le contenu de la boutique. Le
+client enregistre les lignes par identifiant et supprime celles de deleted,
+puis rappelle avec le jeton reçu tant que has_more est vrai ; le dernier
+jeton sert à la synchronisation suivante.
+
+Chaque synchronisation lit une fenêtre fixe de dates, qui s'arrête
+SYNC_MARGIN secondes avant son début : une transaction en cours, validée
+après coup avec une date antérieure, est lue par la synchronisation
+suivante tant qu'elle dure moins longtemps. Les suppressions sont conservées
+SYNC_TOMBSTONE_DAYS jours ; un jeton plus ancien est refusé et le client
+repart d'une copie complète. L'archivage (voir core.archive) n'est pas une
+suppression : les documents archivés restent dans les copies locales.
+"""
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core import signing
+from django.db.models import Q
+from django.db.models.signals import post_delete
+from django.utils import timezone
+
+from .models import (
+    Customer, Invoice, Product, ProductCategory, Purchase, PurchaseItem, PurchasePayment, Sale, SaleItem,
+    SalePayment, StockMovement, Supplier, Tombstone,
+)
+
+# Modèles synchronisés, référentiel et documents avant leurs lignes
+SYNC_MODELS = [
+    Supplier, ProductCategory, Product, Customer,
+    Purchase, PurchaseItem, PurchasePayment,
+    Sale, SaleItem, SalePayment,
+    StockMovement, Invoice,
+]
+SALT = 'core.sync'
+
+
+class SyncTokenError(Exception):
+    """Jeton de synchronisation illisible ou émis pour une autre boutique"""
+
+
+class SyncTokenExpired(SyncTokenError):
+    """Jeton plus ancien que les suppressions conservées : une copie complète est nécessaire"""
+
+
+def _timestamp(value):
+    return value.isoformat() if value is not None else None
+
+
+def _datetime(value):
+    return datetime.fromisoformat(value) if value is not None else None
+
+
+def _dump(tenant_id, since, until=None, step=0, after=None):
+    return signing.dumps({'tenant': tenant_id, 'since': _timestamp(since), 'until': _timestamp(until),
+                          'step': step, 'after': after}, salt=SALT, compress=True)
+
+
+def _load(token, tenant_id):
+    try:
+        state = signing.loads(token, salt=SALT)
+    except signing.BadSignature:
+        raise SyncTokenError("Jeton de synchronisation invalide.")
+    if state.get('tenant') != tenant_id:
+        raise SyncTokenError("Jeton de synchronisation émis pour une autre boutique.")
+    return state
+
+
+def _columns(model):
+    return [field.attname for field in model._meta.concrete_fields if field.name != 'tenant']
+
+
+def _row(values):
+    # Montants en chaînes, comme les champs décimaux des sérialiseurs
+    return {key: str(value) if isinstance(value, Decimal) else value for key, value in values.items()}
+
+
+def read_changes(tenant_id, token=None, limit=None):
+    """
+    Page du flux de synchronisation de la boutique à partir du jeton (copie
+    complète sans jeton) : {'token', 'has_more', 'changes': {modèle: lignes},
+    'deleted': {modèle: identifiants}}.
+    """
+    limit = min(limit or settings.SYNC_PAGE_SIZE, settings.SYNC_PAGE_SIZE)
+    state = _load(token, tenant_id) if token else {}
+    now = timezone.now()
+    since = _datetime(state.get('since'))
+    if since is not None and since < now - timedelta(days=settings.SYNC_TOMBSTONE_DAYS):
+        raise SyncTokenExpired("Jeton de synchronisation expiré : une copie complète est nécessaire.")
+    until = _datetime(state.get('until')) or now - timedelta(seconds=settings.SYNC_MARGIN)
+    step, after = state.get('step', 0), state.get('after')
+
+    # Une copie complète n'a rien à supprimer
+    sources = SYNC_MODELS + ([Tombstone] if since is not None else [])
+    changes, deleted = {}, {}
+    remaining = limit
+    while step < len(sources) and remaining:
+        model = sources[step]
+        date_field = 'deleted_at' if model is Tombstone else 'updated_at'
+        rows = model.all_tenants.filter(tenant_id=tenant_id, **{f'{date_field}__lte': until})
+        if since is not None:
+            rows = rows.filter(**{f'{date_field}__gt': since})
+        if after is not None:
+            # Reprise après la dernière ligne de la page précédente
+            moment = _datetime(after[0])
+            rows = rows.filter(Q(**{f'{date_field}__gt': moment}) | Q(**{date_field: moment, 'pk__gt': after[1]}))
+        columns = ['pk', 'model', 'object_id', 'deleted_at'] if model is Tombstone else _columns(model)
+        rows = list(rows.order_by(date_field, 'pk').values(*columns)[:remaining])
+        if model is Tombstone:
+            for row in rows:
+                deleted.setdefault(row['model'], []).append(row['object_id'])
+        elif rows:
+            changes[model._meta.model_name] = [_row(row) for row in rows]
+        remaining -= len(rows)
+        if remaining:
+            step, after = step + 1, None
+        else:
+            last = rows[-1]
+            after = [_timestamp(last[date_field]), last['pk' if model is Tombstone else model._meta.pk.attname]]
+
+    if step < len(sources):
+        token = _dump(tenant_id, since, until, step, after)
+    else:
+        token = _dump(tenant_id, until)
+    return {'token': token, 'has_more': step < len(sources), 'changes': changes, 'deleted': deleted}
+
+
+def _deleted(sender, instance, **kwargs):
+    Tombstone.all_tenants.create(tenant_id=instance.tenant_id, model=sender._meta.model_name, object_id=instance.pk)
+
+
+def connect_signals():
+    for model in SYNC_MODELS:
+        post_delete.connect(_deleted, sender=model, dispatch_uid=f'sync_delete_{model.__name__}')
@@ -0,0 +1,96 @@
+"""Tâches en arrière-plan de l'application (voir core.jobs)"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from .archive import archive_history
+from .invoices import with_pdf_relations, render_invoices, build_invoices_zip
+from .jobs import task, FINISHED_STATUSES
+from .models import Invoice, Job, IdempotencyKey, Tombstone
+from .replenishment import compute_forecasts, refresh_forecasts
+from .reservations import release_expired
+from .scorecards import refresh_supplier_scores
+
+EXPORT_DIRECTORY = 'exports/jobs'
+
+
+@task('invoices.export')
+def export_invoices(job, invoice_ids):
+    """Génère les PDF d'un lot de factures et les assemble dans une archive zip"""
+    invoices = list(with_pdf_relations(Invoice.objects.filter(id__in=invoice_ids)))
+    job.set_progress(0, len(invoices), "Génération des PDF")
+    entries = []
+    step = 200
+    for start in range(0, len(invoices), step):
+        entries.extend(render_invoices(invoices[start:start + step]))
+        job.set_progress(len(entries), message="Génération des PDF")
+
+    job.set_progress(len(entries), message="Assemblage de l'archive")
+    path = f"{EXPORT_DIRECTORY}/{job.id}/factures.zip"
+    if default_storage.exists(path):
+        default_storage.delete(path)
+    with build_invoices_zip(entries) as archive:
+        default_storage.save(path, archive)
+    return {'file': path, 'count': len(entries)}
+
+
+@task('jobs.purge', every=timedelta(days=1))
+def purge_jobs(job):
+    """Supprime les tâches terminées au-delà de la durée de conservation"""
+    limit = timezone.now() - timedelta(days=settings.JOB_RETENTION_DAYS)
+    finished = Job.objects.filter(status__in=FINISHED_STATUSES, finished_at__lt=limit)
+    for path in finished.filter(result__has_key='file').values_list('result__file', flat=True):
+        default_storage.delete(path)
+    deleted, _ = finished.delete()
+    return {'deleted': deleted}
+
+
+@task('idempotency.purge', every=timedelta(hours=1))
+def purge_idempotency_keys(job):
+    """Supprime en une requête les clés d'idempotence expirées"""
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lt=timezone.now()).delete()
+    return {'deleted': deleted}
+
+
+
+@task('sync.purge', every=timedelta(days=1))
+def purge_tombstones(job):
+    """Supprime les traces de suppression plus anciennes que les jetons de synchronisation acceptés"""
+    limit = timezone.now() - timedelta(days=settings.SYNC_TOMBSTONE_DAYS)
+    deleted, _ = Tombstone.all_tenants.filter(deleted_at__lt=limit).delete()
+    return {'deleted': deleted}
+
+
+@task('reservations.release', every=timedelta(minutes=5))
+def release_expired_reservations(job):
+    """Supprime par lots les réservations de stock expirées"""
+    return {'released': release_expired()}
+
+
+@task('archive.history', every=timedelta(days=1))
+def archive_closed_history(job):
+    """Déplace vers les tables d'archive les documents clos et les mouvements anciens (voir core.archive)"""
+    def progress(moved):
+        job.set_progress(sum(moved.values()), message="Archivage")
+
+    return archive_history(progress=progress)
+
+
+@task('suppliers.scores', every=timedelta(days=1))
+def refresh_scores(job):
+    """Reconstruit les indicateurs de tous les fournisseurs (délais, taux de service, prix)"""
+    return {'suppliers': refresh_supplier_scores()}
+
+
+@task('replenishment.full', every=timedelta(days=1))
+def recompute_forecasts(job):
+    """Recalcule les prévisions et points de commande de tout le catalogue"""
+    return {'products': compute_forecasts()}
+
+
+@task('replenishment.incremental', every=timedelta(minutes=15))
+def update_forecasts(job):
+    """Met à jour les prévisions des produits vendus ou commandés depuis le dernier calcul"""
+    return {'products': refresh_forecasts()}
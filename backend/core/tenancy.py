@@ -0,0 +1,201 @@
+"""
+Boutiques (tenants) : un déploiement sert plusieurs boutiques isolées.
+
+Chaque ligne des modèles de core porte la boutique à laquelle elle appartient,
+et chaque index composite commence par cette colonne : les requêtes d'une
+boutique ne parcourent que sa plage d'index. La boutique de la requête est
+résolue après l'authentification (en-tête TENANT_HEADER, sinon première
+boutique de l'utilisateur) puis gardée dans une variable de contexte : le
+gestionnaire par défaut des modèles (TenantManager) filtre alors sur elle,
+et les objets créés la reçoivent. Hors requête (commandes, tâches), le code
+se place explicitement dans une boutique avec tenant_context().
+
+Les boutiques de chaque utilisateur sont gardées en cache (TENANT_CACHE_TTL)
+et oubliées dès qu'une adhésion ou une boutique change.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import PermissionDenied
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save
+
+KEY_PREFIX = 'tenancy-user'
+
+_current_tenant = ContextVar('current_tenant', default=None)
+_default_tenant_id = None
+
+
+def current_tenant_id():
+    """Boutique de la requête ou de la tâche en cours, None hors boutique (toutes les boutiques)"""
+    return _current_tenant.get()
+
+
+def default_tenant_id():
+    """Boutique DEFAULT_TENANT, créée au besoin : reçoit les données écrites hors boutique"""
+    global _default_tenant_id
+    if _default_tenant_id is None:
+        Tenant = apps.get_model('core', 'Tenant')
+        tenant, _ = Tenant.objects.get_or_create(slug=settings.DEFAULT_TENANT,
+                                                 defaults={'name': settings.DEFAULT_TENANT})
+        _default_tenant_id = tenant.pk
+    return _default_tenant_id
+
+
+def tenant_id_for(slug):
+    """Boutique désignée par son identifiant (DEFAULT_TENANT si vide) ; None si elle n'existe pas"""
+    if not slug:
+        return default_tenant_id()
+    Tenant = apps.get_model('core', 'Tenant')
+    return Tenant.objects.filter(slug=slug).values_list('id', flat=True).first()
+
+
+def active_tenant_id():
+    """Boutique à laquelle rattacher une nouvelle ligne"""
+    tenant_id = current_tenant_id()
+    return tenant_id if tenant_id is not None else default_tenant_id()
+
+
+def activate(tenant_id):
+    """Fixe la boutique courante ; renvoie le jeton à passer à deactivate()"""
+    return _current_tenant.set(tenant_id)
+
+
+def deactivate(token):
+    _current_tenant.reset(token)
+
+
+@contextmanager
+def tenant_context(tenant_id):
+    """Exécute le bloc dans la boutique donnée (None : sans filtre de boutique)"""
+    token = activate(tenant_id)
+    try:
+        yield tenant_id
+    finally:
+        deactivate(token)
+
+
+def namespace(tenant_id=None):
+    """Préfixe des caches propres à une boutique (taux de change, fichiers générés)"""
+    return f"tenant-{tenant_id if tenant_id is not None else active_tenant_id()}"
+
+
+class TenantManager(models.Manager):
+    """Gestionnaire par défaut : limité à la boutique courante quand elle est connue"""
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        tenant_id = current_tenant_id()
+        if tenant_id is not None:
+            queryset = queryset.filter(tenant_id=tenant_id)
+        return queryset
+
+
+def _cache():
+    return caches[settings.JWT_USER_CACHE]
+
+
+def cache_key(user_id):
+    return f"{KEY_PREFIX}:{user_id}"
+
+
+def user_tenants(user):
+    """Boutiques actives de l'utilisateur, [(id, slug)], dans l'ordre de ses adhésions"""
+    key = cache_key(user.pk)
+    tenants = _cache().get(key) if settings.TENANT_CACHE_TTL else None
+    if tenants is None:
+        Membership = apps.get_model('core', 'Membership')
+        tenants = list(Membership.objects.filter(user=user, tenant__is_active=True).order_by('id')
+                       .values_list('tenant_id', 'tenant__slug'))
+        if settings.TENANT_CACHE_TTL:
+            _cache().set(key, tenants, settings.TENANT_CACHE_TTL)
+    return tenants
+
+
+def resolve_tenant(user, slug=None):
+    """
+    Boutique de l'utilisateur pour une requête : celle demandée (slug) s'il en
+    est membre, sinon la première de ses boutiques. Un superutilisateur peut
+    demander n'importe quelle boutique ; sans adhésion, il voit toutes les
+    boutiques (None). Lève PermissionDenied dans les autres cas.
+    """
+    if user is None or not user.is_authenticated:
+        return None
+    tenants = user_tenants(user)
+    if slug:
+        for tenant_id, tenant_slug in tenants:
+            if tenant_slug == slug:
+                return tenant_id
+        if user.is_superuser:
+            Tenant = apps.get_model('core', 'Tenant')
+            tenant_id = Tenant.objects.filter(slug=slug, is_active=True).values_list('id', flat=True).first()
+            if tenant_id is not None:
+                return tenant_id
+        raise PermissionDenied(f"Boutique « {slug} » inconnue ou non autorisée.")
+    if tenants:
+        return tenants[0][0]
+    if user.is_superuser:
+        return None
+    raise PermissionDenied("Aucune boutique n'est associée à ce compte.")
+
+
+def requested_slug(request):
+    return request.headers.get(settings.TENANT_HEADER)
+
+
+class TenantMiddleware:
+    """
+    Boutique des requêtes authentifiées par session (administration). Les
+    requêtes d'API, authentifiées par JWT dans la vue, sont traitées par
+    TenantScopedMixin.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.tenant_id = None
+        token = activate(None)
+        try:
+            user = getattr(request, 'user', None)
+            if user is not None and user.is_authenticated:
+                try:
+                    request.tenant_id = resolve_tenant(user, requested_slug(request))
+                except PermissionDenied:
+                    # Compte sans boutique : l'administration ne lui montre aucune donnée
+                    request.tenant_id = 0
+                activate(request.tenant_id)
+            return self.get_response(request)
+        finally:
+            deactivate(token)
+
+
+def invalidate_user(user_id):
+    _cache().delete(cache_key(user_id))
+
+
+def _membership_changed(sender, instance, **kwargs):
+    invalidate_user(instance.user_id)
+    transaction.on_commit(partial(invalidate_user, instance.user_id))
+
+
+def _tenant_changed(sender, instance, **kwargs):
+    global _default_tenant_id
+    if instance.pk == _default_tenant_id:
+        _default_tenant_id = None
+    Membership = apps.get_model('core', 'Membership')
+    for user_id in Membership.objects.filter(tenant_id=instance.pk).values_list('user_id', flat=True):
+        invalidate_user(user_id)
+
+
+def connect_signals():
+    Tenant = apps.get_model('core', 'Tenant')
+    Membership = apps.get_model('core', 'Membership')
+    post_save.connect(_membership_changed, sender=Membership, dispatch_uid='tenancy_membership_save')
+    post_delete.connect(_membership_changed, sender=Membership, dispatch_uid='tenancy_membership_delete')
+    post_save.connect(_tenant_changed, sender=Tenant, dispatch_uid='tenancy_tenant_save')
+    post_delete.connect(_tenant_changed, sender=Tenant, dispatch_uid='tenancy_tenant_delete')
@@ -0,0 +1,11 @@
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+
+
+class QueryInspectorTestRunner(DiscoverRunner):
+    """Lanceur de tests : toute requête N+1 fait échouer le test concerné"""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        settings.QUERY_INSPECTOR_ENABLED = True
+        settings.QUERY_INSPECTOR_STRICT = True
@@ -0,0 +1,65 @@
+from django.conf import settings
+from django.db import connections
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from core.models import Customer
+from core.tests.utils import TenantTestMixin
+from finance_app.db_router import PIN_COOKIE
+
+
+class ReplicaRoutingTests(TenantTestMixin, TransactionTestCase):
+    """Lectures de rapport sur le réplica, écritures et lecture-après-écriture sur la base principale"""
+    # Le réplica ne voit que les données validées : pas de transaction englobant le test
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        super().setUp()
+        self.customer = Customer.objects.create(name="Client")
+
+    def get(self, path):
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica']) as replica:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return response, primary, replica
+
+    def assertReadsOn(self, alias, path):
+        response, primary, replica = self.get(path)
+        used, unused = (replica, primary) if alias == 'replica' else (primary, replica)
+        self.assertTrue(len(used), f"GET {path} : aucune requête sur {alias}")
+        self.assertEqual(len(unused), 0, f"GET {path} : requêtes inattendues\n"
+                         + '\n'.join(query['sql'] for query in unused.captured_queries))
+        return response
+
+    def test_dashboard_reads_use_replica(self):
+        self.assertReadsOn('replica', '/api/dashboard/sales_summary/')
+        self.assertReadsOn('replica', '/api/dashboard/customer_payments/')
+
+    def test_export_reads_use_replica(self):
+        response = self.assertReadsOn('replica', f'/api/customers/{self.customer.pk}/statement/?output=csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+
+    def test_other_reads_use_primary(self):
+        self.assertReadsOn('default', '/api/customers/')
+
+    def test_writes_use_primary_and_pin_next_reads(self):
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica']) as replica:
+            response = self.client.post('/api/customers/', {'name': "Nouveau client"}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(any(query['sql'].startswith('INSERT') for query in primary.captured_queries))
+        self.assertEqual(len(replica), 0)
+
+        cookie = response.cookies[PIN_COOKIE]
+        self.assertEqual(cookie['max-age'], settings.REPLICA_PIN_SECONDS)
+        # Le client relit ses écritures sur la base principale tant que le cookie est valide
+        self.assertReadsOn('default', '/api/dashboard/sales_summary/')
+
+        # Cookie expiré : le navigateur ne le renvoie plus
+        del self.client.cookies[PIN_COOKIE]
+        self.assertReadsOn('replica', '/api/dashboard/sales_summary/')
+
+    def test_reads_do_not_pin(self):
+        response, _, _ = self.get('/api/dashboard/sales_summary/')
+        self.assertNotIn(PIN_COOKIE, response.cookies)
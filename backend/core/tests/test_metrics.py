@@ -0,0 +1,17 @@
+from django.test import SimpleTestCase, override_settings
+
+
+class MetricsAccessTests(SimpleTestCase):
+    """/metrics n'est publié qu'avec un jeton configuré"""
+
+    @override_settings(METRICS_TOKEN='')
+    def test_hidden_without_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_requires_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer autre').status_code, 403)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
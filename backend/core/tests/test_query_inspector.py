@@ -0,0 +1,34 @@
+from decimal import Decimal
+
+from django.conf import settings
+from django.test import TestCase
+
+from core.models import Product, ProductCategory
+from core.query_inspector import RepeatedQueriesError, inspect_queries
+from core.tests.utils import TenantTestMixin
+
+
+class StrictModeTests(TenantTestMixin, TestCase):
+    """Sous QueryInspectorTestRunner, une requête N+1 fait échouer le test"""
+
+    def setUp(self):
+        super().setUp()
+        for index in range(settings.QUERY_REPEAT_THRESHOLD + 1):
+            category = ProductCategory.objects.create(name=f"Catégorie {index}")
+            Product.objects.create(name=f"Produit {index}", category=category, buying_price=Decimal('1.00'),
+                                   selling_price=Decimal('2.00'))
+
+    def test_runner_enables_strict_mode(self):
+        self.assertTrue(settings.QUERY_INSPECTOR_STRICT)
+
+    def test_lazy_relation_in_loop_raises(self):
+        with self.assertRaisesMessage(RepeatedQueriesError, "accès à une relation"):
+            with inspect_queries('boucle'):
+                for product in Product.objects.all():
+                    product.category.name
+
+    def test_select_related_loop_passes(self):
+        with inspect_queries('boucle') as inspection:
+            for product in Product.objects.select_related('category'):
+                product.category.name
+        self.assertEqual(inspection.repeated(), [])
@@ -0,0 +1,59 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.test import TestCase
+from django.utils import timezone
+
+from core.models import (
+    Customer, Product, ProductForecast, Purchase, PurchaseItem, Sale, SaleItem, Supplier, SupplierProductScore,
+    SupplierScore,
+)
+from core.replenishment import compute_forecasts, refresh_forecasts
+from core.scorecards import refresh_supplier_scores
+from core.tests.utils import TenantTestMixin
+
+
+class LeadTimeTests(TenantTestMixin, TestCase):
+    """Un achat livré avant sa date de commande ne fait pas échouer les prévisions"""
+
+    def setUp(self):
+        super().setUp()
+        today = timezone.now().date()
+        self.supplier = Supplier.objects.create(name="Fournisseur")
+        self.product = Product.objects.create(name="Produit", supplier=self.supplier, buying_price=Decimal('5.00'),
+                                              selling_price=Decimal('10.00'), stock_quantity=2)
+        purchase = Purchase.objects.create(supplier=self.supplier, status='received',
+                                           order_date=today - timedelta(days=3),
+                                           actual_delivery_date=today - timedelta(days=4))
+        PurchaseItem.objects.create(purchase=purchase, product=self.product, quantity=10,
+                                    unit_price=Decimal('5.00'), received_quantity=10)
+        customer = Customer.objects.create(name="Client")
+        for days in (5, 40, 70):
+            sale = Sale.objects.create(customer=customer, status='delivered', sale_date=today - timedelta(days=days))
+            SaleItem.objects.create(sale=sale, product=self.product, quantity=days // 5, unit_price=Decimal('10.00'))
+
+    def assertDefaultLeadTime(self):
+        forecast = ProductForecast.objects.get(product=self.product)
+        self.assertEqual(forecast.lead_time_days, Decimal(settings.REPLENISHMENT_DEFAULT_LEAD_TIME))
+        self.assertGreaterEqual(forecast.safety_stock, 0)
+
+    def test_delivery_before_order(self):
+        refresh_supplier_scores()
+        self.assertEqual(SupplierScore.objects.get(supplier=self.supplier).lead_time_avg, 0)
+        self.assertEqual(SupplierProductScore.objects.get(product=self.product).lead_time_avg, 0)
+
+        self.assertEqual(compute_forecasts(), 1)
+        self.assertDefaultLeadTime()
+
+    def test_negative_stored_lead_times(self):
+        # Indicateurs négatifs enregistrés avant que les délais par produit soient bornés à zéro
+        refresh_supplier_scores()
+        SupplierScore.objects.update(lead_time_avg=Decimal('-1'))
+        SupplierProductScore.objects.update(lead_time_avg=Decimal('-1'))
+
+        self.assertEqual(compute_forecasts(), 1)
+        self.assertDefaultLeadTime()
+        Sale.objects.update(updated_at=timezone.now())
+        self.assertEqual(refresh_forecasts(), 1)
+        self.assertDefaultLeadTime()
@@ -0,0 +1,145 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core.models import Customer, Product, Sale, SaleItem, StockReservation
+from core.reservations import release_expired, reserve_sale, with_reserved
+from core.tests.utils import TenantTestMixin
+
+STOCK = 5
+
+
+class ConcurrentCheckoutTests(TenantTestMixin, TransactionTestCase):
+    """Commandes et confirmations simultanées sur un même produit : aucune unité vendue deux fois"""
+
+    def setUp(self):
+        super().setUp()
+        self.customer = Customer.objects.create(name="Client")
+        self.product = Product.objects.create(name="Produit", buying_price=Decimal('5.00'),
+                                              selling_price=Decimal('10.00'), stock_quantity=STOCK)
+
+    def concurrently(self, method, requests):
+        """Envoie les requêtes (chemin, données) en même temps, une connexion par thread"""
+        start = threading.Event()
+
+        def send(request):
+            path, data = request
+            client = APIClient()
+            client.force_authenticate(self.user)
+            try:
+                start.wait()
+                return getattr(client, method)(path, data, format='json')
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(len(requests)) as pool:
+            futures = [pool.submit(send, request) for request in requests]
+            start.set()
+            return [future.result() for future in futures]
+
+    def order(self, quantity=1):
+        return ('/api/sales/', {'customer': self.customer.pk, 'sale_date': str(timezone.now().date()),
+                                'status': 'pending',
+                                'items': [{'product': self.product.pk, 'quantity': quantity, 'unit_price': '10.00'}]})
+
+    def confirm(self, sale):
+        return (f'/api/sales/{sale.pk}/', {'status': 'confirmed'})
+
+    def product_state(self):
+        product = with_reserved(Product.objects.filter(pk=self.product.pk)).get()
+        return product.stock_quantity, product.reserved_total
+
+    def test_concurrent_orders_then_confirmations(self):
+        responses = self.concurrently('post', [self.order() for _ in range(STOCK * 2)])
+
+        statuses = sorted(response.status_code for response in responses)
+        self.assertEqual(statuses, [201] * STOCK + [400] * STOCK)
+        for response in responses:
+            if response.status_code == 400:
+                self.assertIn("Stock disponible insuffisant", response.data['detail'])
+        # Les commandes refusées ne laissent ni vente ni réservation
+        self.assertEqual(Sale.objects.count(), STOCK)
+        self.assertEqual(self.product_state(), (STOCK, STOCK))
+
+        responses = self.concurrently('patch', [self.confirm(sale) for sale in Sale.objects.all()])
+        self.assertEqual([response.status_code for response in responses], [200] * STOCK)
+        self.assertEqual(self.product_state(), (0, 0))
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_confirmation_without_reservation_loses(self):
+        expired = Sale.objects.create(customer=self.customer)
+        SaleItem.objects.create(sale=expired, product=self.product, quantity=3, unit_price=Decimal('10.00'))
+        reserve_sale(expired)
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(minutes=1))
+        held = Sale.objects.create(customer=self.customer)
+        SaleItem.objects.create(sale=held, product=self.product, quantity=3, unit_price=Decimal('10.00'))
+        reserve_sale(held)
+
+        lost, won = self.concurrently('patch', [self.confirm(expired), self.confirm(held)])
+
+        self.assertEqual(won.status_code, 200)
+        self.assertEqual(lost.status_code, 400)
+        self.assertIn("Stock disponible insuffisant", lost.data['detail'])
+        self.assertEqual(Sale.objects.get(pk=expired.pk).status, 'pending')
+        self.assertEqual(self.product_state(), (STOCK - 3, 0))
+
+
+class ReleaseExpiredTests(TenantTestMixin, TestCase):
+
+    def test_releases_only_expired_reservations(self):
+        customer = Customer.objects.create(name="Client")
+        now = timezone.now()
+        active = []
+        for index in range(7):
+            product = Product.objects.create(name=f"Produit {index}", buying_price=Decimal('5.00'),
+                                             selling_price=Decimal('10.00'), stock_quantity=10)
+            sale = Sale.objects.create(customer=customer)
+            expires_at = now + timedelta(minutes=5) if index % 3 == 0 else now - timedelta(seconds=1)
+            reservation = StockReservation.objects.create(sale=sale, product=product, quantity=1,
+                                                          expires_at=expires_at)
+            if index % 3 == 0:
+                active.append(reservation.pk)
+
+        self.assertEqual(release_expired(batch_size=2), 7 - len(active))
+        self.assertCountEqual(StockReservation.objects.values_list('pk', flat=True), active)
+        self.assertEqual(release_expired(), 0)
+
+
+class ReservedQuantityQueriesTests(TenantTestMixin, TestCase):
+    """Quantités réservées des réponses d'écriture en une sous-requête, pas une requête par produit"""
+
+    def setUp(self):
+        super().setUp()
+        self.customer = Customer.objects.create(name="Client")
+        self.add_products(3)
+
+    def add_products(self, count):
+        for _ in range(count):
+            product = Product.objects.create(name="Produit", buying_price=Decimal('5.00'),
+                                             selling_price=Decimal('10.00'), stock_quantity=10)
+            sale = Sale.objects.create(customer=self.customer)
+            SaleItem.objects.create(sale=sale, product=product, quantity=2, unit_price=Decimal('10.00'))
+            reserve_sale(sale)
+
+    def bulk_update(self):
+        rows = [{'id': pk, 'selling_price': '12.00'} for pk in Product.objects.values_list('pk', flat=True)]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch('/api/products/bulk/', rows, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([product['reserved_quantity'] for product in response.data['results']], [2] * len(rows))
+        self.assertEqual([product['id'] for product in response.data['results']], [row['id'] for row in rows])
+        return len(queries)
+
+    def test_bulk_update_response(self):
+        # Premier appel : caches du processus (boutiques de l'utilisateur)
+        self.bulk_update()
+        before = self.bulk_update()
+        self.add_products(3)
+        self.assertEqual(self.bulk_update(), before)
@@ -0,0 +1,58 @@
+from decimal import Decimal
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from core.models import (
+    Customer, Product, Purchase, PurchaseItem, PurchasePayment, Sale, SaleItem, SalePayment, Supplier,
+)
+from core.tests.utils import TenantTestMixin
+
+
+class ListExpansionTests(TenantTestMixin, TestCase):
+    """?expand=items,payments sur les listes de ventes et d'achats, comme sur leur détail"""
+
+    def setUp(self):
+        super().setUp()
+        self.customer = Customer.objects.create(name="Client")
+        self.supplier = Supplier.objects.create(name="Fournisseur")
+        self.product = Product.objects.create(name="Produit", buying_price=Decimal('5.00'),
+                                              selling_price=Decimal('10.00'), stock_quantity=100)
+        self.add_documents(3)
+
+    def add_documents(self, count):
+        for _ in range(count):
+            sale = Sale.objects.create(customer=self.customer)
+            SaleItem.objects.create(sale=sale, product=self.product, quantity=2, unit_price=Decimal('10.00'))
+            SalePayment.objects.create(sale=sale, amount=Decimal('5.00'), payment_method='cash')
+            purchase = Purchase.objects.create(supplier=self.supplier)
+            PurchaseItem.objects.create(purchase=purchase, product=self.product, quantity=2,
+                                        unit_price=Decimal('5.00'))
+            PurchasePayment.objects.create(purchase=purchase, amount=Decimal('5.00'), payment_method='cash')
+
+    def get(self, path):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return response.data['results'], len(queries)
+
+    def test_lists_expand_items_and_payments(self):
+        for path in ('/api/sales/', '/api/purchases/'):
+            with self.subTest(path=path):
+                results, _ = self.get(path)
+                self.assertNotIn('items', results[0])
+                results, _ = self.get(f'{path}?expand=items,payments')
+                self.assertEqual(len(results), 3)
+                for document in results:
+                    self.assertEqual([item['product_name'] for item in document['items']], ["Produit"])
+                    self.assertEqual([payment['amount'] for payment in document['payments']], ['5.00'])
+
+    def test_expanded_lists_prefetch(self):
+        paths = ('/api/sales/?expand=items,payments', '/api/purchases/?expand=items,payments')
+        # Premier appel : caches du processus (boutiques de l'utilisateur, taux)
+        for path in paths:
+            self.get(path)
+        before = [self.get(path)[1] for path in paths]
+        self.add_documents(3)
+        self.assertEqual([self.get(path)[1] for path in paths], before)
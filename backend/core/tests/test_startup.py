@@ -0,0 +1,66 @@
+import io
+import json
+import logging
+import tempfile
+import time
+from unittest import mock
+from wsgiref.util import setup_testing_defaults
+
+from django.core.management import call_command
+from django.core.wsgi import get_wsgi_application
+from django.test import SimpleTestCase, override_settings
+
+from core import openapi
+
+# Seuil du premier appel d'un worker neuf servi par le schéma précalculé (secondes)
+FIRST_REQUEST_SECONDS = 1.0
+
+
+class PrecomputedSchemaStartupTests(SimpleTestCase):
+    """Un worker neuf sert /swagger.json/ depuis le fichier généré, sans introspecter l'API"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        schema_dir = override_settings(OPENAPI_SCHEMA_DIR=directory.name)
+        schema_dir.enable()
+        self.addCleanup(schema_dir.disable)
+        openapi.store.clear()
+        self.addCleanup(openapi.store.clear)
+        # Une vue qui échoue pendant l'introspection en perd ses paramètres : drf_yasg ne fait que journaliser.
+        # assertLogs exige au moins un message : le seul attendu est celui du test.
+        with self.assertLogs('drf_yasg', level='WARNING') as logs:
+            call_command('generate_schema', stdout=io.StringIO())
+            logging.getLogger('drf_yasg').warning("schéma généré")
+        self.assertEqual(logs.output, ["WARNING:drf_yasg:schéma généré"])
+
+    def call(self, application, path, **headers):
+        environ = {'PATH_INFO': path, 'REQUEST_METHOD': 'GET', **headers}
+        setup_testing_defaults(environ)
+        status = []
+        body = b''.join(application(environ, lambda code, response_headers, exc_info=None: status.append(code)))
+        return int(status[0].split()[0]), body
+
+    def test_first_request_serves_generated_schema(self):
+        with mock.patch.object(openapi, 'build_schemas', wraps=openapi.build_schemas) as build:
+            started = time.perf_counter()
+            application = get_wsgi_application()
+            status, body = self.call(application, '/swagger.json/')
+            elapsed = time.perf_counter() - started
+
+            self.assertEqual(status, 200)
+            with open(openapi.schema_path('.json'), 'rb') as stream:
+                self.assertEqual(body, stream.read())
+            build.assert_not_called()
+        self.assertLess(elapsed, FIRST_REQUEST_SECONDS,
+                        f"Première réponse d'un worker neuf après {elapsed:.2f} s (seuil {FIRST_REQUEST_SECONDS} s)")
+
+        etag = openapi.store.get('.json').etag
+        status, _ = self.call(application, '/swagger.json/', HTTP_IF_NONE_MATCH=f'"{etag}"')
+        self.assertEqual(status, 304)
+
+    def test_generated_schema_documents_product_filters(self):
+        with open(openapi.schema_path('.json'), 'rb') as stream:
+            schema = json.load(stream)
+        parameters = {parameter['name'] for parameter in schema['paths']['/products/']['get']['parameters']}
+        self.assertLessEqual({'category', 'supplier', 'search', 'ordering', 'page'}, parameters)
@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from rest_framework.test import APIClient
+
+from core import tenancy
+from core.models import Membership
+
+
+class TenantTestMixin:
+    """
+    Boutique par défaut et utilisateur membre de cette boutique, recréés pour
+    chaque test : les identifiants gardés en mémoire (boutique par défaut,
+    boutiques de l'utilisateur) ne survivent pas au nettoyage de la base.
+    """
+    client_class = APIClient
+
+    def setUp(self):
+        super().setUp()
+        caches[settings.JWT_USER_CACHE].clear()
+        tenancy._default_tenant_id = None
+        self.tenant_id = tenancy.default_tenant_id()
+        self.user = User.objects.create_user('test', password='test')
+        Membership.objects.create(tenant_id=self.tenant_id, user=self.user)
+        self.client.force_authenticate(self.user)
@@ -0,0 +1,148 @@
+"""
+Miniatures des images produits.
+
+À chaque nouvelle image, des déclinaisons WebP et JPEG sont générées dans
+plusieurs tailles par un pool de threads, hors du traitement de la requête.
+Leur nom dérive de l'empreinte du contenu de l'image : une URL de miniature ne
+change jamais de contenu et peut être mise en cache indéfiniment par les
+navigateurs. Tant que les miniatures ne sont pas prêtes, l'API n'en expose pas.
+"""
+import hashlib
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from io import BytesIO
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections
+from django.http import FileResponse, Http404
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_DIRECTORY = 'products/thumbs'
+FORMATS = {
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 4},
+    'jpeg': {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True},
+}
+EXTENSIONS = {'webp': 'webp', 'jpeg': 'jpg'}
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+_executor = None
+
+
+def thumbnail_path(digest, size, image_format):
+    """Chemin d'une miniature : le contenu de l'image source détermine le nom"""
+    return f"{THUMBNAIL_DIRECTORY}/{digest[:2]}/{digest}-{size}.{EXTENSIONS[image_format]}"
+
+
+def thumbnail_urls(digest, request=None):
+    """URL des miniatures par taille et par format, ou None si elles ne sont pas prêtes"""
+    if not digest:
+        return None
+    urls = {}
+    for size in settings.THUMBNAIL_SIZES:
+        urls[size] = {}
+        for image_format in FORMATS:
+            url = default_storage.url(thumbnail_path(digest, size, image_format))
+            urls[size][image_format] = request.build_absolute_uri(url) if request is not None else url
+    return urls
+
+
+def generate_thumbnails(name):
+    """
+    Génère les miniatures manquantes d'une image et renvoie l'empreinte de son contenu.
+
+    Les miniatures déjà présentes (même contenu, même taille) ne sont pas recalculées.
+    """
+    with default_storage.open(name, 'rb') as source:
+        content = source.read()
+    digest = hashlib.sha256(content).hexdigest()[:32]
+
+    targets = [
+        (size, dimension, image_format)
+        for size, dimension in settings.THUMBNAIL_SIZES.items()
+        for image_format in FORMATS
+        if not default_storage.exists(thumbnail_path(digest, size, image_format))
+    ]
+    if not targets:
+        return digest
+
+    with Image.open(BytesIO(content)) as original:
+        # Photos de téléphone : applique l'orientation EXIF avant de redimensionner
+        image = ImageOps.exif_transpose(original)
+        image = image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+        # Réductions successives, de la plus grande à la plus petite taille
+        for size, dimension, image_format in sorted(targets, key=lambda target: -target[1]):
+            image = image.copy()
+            image.thumbnail((dimension, dimension), Image.LANCZOS)
+            resized = image
+            if image_format == 'jpeg' and resized.mode != 'RGB':
+                background = Image.new('RGB', resized.size, (255, 255, 255))
+                background.paste(resized, mask=resized.getchannel('A'))
+                resized = background
+            buffer = BytesIO()
+            resized.save(buffer, **FORMATS[image_format])
+            path = thumbnail_path(digest, size, image_format)
+            if not default_storage.exists(path):
+                default_storage.save(path, ContentFile(buffer.getvalue()))
+    return digest
+
+
+def _generate_for_product(product_id):
+    """Tâche du pool : génère les miniatures puis enregistre l'empreinte sur le produit"""
+    Product = apps.get_model('core', 'Product')
+    try:
+        name = Product.objects.filter(pk=product_id).values_list('image', flat=True).first()
+        if not name:
+            return
+        digest = generate_thumbnails(name)
+        # Ne rien écrire si une autre image a été envoyée entre-temps
+        Product.objects.filter(pk=product_id, image=name).update(image_hash=digest)
+    except Exception:
+        logger.exception("Échec de la génération des miniatures du produit %s", product_id)
+    finally:
+        close_old_connections()
+
+
+def schedule_thumbnails(product_id):
+    """Confie la génération des miniatures au pool (ou l'exécute tout de suite sans pool)"""
+    global _executor
+    if not settings.THUMBNAIL_WORKERS:
+        _generate_for_product(product_id)
+        return
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.THUMBNAIL_WORKERS, thread_name_prefix='thumbnails')
+    _executor.submit(_generate_for_product, product_id)
+
+
+def _generate_named(name):
+    """Tâche du pool de processus de backfill_thumbnails"""
+    try:
+        return name, generate_thumbnails(name), None
+    except Exception as error:
+        return name, None, str(error)
+
+
+def backfill_thumbnails(names, workers=None):
+    """Génère les miniatures d'un lot d'images ; renvoie (nom, empreinte, erreur) pour chacune"""
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(names) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            yield from pool.map(_generate_named, names, chunksize=max(1, len(names) // (workers * 4)))
+    else:
+        for name in names:
+            yield _generate_named(name)
+
+
+def thumbnail_view(request, path):
+    """Sert une miniature avec des en-têtes de cache longue durée (le nom change avec le contenu)"""
+    name = f"{THUMBNAIL_DIRECTORY}/{path}"
+    if '..' in path.split('/') or not default_storage.exists(name):
+        raise Http404
+    response = FileResponse(default_storage.open(name, 'rb'))
+    response['Cache-Control'] = CACHE_CONTROL
+    return response
@@ -3,7 +3,8 @@ from rest_framework.routers import DefaultRouter
 from .views import (
     SupplierViewSet, ProductCategoryViewSet, ProductViewSet,
     PurchaseViewSet, CustomerViewSet, SaleViewSet,
-    StockMovementViewSet, InvoiceViewSet, DashboardViewSet
+    StockMovementViewSet, InvoiceViewSet, ReplenishmentViewSet, ExchangeRateViewSet, JobViewSet, AuditLogViewSet,
+    DashboardViewSet, PeriodViewSet, SyncViewSet
 )
 
 router = DefaultRouter()
@@ -15,6 +16,12 @@ router.register(r'customers', CustomerViewSet)
 router.register(r'sales', SaleViewSet)
 router.register(r'stock-movements', StockMovementViewSet)
 router.register(r'invoices', InvoiceViewSet)
+router.register(r'replenishment', ReplenishmentViewSet)
+router.register(r'exchange-rates', ExchangeRateViewSet)
+router.register(r'jobs', JobViewSet)
+router.register(r'audit', AuditLogViewSet)
+router.register(r'periods', PeriodViewSet)
+router.register(r'sync', SyncViewSet, basename='sync')
 router.register(r'dashboard', DashboardViewSet, basename='dashboard')
 
 urlpatterns = [
@@ -1,39 +1,200 @@
-from rest_framework import viewsets, permissions, status, filters
+from rest_framework import viewsets, permissions, status, filters, exceptions
 from rest_framework.decorators import action
+from rest_framework.pagination import CursorPagination
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncMonth
+from django.core.exceptions import PermissionDenied
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, StreamingHttpResponse
 from django.utils import timezone
 from datetime import timedelta
+from decimal import Decimal
+from functools import partial
 from .models import (
     Supplier, ProductCategory, Product, 
     Purchase, PurchaseItem, PurchasePayment,
     Customer, Sale, SaleItem, SalePayment,
-    StockMovement, Invoice
+    StockMovement, Invoice, Job, AuditLog, SupplierProductScore,
+    ProductForecast, ExchangeRate, AccountingPeriod
 )
 from .serializers import (
-    SupplierSerializer, ProductCategorySerializer,
+    SupplierSerializer, SupplierProductScoreSerializer, ProductCategorySerializer,
     ProductSerializer, ProductDetailSerializer, ProductSimpleSerializer,
     PurchaseListSerializer, PurchaseDetailSerializer, PurchaseCreateSerializer,
     PurchaseItemSerializer, PurchasePaymentSerializer,
     CustomerSerializer, SaleListSerializer, SaleDetailSerializer, SaleCreateSerializer,
     SaleItemSerializer, SalePaymentSerializer,
     StockMovementSerializer, InvoiceSerializer,
-    DashboardSupplierPaymentSerializer, DashboardCustomerPaymentSerializer
+    DashboardSupplierPaymentSerializer, DashboardCustomerPaymentSerializer,
+    ProductRepriceSerializer, ProductForecastSerializer, DraftPurchasesSerializer, StatementQuerySerializer, JobSerializer, AuditLogSerializer,
+    ExchangeRateSerializer, AccountingPeriodSerializer, PeriodCloseSerializer, PeriodReportQuerySerializer
 )
-
-
-class SupplierViewSet(viewsets.ModelViewSet):
+from .catalog import fetch_products, bulk_update_products, reprice_products
+from .imports import CatalogImporter, ImportFormatError
+from .currency import ExchangeRateMissing
+from .jobs import enqueue
+from .scorecards import refresh_supplier_scores
+from .replenishment import generate_draft_purchases
+from .idempotency import IdempotencyMixin
+from .statements import Statement, statement_csv, statement_pdf
+from .invoices import with_pdf_relations, get_invoice_pdf, render_invoices, build_invoices_zip, next_invoice_number
+from .tenancy import activate, active_tenant_id, requested_slug, resolve_tenant
+from .periods import PeriodError, close_period, period_bounds, period_report, reopen_period
+from .sync import SyncTokenError, SyncTokenExpired, read_changes
+from .archive import ARCHIVES, WithArchive, include_archived
+from .reservations import reserve_sale, with_reserved
+from finance_app.db_router import enable_replica_reads
+
+
+class TenantScopedMixin:
+    """
+    Limite la vue à la boutique de la requête : en-tête X-Tenant, sinon première
+    boutique de l'utilisateur. La boutique est résolue après l'authentification
+    JWT et vaut jusqu'à la fin de la requête (TenantMiddleware la réinitialise).
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        try:
+            tenant_id = resolve_tenant(request.user, requested_slug(request))
+        except PermissionDenied as error:
+            raise exceptions.PermissionDenied(str(error))
+        request.tenant_id = request._request.tenant_id = tenant_id
+        activate(tenant_id)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        tenant_id = getattr(self.request, 'tenant_id', None)
+        if tenant_id is not None:
+            queryset = queryset.filter(tenant_id=tenant_id)
+        return queryset
+
+
+class ReplicaReadMixin:
+    """Envoie les lectures des actions de rapport ou d'export vers les réplicas"""
+    # None : toutes les actions en lecture seule de la vue
+    replica_actions = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in permissions.SAFE_METHODS and (
+                self.replica_actions is None or self.action in self.replica_actions):
+            enable_replica_reads()
+
+
+class StatementMixin:
+    """Relevé de compte d'un client ou d'un fournisseur (?start=, ?end=, ?output=json|csv|pdf)"""
+
+    @action(detail=True)
+    def statement(self, request, pk=None):
+        query = StatementQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        party = self.get_object()
+        statement = Statement(party, query.validated_data.get('start'), query.validated_data.get('end'))
+        filename = f"releve-{statement.party_type}-{party.pk}"
+        output = query.validated_data['output']
+
+        if output == 'csv':
+            response = StreamingHttpResponse(statement_csv(statement), content_type='text/csv; charset=utf-8')
+            response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+            return response
+        if output == 'pdf':
+            return FileResponse(statement_pdf(statement, settings.INVOICE_COMPANY_NAME), as_attachment=True,
+                                filename=f"{filename}.pdf", content_type='application/pdf')
+        # Montants en chaînes, comme les champs décimaux des sérialiseurs
+        entries = [{key: str(value) if isinstance(value, Decimal) else value for key, value in entry.items()}
+                   for entry in statement.entries()]
+        summary = {key: str(value) if isinstance(value, Decimal) else value
+                   for key, value in statement.summary().items()}
+        return Response({**summary, 'entries': entries})
+
+
+class SparseFieldsMixin:
+    """Ne charge que les relations et colonnes nécessaires aux champs demandés (?fields=, ?expand=)"""
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        serializer_class = self.get_serializer_class()
+        if hasattr(serializer_class, 'optimize_queryset'):
+            queryset = serializer_class.optimize_queryset(queryset, self.request)
+        return queryset
+
+
+class ArchiveMixin:
+    """
+    ?include_archived=1 : les lectures (liste, détail et actions en lecture)
+    portent aussi sur la table d'archive du modèle (voir core.archive). Sans ce
+    paramètre, et pour toute écriture, seules les données vivantes sont
+    visibles. Doit précéder directement la classe de vue de DRF : les mixins
+    placés avant lui (boutique, champs demandés) s'appliquent aux deux tables.
+    """
+    _reading_archive = False
+
+    def get_queryset(self):
+        if self._reading_archive:
+            return ARCHIVES[self.queryset.model].objects.all()
+        return super().get_queryset()
+
+    def get_archive_queryset(self):
+        self._reading_archive = True
+        try:
+            return self.get_queryset()
+        finally:
+            self._reading_archive = False
+
+    def get_object(self):
+        try:
+            return super().get_object()
+        except Http404:
+            if not include_archived(self.request):
+                raise
+        self._reading_archive = True
+        try:
+            return super().get_object()
+        finally:
+            self._reading_archive = False
+
+    def list(self, request, *args, **kwargs):
+        if not include_archived(request):
+            return super().list(request, *args, **kwargs)
+        queryset = WithArchive(self.filter_queryset(self.get_queryset()),
+                               self.filter_queryset(self.get_archive_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        return Response(self.get_serializer(queryset, many=True).data)
+
+
+class SupplierViewSet(IdempotencyMixin, TenantScopedMixin, ReplicaReadMixin, StatementMixin, SparseFieldsMixin,
+                      viewsets.ModelViewSet):
     """API endpoint pour gérer les fournisseurs"""
+    replica_actions = ['statement']
     queryset = Supplier.objects.all()
     serializer_class = SupplierSerializer
     permission_classes = [permissions.IsAuthenticated]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['country']
     search_fields = ['name', 'contact_name']
-    ordering_fields = ['name', 'created_at']
+    ordering_fields = ['name', 'created_at', 'score__lead_time_avg', 'score__on_time_rate', 'score__fill_rate']
 
+    @action(detail=True)
+    def scorecard(self, request, pk=None):
+        """Indicateurs de performance du fournisseur, au global et par produit"""
+        supplier = self.get_object()
+        products = SupplierProductScore.objects.filter(supplier=supplier).select_related('product')
+        return Response({
+            'supplier': supplier.id,
+            'score': self.get_serializer(supplier).data['score'],
+            'products': SupplierProductScoreSerializer(products, many=True,
+                                                       context=self.get_serializer_context()).data,
+        })
 
-class ProductCategoryViewSet(viewsets.ModelViewSet):
+
+class ProductCategoryViewSet(IdempotencyMixin, TenantScopedMixin, SparseFieldsMixin, viewsets.ModelViewSet):
     """API endpoint pour gérer les catégories de produits"""
     queryset = ProductCategory.objects.all()
     serializer_class = ProductCategorySerializer
@@ -42,7 +203,7 @@ class ProductCategoryViewSet(viewsets.ModelViewSet):
     search_fields = ['name']
 
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(IdempotencyMixin, TenantScopedMixin, SparseFieldsMixin, viewsets.ModelViewSet):
     """API endpoint pour gérer les produits"""
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
@@ -52,6 +213,14 @@ class ProductViewSet(viewsets.ModelViewSet):
     search_fields = ['name', 'reference']
     ordering_fields = ['name', 'buying_price', 'selling_price', 'stock_quantity']
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if getattr(self, 'swagger_fake_view', False):
+            # Génération du schéma OpenAPI, sans requête
+            return queryset
+        # Quantités réservées en une sous-requête plutôt qu'une requête par produit, réponses d'écriture comprises
+        return with_reserved(queryset)
+
     def get_serializer_class(self):
         if self.action == 'list':
             return ProductSerializer
@@ -62,12 +231,70 @@ class ProductViewSet(viewsets.ModelViewSet):
     @action(detail=False)
     def low_stock(self, request):
         """Récupère les produits dont le stock est bas"""
-        low_stock_products = Product.objects.filter(stock_quantity__lte=models.F('min_stock_level'))
+        low_stock_products = self.get_queryset().filter(stock_quantity__lte=models.F('min_stock_level'))
         serializer = self.get_serializer(low_stock_products, many=True)
         return Response(serializer.data)
 
-
-class PurchaseViewSet(viewsets.ModelViewSet):
+    @action(detail=False)
+    def bulk(self, request):
+        """Récupère plusieurs produits par id (?ids=1,2) ou par référence (?references=A,B)"""
+        try:
+            ids = [int(value) for value in request.query_params.get('ids', '').split(',') if value]
+        except ValueError:
+            return Response({'detail': 'Les ids doivent être des entiers.'}, status=status.HTTP_400_BAD_REQUEST)
+        references = [value for value in request.query_params.get('references', '').split(',') if value]
+        limit = settings.PRODUCT_BULK_LIMIT
+        if len(ids) + len(references) > limit:
+            return Response({'detail': f'Le lot ne peut pas dépasser {limit} produits.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        products, missing = fetch_products(self.get_queryset(), ids, references)
+        serializer = self.get_serializer(products, many=True)
+        return Response({'results': serializer.data, 'missing': missing})
+
+    @bulk.mapping.patch
+    def bulk_update(self, request):
+        """Met à jour les prix et seuils de stock d'un lot de produits, tout ou rien"""
+        rows = request.data
+        limit = settings.PRODUCT_BULK_LIMIT
+        if not isinstance(rows, list) or not rows:
+            return Response({'detail': 'Une liste de produits est attendue.'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(rows) > limit:
+            return Response({'detail': f'Le lot ne peut pas dépasser {limit} produits.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        products, errors = bulk_update_products(rows)
+        if errors:
+            return Response({'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+        # Relus en une requête avec leurs quantités réservées, dans l'ordre du lot
+        order = {product.pk: index for index, product in enumerate(products)}
+        products = sorted(self.get_queryset().filter(pk__in=order), key=lambda product: order[product.pk])
+        serializer = self.get_serializer(products, many=True)
+        return Response({'updated': len(products), 'results': serializer.data})
+
+    @action(detail=False, methods=['post'])
+    def reprice(self, request):
+        """Révise en pourcentage les prix d'une catégorie et/ou d'un fournisseur"""
+        serializer = ProductRepriceSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        updated = reprice_products(**serializer.validated_data)
+        return Response({'updated': updated})
+
+    @action(detail=False, methods=['post'], url_path='import')
+    def import_catalog(self, request):
+        """Importe un catalogue CSV ou XLSX (champ « file », « dry_run » pour simuler)"""
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'detail': 'Aucun fichier fourni.'}, status=status.HTTP_400_BAD_REQUEST)
+        dry_run = str(request.data.get('dry_run', '')).lower() in ('1', 'true', 'yes', 'on')
+        try:
+            report = CatalogImporter(dry_run=dry_run).run(upload.file, upload.name)
+        except ImportFormatError as error:
+            return Response({'detail': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(report)
+
+
+class PurchaseViewSet(IdempotencyMixin, TenantScopedMixin, SparseFieldsMixin, ArchiveMixin, viewsets.ModelViewSet):
     """API endpoint pour gérer les achats"""
     queryset = Purchase.objects.all()
     permission_classes = [permissions.IsAuthenticated]
@@ -92,7 +319,10 @@ class PurchaseViewSet(viewsets.ModelViewSet):
         serializer = PurchasePaymentSerializer(data=request.data)
         
         if serializer.is_valid():
-            serializer.save(purchase=purchase)
+            try:
+                serializer.save(purchase=purchase)
+            except ExchangeRateMissing as error:
+                return Response({'detail': str(error)}, status=status.HTTP_400_BAD_REQUEST)
             # La mise à jour du statut de paiement est gérée dans la méthode save() du modèle
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -128,12 +358,16 @@ class PurchaseViewSet(viewsets.ModelViewSet):
                     item.received_quantity = received_qty
                     item.save()
         
-        serializer = PurchaseDetailSerializer(purchase)
+        # Indicateurs du fournisseur mis à jour une fois la réception enregistrée
+        transaction.on_commit(partial(refresh_supplier_scores, [purchase.supplier_id]))
+        serializer = self.get_serializer(purchase)
         return Response(serializer.data)
 
 
-class CustomerViewSet(viewsets.ModelViewSet):
+class CustomerViewSet(IdempotencyMixin, TenantScopedMixin, ReplicaReadMixin, StatementMixin, SparseFieldsMixin,
+                      viewsets.ModelViewSet):
     """API endpoint pour gérer les clients"""
+    replica_actions = ['statement']
     queryset = Customer.objects.all()
     serializer_class = CustomerSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -141,7 +375,7 @@ class CustomerViewSet(viewsets.ModelViewSet):
     search_fields = ['name', 'phone', 'email']
 
 
-class SaleViewSet(viewsets.ModelViewSet):
+class SaleViewSet(IdempotencyMixin, TenantScopedMixin, SparseFieldsMixin, ArchiveMixin, viewsets.ModelViewSet):
     """API endpoint pour gérer les ventes"""
     queryset = Sale.objects.all()
     permission_classes = [permissions.IsAuthenticated]
@@ -159,6 +393,24 @@ class SaleViewSet(viewsets.ModelViewSet):
             return SaleCreateSerializer
         return SaleDetailSerializer
 
+    def perform_update(self, serializer):
+        # Le changement de statut consomme ou libère les réservations de stock dans la même transaction
+        with transaction.atomic():
+            serializer.save()
+
+    @action(detail=True, methods=['post'])
+    def reserve(self, request, pk=None):
+        """Réserver, ou prolonger la réservation, du stock d'une vente en attente"""
+        sale = self.get_object()
+
+        if sale.status != 'pending':
+            return Response({'detail': 'Seule une vente en attente peut réserver du stock.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        # Stock insuffisant : StockUnavailable, erreur 400 (voir core.reservations.exception_handler)
+        expires_at = reserve_sale(sale)
+        return Response({'expires_at': expires_at})
+
     @action(detail=True, methods=['post'])
     def add_payment(self, request, pk=None):
         """Ajouter un paiement à une vente"""
@@ -166,7 +418,10 @@ class SaleViewSet(viewsets.ModelViewSet):
         serializer = SalePaymentSerializer(data=request.data)
         
         if serializer.is_valid():
-            serializer.save(sale=sale)
+            try:
+                serializer.save(sale=sale)
+            except ExchangeRateMissing as error:
+                return Response({'detail': str(error)}, status=status.HTTP_400_BAD_REQUEST)
             # La mise à jour du statut de paiement est gérée dans la méthode save() du modèle
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -181,22 +436,21 @@ class SaleViewSet(viewsets.ModelViewSet):
         
         sale.status = 'delivered'
         sale.actual_delivery_date = timezone.now().date()
-        sale.save()
+        with transaction.atomic():
+            sale.save()
         
         # Générer une facture si elle n'existe pas déjà
         if not hasattr(sale, 'invoice'):
-            last_invoice = Invoice.objects.order_by('-id').first()
-            invoice_number = f"INV-{(last_invoice.id + 1 if last_invoice else 1):05d}"
-            
-            Invoice.objects.create(
-                sale=sale,
-                invoice_number=invoice_number,
-                issue_date=timezone.now().date(),
-                due_date=timezone.now().date() + timedelta(days=30),
-                status='sent'
-            )
+            with transaction.atomic():
+                Invoice.objects.create(
+                    sale=sale,
+                    invoice_number=next_invoice_number(sale.tenant_id),
+                    issue_date=timezone.now().date(),
+                    due_date=timezone.now().date() + timedelta(days=30),
+                    status='sent'
+                )
         
-        serializer = SaleDetailSerializer(sale)
+        serializer = self.get_serializer(sale)
         return Response(serializer.data)
 
     @action(detail=True, methods=['post'])
@@ -207,22 +461,21 @@ class SaleViewSet(viewsets.ModelViewSet):
         if hasattr(sale, 'invoice'):
             return Response({'detail': 'Une facture existe déjà pour cette vente.'}, status=status.HTTP_400_BAD_REQUEST)
         
-        last_invoice = Invoice.objects.order_by('-id').first()
-        invoice_number = f"INV-{(last_invoice.id + 1 if last_invoice else 1):05d}"
-        
-        invoice = Invoice.objects.create(
-            sale=sale,
-            invoice_number=invoice_number,
-            issue_date=timezone.now().date(),
-            due_date=timezone.now().date() + timedelta(days=30),
-            status='draft'
-        )
+        with transaction.atomic():
+            invoice = Invoice.objects.create(
+                sale=sale,
+                invoice_number=next_invoice_number(sale.tenant_id),
+                issue_date=timezone.now().date(),
+                due_date=timezone.now().date() + timedelta(days=30),
+                status='draft'
+            )
         
-        serializer = InvoiceSerializer(invoice)
+        serializer = InvoiceSerializer(invoice, context=self.get_serializer_context())
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
-class StockMovementViewSet(viewsets.ModelViewSet):
+class StockMovementViewSet(IdempotencyMixin, TenantScopedMixin, SparseFieldsMixin, ArchiveMixin,
+                           viewsets.ModelViewSet):
     """API endpoint pour gérer les mouvements de stock"""
     queryset = StockMovement.objects.all()
     serializer_class = StockMovementSerializer
@@ -232,7 +485,8 @@ class StockMovementViewSet(viewsets.ModelViewSet):
     ordering_fields = ['date']
 
 
-class InvoiceViewSet(viewsets.ModelViewSet):
+class InvoiceViewSet(IdempotencyMixin, TenantScopedMixin, ReplicaReadMixin, SparseFieldsMixin, ArchiveMixin,
+                     viewsets.ModelViewSet):
     """API endpoint pour gérer les factures"""
     queryset = Invoice.objects.all()
     serializer_class = InvoiceSerializer
@@ -241,6 +495,13 @@ class InvoiceViewSet(viewsets.ModelViewSet):
     filterset_fields = ['status']
     search_fields = ['invoice_number', 'sale__customer__name']
     ordering_fields = ['issue_date', 'due_date']
+    replica_actions = ['download']
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('pdf', 'download'):
+            return with_pdf_relations(queryset)
+        return queryset
 
     @action(detail=True, methods=['post'])
     def mark_sent(self, request, pk=None):
@@ -260,8 +521,215 @@ class InvoiceViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(invoice)
         return Response(serializer.data)
 
+    @action(detail=True)
+    def pdf(self, request, pk=None):
+        """Télécharger la facture au format PDF"""
+        invoice = self.get_object()
+        path = get_invoice_pdf(invoice)
+        return FileResponse(default_storage.open(path, 'rb'), as_attachment=True,
+                            filename=f"{invoice.invoice_number}.pdf", content_type='application/pdf')
+
+    @action(detail=False)
+    def download(self, request):
+        """Télécharger une archive zip des factures filtrées"""
+        invoices = self.filter_queryset(self.get_queryset())
+        limit = settings.INVOICE_PDF_BATCH_LIMIT
+        invoices = list(invoices[:limit + 1])
+        if not invoices:
+            return Response({'detail': 'Aucune facture ne correspond aux filtres.'}, status=status.HTTP_404_NOT_FOUND)
+        if len(invoices) > limit:
+            return Response({'detail': f'Le lot ne peut pas dépasser {limit} factures.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        # Rendu dans le processus de la requête : les gros lots passent par export (pool de processus)
+        archive = build_invoices_zip(render_invoices(invoices, workers=1))
+        return FileResponse(archive, as_attachment=True, filename='factures.zip', content_type='application/zip')
+
+    @action(detail=False, methods=['post'])
+    def export(self, request):
+        """Prépare en arrière-plan l'archive zip des factures filtrées (suivi via /api/jobs/)"""
+        invoice_ids = list(self.filter_queryset(self.get_queryset()).values_list('id', flat=True)
+                           [:settings.INVOICE_EXPORT_LIMIT + 1])
+        if not invoice_ids:
+            return Response({'detail': 'Aucune facture ne correspond aux filtres.'}, status=status.HTTP_404_NOT_FOUND)
+        if len(invoice_ids) > settings.INVOICE_EXPORT_LIMIT:
+            return Response({'detail': f'Le lot ne peut pas dépasser {settings.INVOICE_EXPORT_LIMIT} factures.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        job = enqueue('invoices.export', {'invoice_ids': invoice_ids}, user=request.user)
+        return Response(JobSerializer(job, context=self.get_serializer_context()).data,
+                        status=status.HTTP_202_ACCEPTED)
+
+
+class JobViewSet(IdempotencyMixin, TenantScopedMixin, SparseFieldsMixin, viewsets.ReadOnlyModelViewSet):
+    """API endpoint pour suivre les tâches en arrière-plan"""
+    queryset = Job.objects.all()
+    serializer_class = JobSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    filterset_fields = ['name', 'status']
+    ordering_fields = ['created_at', 'run_at']
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if getattr(self, 'swagger_fake_view', False):
+            # Génération du schéma OpenAPI, sans requête ni utilisateur
+            return queryset.none()
+        # Chacun ne voit que ses tâches ; le personnel les voit toutes
+        if not self.request.user.is_staff:
+            queryset = queryset.filter(created_by=self.request.user)
+        return queryset
+
+    @action(detail=True, methods=['post'])
+    def cancel(self, request, pk=None):
+        """Annuler une tâche qui n'a pas encore démarré"""
+        job = self.get_object()
+        if not Job.objects.filter(pk=job.pk, status='pending').update(status='cancelled', finished_at=timezone.now()):
+            return Response({'detail': 'Seule une tâche en attente peut être annulée.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        job.refresh_from_db()
+        return Response(self.get_serializer(job).data)
+
+    @action(detail=True)
+    def download(self, request, pk=None):
+        """Télécharger le fichier produit par une tâche terminée"""
+        job = self.get_object()
+        path = (job.result or {}).get('file') if job.status == 'succeeded' else None
+        if not path or not default_storage.exists(path):
+            return Response({'detail': 'Aucun fichier disponible pour cette tâche.'}, status=status.HTTP_404_NOT_FOUND)
+        return FileResponse(default_storage.open(path, 'rb'), as_attachment=True, filename=path.rsplit('/', 1)[-1])
+
+
+class ReplenishmentViewSet(IdempotencyMixin, TenantScopedMixin, SparseFieldsMixin, viewsets.ReadOnlyModelViewSet):
+    """API endpoint pour les prévisions de ventes et les suggestions de commande (?reorder_quantity__gt=0)"""
+    queryset = ProductForecast.objects.all()
+    serializer_class = ProductForecastSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    filterset_fields = {'reorder_quantity': ['gt'], 'product__supplier': ['exact'], 'product__category': ['exact']}
+    ordering_fields = ['reorder_quantity', 'daily_forecast', 'lead_time_days']
+    ordering = ['-reorder_quantity']
+
+    @action(detail=False, methods=['post'])
+    def recompute(self, request):
+        """Recalcule les prévisions de tout le catalogue en arrière-plan"""
+        job = enqueue('replenishment.full', user=request.user, priority=1)
+        return Response(JobSerializer(job, context=self.get_serializer_context()).data,
+                        status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=False, methods=['post'])
+    def generate_orders(self, request):
+        """Crée une commande en attente par fournisseur avec les quantités suggérées"""
+        serializer = DraftPurchasesSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        suppliers = [supplier.id for supplier in serializer.validated_data.get('suppliers', [])]
+        purchases = generate_draft_purchases(suppliers or None)
+        queryset = PurchaseListSerializer.optimize_queryset(
+            Purchase.objects.filter(id__in=[purchase.id for purchase in purchases]), request)
+        return Response(PurchaseListSerializer(queryset, many=True, context=self.get_serializer_context()).data,
+                        status=status.HTTP_201_CREATED)
+
+
+class AuditLogPagination(CursorPagination):
+    """Pagination par curseur : pas de COUNT(*) ni d'OFFSET sur un journal qui ne fait que grossir"""
+    ordering = '-id'
+    page_size = 50
+
+
+class ExchangeRateViewSet(IdempotencyMixin, TenantScopedMixin, SparseFieldsMixin, viewsets.ModelViewSet):
+    """API endpoint pour les taux de change (import en masse : commande import_rates)"""
+    queryset = ExchangeRate.objects.all()
+    serializer_class = ExchangeRateSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    filterset_fields = {
+        'currency': ['exact'],
+        'date': ['exact', 'gte', 'lte'],
+    }
+    ordering_fields = ['date']
+
+
+class PeriodViewSet(IdempotencyMixin, TenantScopedMixin, SparseFieldsMixin, viewsets.ReadOnlyModelViewSet):
+    """API endpoint pour les périodes clôturées, leur clôture et les rapports de période (voir core.periods)"""
+    queryset = AccountingPeriod.objects.all()
+    serializer_class = AccountingPeriodSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    @action(detail=False, methods=['post'], permission_classes=[permissions.IsAdminUser])
+    def close(self, request):
+        """Clôturer un mois ({"month": "2024-03"}) ou une année ({"year": 2024}) et figer ses soldes"""
+        query = PeriodCloseSerializer(data=request.data)
+        query.is_valid(raise_exception=True)
+        kind, year, month = (query.validated_data.get(key) for key in ('kind', 'year', 'month'))
+        start, end = period_bounds(kind, year, month)
+        try:
+            period = close_period(active_tenant_id(), kind, start, end, request.user)
+        except PeriodError as error:
+            return Response({'detail': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(self.get_serializer(period).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['post'], permission_classes=[permissions.IsAdminUser])
+    def reopen(self, request):
+        """Rouvrir la dernière période clôturée"""
+        try:
+            period = reopen_period(active_tenant_id())
+        except PeriodError as error:
+            return Response({'detail': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'detail': f"Période {period} rouverte."})
+
+    @action(detail=False)
+    def report(self, request):
+        """Ventes, coût des ventes, achats, créances, dettes et stock d'une période (?start=&end=&by=product)"""
+        query = PeriodReportQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        report = period_report(active_tenant_id(), query.validated_data['start'], query.validated_data['end'],
+                               query.validated_data.get('by'))
+
+        # Montants en chaînes, comme les champs décimaux des sérialiseurs
+        def amounts(values):
+            return {key: str(value) if isinstance(value, Decimal) else value for key, value in values.items()}
+
+        report['totals'] = amounts(report['totals'])
+        if 'rows' in report:
+            report['rows'] = [amounts(row) for row in report['rows']]
+        return Response(report)
 
-class DashboardViewSet(viewsets.ViewSet):
+
+class SyncViewSet(TenantScopedMixin, viewsets.ViewSet):
+    """API endpoint pour le flux de synchronisation des copies locales (?token=, ?limit=, voir core.sync)"""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def list(self, request):
+        """Lignes créées, modifiées ou supprimées depuis le jeton (toutes sans jeton)"""
+        try:
+            limit = int(request.query_params.get('limit') or 0)
+        except ValueError:
+            return Response({'detail': 'Le paramètre limit doit être un entier.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            return Response(read_changes(active_tenant_id(), request.query_params.get('token'), limit))
+        except SyncTokenExpired as error:
+            return Response({'detail': str(error)}, status=status.HTTP_410_GONE)
+        except SyncTokenError as error:
+            return Response({'detail': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class AuditLogViewSet(TenantScopedMixin, SparseFieldsMixin, viewsets.ReadOnlyModelViewSet):
+    """API endpoint pour consulter le journal d'audit (?model=product&object_id=12, ?user=3)"""
+    queryset = AuditLog.objects.all()
+    serializer_class = AuditLogSerializer
+    permission_classes = [permissions.IsAdminUser]
+    pagination_class = AuditLogPagination
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = {
+        'model': ['exact'],
+        'object_id': ['exact'],
+        'user': ['exact'],
+        'action': ['exact'],
+        'timestamp': ['gte', 'lte'],
+    }
+
+
+class DashboardViewSet(TenantScopedMixin, ReplicaReadMixin, viewsets.ViewSet):
     """API endpoint pour les tableaux de bord"""
     permission_classes = [permissions.IsAuthenticated]
 
@@ -269,76 +737,73 @@ class DashboardViewSet(viewsets.ViewSet):
     def supplier_payments(self, request):
         """Récupère les paiements aux fournisseurs à effectuer"""
         # Achats non payés et partiellement payés
-        unpaid_purchases = Purchase.objects.filter(payment_status__in=['unpaid', 'partial'])
-        serializer = DashboardSupplierPaymentSerializer(unpaid_purchases, many=True)
+        unpaid_purchases = DashboardSupplierPaymentSerializer.optimize_queryset(
+            Purchase.objects.filter(payment_status__in=['unpaid', 'partial']), request)
+        serializer = DashboardSupplierPaymentSerializer(unpaid_purchases, many=True, context={'request': request})
         return Response(serializer.data)
 
     @action(detail=False)
     def customer_payments(self, request):
         """Récupère les paiements des clients à recevoir"""
         # Ventes non payées et partiellement payées
-        unpaid_sales = Sale.objects.filter(payment_status__in=['unpaid', 'partial'])
-        serializer = DashboardCustomerPaymentSerializer(unpaid_sales, many=True)
+        unpaid_sales = DashboardCustomerPaymentSerializer.optimize_queryset(
+            Sale.objects.filter(payment_status__in=['unpaid', 'partial']), request)
+        serializer = DashboardCustomerPaymentSerializer(unpaid_sales, many=True, context={'request': request})
         return Response(serializer.data)
 
     @action(detail=False)
     def low_stock_products(self, request):
         """Récupère les produits dont le stock est bas"""
-        from django.db.models import F
-        low_stock_products = Product.objects.filter(stock_quantity__lte=F('min_stock_level'))
-        serializer = ProductSimpleSerializer(low_stock_products, many=True)
+        low_stock_products = ProductSimpleSerializer.optimize_queryset(
+            Product.objects.filter(stock_quantity__lte=F('min_stock_level')), request)
+        serializer = ProductSimpleSerializer(low_stock_products, many=True, context={'request': request})
         return Response(serializer.data)
 
     @action(detail=False)
     def sales_summary(self, request):
-        """Résumé des ventes pour le tableau de bord"""
-        from django.db.models import Sum, Count
-        from django.db.models.functions import TruncMonth
-        
-        # Ventes par mois (dernier semestre)
+        """Résumé des ventes pour le tableau de bord (?include_archived=1 : archives comprises)"""
         six_months_ago = timezone.now().date() - timedelta(days=180)
-        sales_by_month = Sale.objects.filter(sale_date__gte=six_months_ago)\
-            .annotate(month=TruncMonth('sale_date'))\
-            .values('month')\
-            .annotate(
-                total=Sum(models.F('items__quantity') * models.F('items__unit_price')),
-                count=Count('id')
-            )\
-            .order_by('month')
-        
-        # Ventes par statut de paiement
-        sales_by_payment_status = Sale.objects.values('payment_status')\
-            .annotate(count=Count('id'))\
-            .order_by('payment_status')
-        
-        return Response({
-            'sales_by_month': sales_by_month,
-            'sales_by_payment_status': sales_by_payment_status,
-        })
+        return Response(document_summary(request, Sale, 'sale_date', six_months_ago, 'sales'))
 
     @action(detail=False)
     def purchases_summary(self, request):
-        """Résumé des achats pour le tableau de bord"""
-        from django.db.models import Sum, Count
-        from django.db.models.functions import TruncMonth
-        
-        # Achats par mois (dernier semestre)
+        """Résumé des achats pour le tableau de bord (?include_archived=1 : archives comprises)"""
         six_months_ago = timezone.now().date() - timedelta(days=180)
-        purchases_by_month = Purchase.objects.filter(order_date__gte=six_months_ago)\
-            .annotate(month=TruncMonth('order_date'))\
-            .values('month')\
-            .annotate(
-                total=Sum(models.F('items__quantity') * models.F('items__unit_price')),
-                count=Count('id')
-            )\
-            .order_by('month')
-        
-        # Achats par statut de paiement
-        purchases_by_payment_status = Purchase.objects.values('payment_status')\
-            .annotate(count=Count('id'))\
-            .order_by('payment_status')
-        
-        return Response({
-            'purchases_by_month': purchases_by_month,
-            'purchases_by_payment_status': purchases_by_payment_status,
-        })
\ No newline at end of file
+        return Response(document_summary(request, Purchase, 'order_date', six_months_ago, 'purchases'))
+
+
+def merge_grouped(querysets, key):
+    """Réunit les agrégats groupés de plusieurs tables : comptes et sommes additionnés par valeur de key"""
+    merged = {}
+    for queryset in querysets:
+        for row in queryset:
+            current = merged.setdefault(row[key], {key: row[key]})
+            for name, value in row.items():
+                if name != key:
+                    current[name] = (current.get(name) or 0) + (value or 0)
+    return [merged[value] for value in sorted(merged)]
+
+
+def document_summary(request, model, date_field, since, prefix):
+    """Ventes ou achats par mois depuis since (en devise de base) et par statut de paiement"""
+    tables = [model, ARCHIVES[model]] if include_archived(request) else [model]
+    # Par mois depuis since, en devise de base
+    by_month = [
+        candidate.objects.filter(**{f'{date_field}__gte': since})
+        .annotate(month=TruncMonth(date_field))
+        .values('month')
+        .annotate(total=Sum('total_amount_base'), count=Count('id'))
+        .order_by('month')
+        for candidate in tables
+    ]
+    # Par statut de paiement
+    by_payment_status = [
+        candidate.objects.values('payment_status').annotate(count=Count('id')).order_by('payment_status')
+        for candidate in tables
+    ]
+    if len(tables) == 1:
+        by_month, by_payment_status = by_month[0], by_payment_status[0]
+    else:
+        by_month = merge_grouped(by_month, 'month')
+        by_payment_status = merge_grouped(by_payment_status, 'payment_status')
+    return {f'{prefix}_by_month': by_month, f'{prefix}_by_payment_status': by_payment_status}
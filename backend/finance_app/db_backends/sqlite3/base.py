@@ -0,0 +1,17 @@
+"""
+SQLite dont les transactions prennent le verrou d'écriture dès leur début
+(BEGIN IMMEDIATE, option transaction_mode de Django 5.1).
+
+SQLite ignore SELECT ... FOR UPDATE : deux transactions qui lisent puis
+écrivent s'interbloquent et l'une échoue aussitôt (database is locked). Ici
+la seconde attend la première pendant le timeout de la connexion, comme une
+transaction PostgreSQL attend le verrou de ligne. Utilisé par les tests
+(finance_app.test_settings) pour les écritures concurrentes.
+"""
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE')
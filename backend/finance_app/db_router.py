@@ -0,0 +1,96 @@
+"""
+Routage des lectures lourdes (tableaux de bord, rapports, exports) vers les réplicas.
+
+Les écritures vont toujours sur la base principale. Dès qu'une requête écrit,
+elle reste sur la base principale jusqu'à sa fin, et un cookie maintient le
+client sur la base principale pendant REPLICA_PIN_SECONDS pour qu'il relise
+ses propres écritures malgré le retard de réplication.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+PIN_COOKIE = 'db_pin_primary'
+
+_routing = ContextVar('db_routing', default=None)
+
+
+class RoutingState:
+    """État de routage propre à une requête (ou à un bloc de code)"""
+
+    def __init__(self, pinned=False):
+        self.use_replica = False
+        self.pinned = pinned
+        self.wrote = False
+        self.alias = None
+
+    def replica_alias(self):
+        # Un même réplica pour toute la requête, pour des lectures cohérentes entre elles
+        if self.alias is None:
+            self.alias = random.choice(settings.REPLICA_DATABASES)
+        return self.alias
+
+
+def enable_replica_reads():
+    """Autorise les lectures sur réplica pour la requête en cours"""
+    state = _routing.get()
+    if state is not None:
+        state.use_replica = True
+
+
+@contextmanager
+def read_from_replica():
+    """Exécute un bloc de lectures sur un réplica, hors requête HTTP (commandes, tâches)"""
+    state = RoutingState()
+    state.use_replica = True
+    token = _routing.set(state)
+    try:
+        yield state
+    finally:
+        _routing.reset(token)
+
+
+class ReplicaRouter:
+    """Routeur : lectures autorisées sur réplica, écritures et migrations sur la base principale"""
+
+    def db_for_read(self, model, **hints):
+        state = _routing.get()
+        if state and state.use_replica and not state.pinned and settings.REPLICA_DATABASES:
+            return state.replica_alias()
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        state = _routing.get()
+        if state is not None:
+            state.wrote = True
+            state.pinned = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Les réplicas contiennent les mêmes données que la base principale
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+class ReplicaPinningMiddleware:
+    """Prépare l'état de routage de chaque requête et gère l'épinglage lecture-après-écriture"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = RoutingState(pinned=PIN_COOKIE in request.COOKIES)
+        token = _routing.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _routing.reset(token)
+
+        if state.wrote and settings.REPLICA_DATABASES:
+            response.set_cookie(PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS,
+                                httponly=True, samesite='Lax')
+        return response
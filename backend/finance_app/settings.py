@@ -39,13 +39,18 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.metrics.PerformanceMiddleware',
+    'core.query_inspector.QueryInspectorMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'finance_app.db_router.ReplicaPinningMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.audit.AuditMiddleware',
+    'core.tenancy.TenantMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -84,6 +89,22 @@ DATABASES = {
     }
 }
 
+# Réplicas en lecture pour les tableaux de bord, rapports et exports.
+# DB_REPLICA_HOSTS=hote1,hote2:5433 (mêmes identifiants que la base principale)
+for index, replica in enumerate(filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(',')), start=1):
+    replica_host, _, replica_port = replica.strip().partition(':')
+    DATABASES[f'replica_{index}'] = {
+        **DATABASES['default'],
+        'HOST': replica_host,
+        'PORT': replica_port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+
+REPLICA_DATABASES = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['finance_app.db_router.ReplicaRouter']
+# Durée pendant laquelle un client reste sur la base principale après une écriture
+REPLICA_PIN_SECONDS = int(os.environ.get('DB_REPLICA_PIN_SECONDS', '5'))
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -130,13 +151,15 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'core.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 25,
+    # Stock insuffisant (core.reservations), écritures dans une période clôturée (core.periods) : erreur 400
+    'EXCEPTION_HANDLER': 'core.reservations.exception_handler',
 }
 
 # JWT settings
@@ -151,4 +174,111 @@ CORS_ALLOWED_ORIGINS = [
     "http://127.0.0.1:3000",
 ]
 
-CORS_ALLOW_CREDENTIALS = True
\ No newline at end of file
+CORS_ALLOW_CREDENTIALS = True
+
+# Génération des factures PDF
+INVOICE_COMPANY_NAME = os.environ.get('INVOICE_COMPANY_NAME', 'Finance App')
+# Nombre de processus de rendu (0 = nombre de processeurs)
+INVOICE_PDF_WORKERS = int(os.environ.get('INVOICE_PDF_WORKERS', '0'))
+INVOICE_PDF_BATCH_LIMIT = int(os.environ.get('INVOICE_PDF_BATCH_LIMIT', '1000'))
+
+# Instrumentation des requêtes (en-têtes Server-Timing et /metrics)
+PERFORMANCE_METRICS_ENABLED = os.environ.get('PERFORMANCE_METRICS_ENABLED', 'True') == 'True'
+# /metrics exige l'en-tête « Authorization: Bearer <jeton> » ; sans jeton, il renvoie 404
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Détection des requêtes N+1 et journal des requêtes lentes (développement et tests)
+QUERY_INSPECTOR_ENABLED = os.environ.get('QUERY_INSPECTOR_ENABLED', str(DEBUG)) == 'True'
+# En mode strict, une requête N+1 lève une exception (activé automatiquement pendant les tests)
+QUERY_INSPECTOR_STRICT = os.environ.get('QUERY_INSPECTOR_STRICT', 'False') == 'True'
+QUERY_REPEAT_THRESHOLD = int(os.environ.get('QUERY_REPEAT_THRESHOLD', '5'))
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '200'))
+TEST_RUNNER = 'core.test_runner.QueryInspectorTestRunner'
+
+# Nombre maximal de produits par opération groupée
+PRODUCT_BULK_LIMIT = int(os.environ.get('PRODUCT_BULK_LIMIT', '1000'))
+
+# Import de catalogue : lignes écrites par paquet et nombre d'erreurs détaillées dans le rapport
+IMPORT_CHUNK_SIZE = int(os.environ.get('IMPORT_CHUNK_SIZE', '5000'))
+IMPORT_MAX_ERRORS = int(os.environ.get('IMPORT_MAX_ERRORS', '1000'))
+
+# Miniatures des images produits : taille maximale (en pixels) de chaque déclinaison
+THUMBNAIL_SIZES = {'small': 160, 'medium': 480, 'large': 960}
+# Threads de génération par processus (0 = génération immédiate, pendant la requête)
+THUMBNAIL_WORKERS = int(os.environ.get('THUMBNAIL_WORKERS', '2'))
+
+# File de tâches en arrière-plan (python manage.py run_workers)
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '2'))
+JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', '1'))
+JOB_SCHEDULER_INTERVAL = float(os.environ.get('JOB_SCHEDULER_INTERVAL', '10'))
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', '3'))
+# Attente avant une nouvelle tentative : JOB_RETRY_BASE_DELAY x 2^(tentative - 1), plafonnée
+JOB_RETRY_BASE_DELAY = float(os.environ.get('JOB_RETRY_BASE_DELAY', '10'))
+JOB_RETRY_MAX_DELAY = float(os.environ.get('JOB_RETRY_MAX_DELAY', '3600'))
+# Une tâche sans signe de vie depuis ce délai (secondes) est remise en file
+JOB_LOCK_TIMEOUT = int(os.environ.get('JOB_LOCK_TIMEOUT', '900'))
+JOB_RETENTION_DAYS = int(os.environ.get('JOB_RETENTION_DAYS', '30'))
+INVOICE_EXPORT_LIMIT = int(os.environ.get('INVOICE_EXPORT_LIMIT', '20000'))
+
+# Clés d'idempotence (en-tête Idempotency-Key) : durée de conservation des réponses, en secondes
+IDEMPOTENCY_KEY_TTL = int(os.environ.get('IDEMPOTENCY_KEY_TTL', str(24 * 3600)))
+
+# Journal d'audit : écriture par paquets toutes les AUDIT_FLUSH_INTERVAL secondes (0 : immédiate)
+AUDIT_ENABLED = os.environ.get('AUDIT_ENABLED', 'True') == 'True'
+AUDIT_FLUSH_INTERVAL = float(os.environ.get('AUDIT_FLUSH_INTERVAL', '2'))
+AUDIT_BATCH_SIZE = int(os.environ.get('AUDIT_BATCH_SIZE', '500'))
+# Entrées gardées en mémoire au maximum si la base est indisponible
+AUDIT_MAX_BUFFER = int(os.environ.get('AUDIT_MAX_BUFFER', '50000'))
+
+# Indicateurs fournisseurs : période d'analyse des réceptions et fenêtre de comparaison des prix (jours)
+SUPPLIER_SCORE_DAYS = int(os.environ.get('SUPPLIER_SCORE_DAYS', '365'))
+SUPPLIER_PRICE_TREND_DAYS = int(os.environ.get('SUPPLIER_PRICE_TREND_DAYS', '90'))
+
+# Réapprovisionnement : fenêtre de calcul de la vitesse de vente, période couverte par une commande (jours),
+# délai par défaut sans historique et niveau de service du stock de sécurité (1.65 : environ 95 %)
+REPLENISHMENT_VELOCITY_DAYS = int(os.environ.get('REPLENISHMENT_VELOCITY_DAYS', '90'))
+REPLENISHMENT_REVIEW_DAYS = int(os.environ.get('REPLENISHMENT_REVIEW_DAYS', '30'))
+REPLENISHMENT_DEFAULT_LEAD_TIME = int(os.environ.get('REPLENISHMENT_DEFAULT_LEAD_TIME', '14'))
+REPLENISHMENT_SERVICE_LEVEL_Z = float(os.environ.get('REPLENISHMENT_SERVICE_LEVEL_Z', '1.65'))
+
+# Devises : devise de base des montants convertis (tableaux de bord, relevés) et durée de conservation
+# en mémoire des taux de change, en secondes
+BASE_CURRENCY = os.environ.get('BASE_CURRENCY', 'EUR')
+FX_RATE_CACHE_TTL = int(os.environ.get('FX_RATE_CACHE_TTL', '300'))
+
+# Administration : au-delà de ce nombre de lignes (statistiques PostgreSQL), les listes non filtrées
+# affichent un nombre estimé au lieu d'un COUNT(*) complet
+ADMIN_COUNT_ESTIMATE_THRESHOLD = int(os.environ.get('ADMIN_COUNT_ESTIMATE_THRESHOLD', '100000'))
+
+# Authentification JWT : durée de conservation de l'utilisateur résolu (secondes, 0 : lecture en base à chaque
+# requête) et cache utilisé, à partager entre serveurs (Redis, Memcached) pour une invalidation immédiate partout
+JWT_USER_CACHE_TTL = int(os.environ.get('JWT_USER_CACHE_TTL', '60'))
+JWT_USER_CACHE = os.environ.get('JWT_USER_CACHE', 'default')
+
+# Schéma OpenAPI précalculé par generate_schema, servi sur /swagger.json/ et chargé par Swagger UI et ReDoc
+OPENAPI_SCHEMA_DIR = os.environ.get('OPENAPI_SCHEMA_DIR', os.path.join(BASE_DIR, 'openapi'))
+SWAGGER_SETTINGS = {'SPEC_URL': ('schema-json', {'format': '.json'})}
+REDOC_SETTINGS = {'SPEC_URL': ('schema-json', {'format': '.json'})}
+
+# Boutiques : en-tête qui désigne la boutique d'une requête (identifiant), boutique des données écrites hors
+# boutique (commandes sans --tenant, superutilisateurs sans boutique) et durée de conservation en cache des
+# boutiques de chaque utilisateur (secondes, 0 : lecture en base à chaque requête), dans le cache JWT_USER_CACHE
+TENANT_HEADER = os.environ.get('TENANT_HEADER', 'X-Tenant')
+DEFAULT_TENANT = os.environ.get('DEFAULT_TENANT', 'default')
+TENANT_CACHE_TTL = int(os.environ.get('TENANT_CACHE_TTL', '60'))
+
+# Archivage : ancienneté en jours au-delà de laquelle documents clos et mouvements de stock quittent les tables
+# vivantes (à garder supérieure à SUPPLIER_SCORE_DAYS et aux treize mois de saisonnalité des prévisions) et nombre
+# de documents déplacés par transaction
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', '730'))
+ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', '500'))
+
+# Synchronisation des copies locales : lignes par page du flux, délai laissé aux transactions en cours avant
+# qu'une modification soit lue (secondes) et durée de conservation des suppressions (jours, au-delà : copie complète)
+SYNC_PAGE_SIZE = int(os.environ.get('SYNC_PAGE_SIZE', '1000'))
+SYNC_MARGIN = int(os.environ.get('SYNC_MARGIN', '30'))
+SYNC_TOMBSTONE_DAYS = int(os.environ.get('SYNC_TOMBSTONE_DAYS', '90'))
+
+# Réservations de stock des ventes en attente : durée de validité en minutes, au-delà de laquelle les quantités
+# réservées redeviennent disponibles
+STOCK_RESERVATION_MINUTES = int(os.environ.get('STOCK_RESERVATION_MINUTES', '30'))
@@ -0,0 +1,29 @@
+"""
+Réglages des tests : python manage.py test --settings=finance_app.test_settings
+
+Deux bases SQLite locales : la base principale et un réplica en lecture,
+qui reflète la base de test principale (TEST MIRROR) comme les réplicas
+PostgreSQL de settings.py. La base de test est un fichier pour que le
+réplica, connexion distincte, lise les données validées ; ses transactions
+s'attendent au lieu d'échouer (voir finance_app.db_backends.sqlite3).
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, os
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'finance_app.db_backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'OPTIONS': {'timeout': 30},
+        'TEST': {'NAME': os.path.join(BASE_DIR, 'test_db.sqlite3')},
+    },
+    'replica': {
+        'ENGINE': 'finance_app.db_backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+REPLICA_DATABASES = ['replica']
+
+# Journal d'audit écrit par un thread après validation : hors du périmètre des tests, qui nettoient la base
+AUDIT_ENABLED = False
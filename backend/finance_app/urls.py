@@ -2,25 +2,21 @@
 URL configuration for finance_app project.
 """
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from rest_framework import permissions
 from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
     TokenRefreshView,
 )
+from core.metrics import metrics_view
+from core.openapi import API_INFO, schema_file_view
+from core.thumbnails import THUMBNAIL_DIRECTORY, thumbnail_view
 
 schema_view = get_schema_view(
-   openapi.Info(
-      title="Finance App API",
-      default_version='v1',
-      description="API pour l'application de gestion des finances d'entreprise",
-      contact=openapi.Contact(email="contact@example.com"),
-      license=openapi.License(name="BSD License"),
-   ),
+   API_INFO,
    public=True,
    permission_classes=(permissions.AllowAny,),
 )
@@ -30,9 +26,13 @@ urlpatterns = [
     path('api/', include('core.urls')),
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
-    path('swagger<format>/', schema_view.without_ui(cache_timeout=0), name='schema-json'),
+    # Schéma précalculé (generate_schema) ; les interfaces Swagger et ReDoc le chargent via SPEC_URL
+    path('swagger<format>/', schema_file_view, name='schema-json'),
     path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
     path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
+    path('metrics', metrics_view, name='metrics'),
+    re_path(rf'^{settings.MEDIA_URL.lstrip("/")}{THUMBNAIL_DIRECTORY}/(?P<path>.+)$', thumbnail_view,
+            name='product-thumbnail'),
 ]
 
 if settings.DEBUG:
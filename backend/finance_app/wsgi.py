@@ -8,9 +8,16 @@ https://docs.djangoproject.com/en/4.2/howto/deployment/wsgi/
 """
 
 import os
+from importlib import import_module
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'finance_app.settings')
 
 application = get_wsgi_application()
+
+# Charge URL, vues et sérialiseurs au démarrage plutôt qu'à la première requête. Avec
+# gunicorn --preload, ce travail est fait une seule fois par le processus maître et la
+# mémoire correspondante est partagée par les workers.
+import_module(settings.ROOT_URLCONF)